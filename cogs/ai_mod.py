@@ -4,23 +4,266 @@ from discord.ext import commands
 import asyncio
 import random
 import logging
+import time
 from datetime import datetime, timedelta
-from config import OPENAI_API_KEY, FUNNY_RULES, RULE_TYPES, BOT_MESSAGE_DELETE_DELAY
-from cogs.rules import RuleFactory
+from config import OPENAI_API_KEY, FUNNY_RULES, RULE_TYPES
+from config import (
+    DISPATCH_MAX_CONCURRENCY,
+    DISPATCH_MAX_CHANNEL_DEPTH,
+    DISPATCH_CHANNEL_CONCURRENCY,
+    DISPATCH_OVERFLOW_POLICY,
+    DISPATCH_SAMPLE_RATE,
+    LEADERBOARD_SAVE_INTERVAL,
+    RULE_TEXT_MAX_CHARS,
+    SHUTDOWN_DRAIN_TIMEOUT,
+)
+from cogs.rules import MessageContext, RuleFactory, keyword_check
+from cogs.api_scheduler import get_scheduler
+from cogs.channel_state import all_stats
+from cogs.dispatcher import MessageDispatcher
+from cogs.fair_scheduler import get_fair_scheduler
+from cogs.edit_tracker import EditTracker
+from cogs.event_store import get_event_store
+from cogs.clock import get_clock
+from cogs.leaderboard import Leaderboard
+from cogs.tracing import get_tracer
+from cogs.runtime_config import SETTINGS, get_runtime_config
+from cogs.rule_index import ActiveRule, RuleIndex, SCOPE_CHANNEL, SCOPE_CATEGORY, SCOPE_GUILD
 import openai
 
 # Configure OpenAI
 openai.api_key = OPENAI_API_KEY
 
+# Event store state written on shutdown and picked up on the next start
+ACTIVE_RULES_STATE = "active_rules"
+PENDING_NOTICES_STATE = "pending_notices"
+
+SCOPE_CHOICES = [
+    app_commands.Choice(name="This channel", value=SCOPE_CHANNEL),
+    app_commands.Choice(name="This category", value=SCOPE_CATEGORY),
+    app_commands.Choice(name="Whole server", value=SCOPE_GUILD),
+]
+
 class AIMod(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.active_rules = {}  # {channel_id: rule_instance}
-        self.rule_timers = {}   # {channel_id: asyncio.Task}
+        self.active_rules = RuleIndex()  # Active rules by channel, category and guild
+        self.violation_tasks = set()  # Running handle_rule_violation tasks
+        self.pending_notices = {}  # {deletion task: violation notice} waiting out the delete delay
+        self.draining = False  # Set on shutdown; new messages are ignored from then on
+        self.restore_task = None  # Restores the state saved by the last shutdown
+        self.tracer = get_tracer()
+        self.clock = get_clock()  # Rule timers and notice deletions sleep on it (see cogs/clock.py)
+        self.dispatcher = MessageDispatcher(
+            self.check_and_handle,
+            max_concurrency=DISPATCH_MAX_CONCURRENCY,
+            max_depth=DISPATCH_MAX_CHANNEL_DEPTH,
+            channel_concurrency=DISPATCH_CHANNEL_CONCURRENCY,
+            overflow_policy=DISPATCH_OVERFLOW_POLICY,
+            sample_rate=DISPATCH_SAMPLE_RATE,
+        )
+        self.edits = EditTracker(self.recheck_edit)
+        self.leaderboard = Leaderboard()  # Per-guild violation and compliance counts
+        self.leaderboard_task = None  # Periodically saves the leaderboard
+        self.runtime_config = get_runtime_config()
+        self.runtime_config.subscribe(self.apply_settings)
+
+    def apply_settings(self, settings):
+        """Swap in new tunables from the runtime config (see cogs/runtime_config.py)"""
+        self.message_delete_delay = settings["bot_message_delete_delay"]
+        self.dispatcher.overflow_policy = settings["dispatch_overflow_policy"]
+        self.dispatcher.sample_rate = settings["dispatch_sample_rate"]
+
+    async def cog_load(self):
+        # Pick up edits to the runtime config file without a restart
+        self.runtime_config.start_watching()
+        saved = get_event_store().load_state(Leaderboard.STATE_KEY)
+        if saved:
+            self.leaderboard.load(saved)
+        self.leaderboard_task = asyncio.create_task(self.save_leaderboard_loop())
+        self.restore_task = asyncio.create_task(self.restore_state())
+
+    async def cog_unload(self):
+        if not self.draining:
+            await self.drain(SHUTDOWN_DRAIN_TIMEOUT)
+
+    async def drain(self, timeout):
+        """Finish or save in-flight work before the cog goes away (on shutdown or reload)
+        
+        Stops taking new messages and sends everything buffered or batched.
+        Then waits up to `timeout` seconds in total for queued checks and
+        violation handling, and deletes outstanding notices right away rather
+        than after their delay. Active rules, the leaderboard and notices that
+        couldn't be deleted in time are saved for `restore_state`, along with
+        anything saved earlier that it hasn't restored yet. Finally
+        the handler's connections are closed.
+        
+        Returns:
+            Counts of what was drained and what was abandoned (also logged)
+        """
+        self.draining = True
+        deadline = self.clock.monotonic() + timeout
+        left = lambda: max(0.0, deadline - self.clock.monotonic())
+        report = {}
+        
+        self.runtime_config.stop_watching()
+        for task in (self.leaderboard_task, self.restore_task):
+            if task:
+                task.cancel()
+        self.edits.close()
+        
+        # Checks already queued still run; the handler sends them without waiting for batches to fill
+        handler = None
+        if OPENAI_API_KEY:
+            from cogs.openai_handler import release_handler
+            handler = release_handler(OPENAI_API_KEY)
+            if handler:
+                handler.begin_drain()
+        dispatch = await self.dispatcher.drain(left())
+        report["checks finished"] = dispatch["checked"]
+        report["checks abandoned"] = dispatch["abandoned"]
+        if handler:
+            batched = await handler.drain(left())
+            report["batched messages sent"] = batched["waiting"] - batched["abandoned"]
+            report["batched messages abandoned"] = batched["abandoned"]
+        
+        # Let violations being handled send their notice and delete the message
+        await self.clock.wait(self.violation_tasks, left())
+        report["violations abandoned"] = len(self.violation_tasks)
+        for task in list(self.violation_tasks):
+            task.cancel()
+        
+        # Delete notices now instead of after their delay; save the ones that don't make it
+        for task in list(self.pending_notices):
+            task.cancel()
+        deletions = {asyncio.create_task(self.delete_notice(notice)): notice
+                     for notice in self.pending_notices.values()}
+        self.pending_notices.clear()
+        done, pending = await self.clock.wait(deletions, left())
+        for task in pending:
+            task.cancel()
+        leftover = [notice for task, notice in deletions.items() if task not in done or not task.result()]
+        report["notices deleted"] = len(deletions) - len(leftover)
+        report["notices saved"] = len(leftover)
+        
+        # Keep what the last shutdown saved if restore_state was cancelled before it could pick it up
+        # (once it has run, the saved state is empty); rules active now replace saved ones for the same scope
+        store = get_event_store()
+        notices = store.load_state(PENDING_NOTICES_STATE) or []
+        store.save_state(PENDING_NOTICES_STATE, notices + [[notice.channel.id, notice.id] for notice in leftover])
+        rules = self.snapshot_rules()
+        scopes = {(saved["scope"], saved["scope_id"]) for saved in rules}
+        rules += [saved for saved in store.load_state(ACTIVE_RULES_STATE) or []
+                  if (saved["scope"], saved["scope_id"]) not in scopes]
+        store.save_state(ACTIVE_RULES_STATE, rules)
+        report["rules saved"] = len(rules)
+        for active in self.active_rules:
+            if active.timer and not active.timer.done():
+                active.timer.cancel()
+        self.save_leaderboard()
+        store.flush()
+        
+        logging.info("Drained for shutdown: " + ", ".join(f"{count} {what}" for what, count in report.items()))
+        return report
+
+    def snapshot_rules(self):
+        """Describe the active rules so `restore_state` can recreate them"""
+        return [
+            {
+                "rule_type": active.rule_type,
+                "rule_text": getattr(active.rule, "rule_text", None),
+                "duration": active.rule.duration,
+                "end_time": active.rule.end_time.timestamp(),
+                "scope": active.scope,
+                "scope_id": active.scope_id,
+                "announce_channel_id": active.announce_channel_id,
+                "channel_ids": sorted(active.channel_ids),
+            }
+            for active in self.active_rules if active.rule_type
+        ]
+
+    async def restore_state(self):
+        """Recreate the rules and notice deletions saved by the last shutdown, once the bot is connected"""
+        await self.bot.wait_until_ready()
+        store = get_event_store()
+        restored = 0
+        for saved in store.load_state(ACTIVE_RULES_STATE) or []:
+            if self.active_rules.get(saved["scope"], saved["scope_id"]):
+                continue  # Replaced by a rule activated since the restart
+            channel = discord.Object(id=saved["announce_channel_id"])
+            rule = RuleFactory.create_rule(saved["rule_type"], channel, saved["duration"], saved["rule_text"])
+            rule.end_time = datetime.fromtimestamp(saved["end_time"])
+            active = ActiveRule(rule, saved["scope"], saved["scope_id"], saved["announce_channel_id"],
+                                saved["rule_type"])
+            active.channel_ids.update(saved["channel_ids"])
+            self.active_rules.add(active)
+            # Rules that ran out while the bot was down end (and are announced) right away
+            remaining = (rule.end_time - self.clock.now()).total_seconds()
+            active.timer = asyncio.create_task(self.end_rule_timer(active, max(0.0, remaining) / 60))
+            restored += 1
+        store.save_state(ACTIVE_RULES_STATE, [])
+        
+        notices = store.load_state(PENDING_NOTICES_STATE) or []
+        for channel_id, message_id in notices:
+            channel = self.bot.get_channel(channel_id)
+            if channel is not None:
+                self.delete_later(channel.get_partial_message(message_id), 0)
+        store.save_state(PENDING_NOTICES_STATE, [])
+        if restored or notices:
+            logging.info(f"Restored {restored} rules and {len(notices)} notice deletions from the last shutdown")
+
+    def save_leaderboard(self):
+        """Write the leaderboard to the event store if it changed since the last save"""
+        if self.leaderboard.dirty:
+            get_event_store().save_state(Leaderboard.STATE_KEY, self.leaderboard.to_dict())
+            self.leaderboard.dirty = False
+
+    async def save_leaderboard_loop(self):
+        while True:
+            await self.clock.sleep(LEADERBOARD_SAVE_INTERVAL)
+            self.save_leaderboard()
+
+    def scope_id(self, interaction: discord.Interaction, scope: str):
+        """Return the id of the channel, category or guild a scope refers to, or None"""
+        if scope == SCOPE_GUILD:
+            return interaction.guild_id
+        if scope == SCOPE_CATEGORY:
+            return getattr(interaction.channel, "category_id", None)
+        return interaction.channel_id
+
+    async def activate_rule(self, interaction: discord.Interaction, rule, description, duration, scope, rule_type=None):
+        """Activate one shared rule instance for a whole scope and announce it
+        
+        `rule_type` is the RuleFactory type the rule was made from; only rules
+        with one are saved across restarts.
+        """
+        scope_id = self.scope_id(interaction, scope)
+        if scope_id is None:
+            await interaction.response.send_message(f"This channel isn't in a {scope}", ephemeral=True)
+            return
+        
+        active = ActiveRule(rule, scope, scope_id, interaction.channel_id, rule_type)
+        
+        # Release state held by a rule this one replaces
+        replaced = self.active_rules.add(active)
+        if replaced:
+            self.release_rule(replaced)
+        
+        # One timer ends the rule everywhere it applies
+        active.timer = asyncio.create_task(self.end_rule_timer(active, duration))
+        
+        # Announce the rule
+        where = {SCOPE_CHANNEL: "", SCOPE_CATEGORY: " in every channel of this category",
+                 SCOPE_GUILD: " in every channel of this server"}[scope]
+        await interaction.response.send_message(f"🤖 **AI MOD ANNOUNCEMENT** 🤖\n\n{description}\n\nThis rule will be enforced{where} for the next {duration} minutes!")
 
     @app_commands.command(name="ai_mod", description="Activate the AI Mod for April Fools")
-    @app_commands.describe(duration="Duration in minutes for the rule to be active (1-60)")
-    async def ai_mod(self, interaction: discord.Interaction, duration: int = 15):
+    @app_commands.describe(
+        duration="Duration in minutes for the rule to be active (1-60)",
+        scope="Where the rule applies (default: this channel)"
+    )
+    @app_commands.choices(scope=SCOPE_CHOICES)
+    async def ai_mod(self, interaction: discord.Interaction, duration: int = 15, scope: str = SCOPE_CHANNEL):
         """Enable AI Mod to enforce a funny rule for a specified duration"""
         if not 1 <= duration <= 60:
             await interaction.response.send_message("Duration must be between 1 and 60 minutes", ephemeral=True)
@@ -31,29 +274,18 @@ class AIMod(commands.Cog):
         rule_text = FUNNY_RULES[rule_idx].format(duration=duration)
         rule_type = RULE_TYPES[rule_idx]
         
-        channel_id = interaction.channel_id
-        
         # Create a rule instance using the factory
         rule = RuleFactory.create_rule(rule_type, interaction.channel, duration)
         
-        # Store active rule
-        self.active_rules[channel_id] = rule
-        
-        # Cancel existing timer if there is one
-        if channel_id in self.rule_timers and not self.rule_timers[channel_id].done():
-            self.rule_timers[channel_id].cancel()
-        
-        # Create a new timer
-        self.rule_timers[channel_id] = asyncio.create_task(self.end_rule_timer(channel_id, duration))
-        
-        # Announce the rule
-        await interaction.response.send_message(f"🤖 **AI MOD ANNOUNCEMENT** 🤖\n\n{rule.description}\n\nThis rule will be enforced for the next {duration} minutes!")
+        await self.activate_rule(interaction, rule, rule.description, duration, scope, rule_type)
 
     @app_commands.command(name="trigger_rule", description="Trigger a specific rule by name")
     @app_commands.describe(
         rule_type="The specific rule to enforce",
-        duration="Duration in minutes for the rule to be active (1-60)"
+        duration="Duration in minutes for the rule to be active (1-60)",
+        scope="Where the rule applies (default: this channel)"
     )
+    @app_commands.choices(scope=SCOPE_CHOICES)
     @app_commands.choices(rule_type=[
         app_commands.Choice(name="Emoji Rule", value="emoji"),
         app_commands.Choice(name="Prefix Rule", value="prefix"),
@@ -67,158 +299,356 @@ class AIMod(commands.Cog):
         app_commands.Choice(name="Corporate Jargon Rule", value="corporate_jargon"),
         app_commands.Choice(name="Overly Formal Rule", value="overly_formal")
     ])
-    async def trigger_rule(self, interaction: discord.Interaction, rule_type: str, duration: int = 15):
+    async def trigger_rule(self, interaction: discord.Interaction, rule_type: str, duration: int = 15,
+                           scope: str = SCOPE_CHANNEL):
         """Trigger a specific rule by name"""
         if not 1 <= duration <= 60:
             await interaction.response.send_message("Duration must be between 1 and 60 minutes", ephemeral=True)
             return
         
-        channel_id = interaction.channel_id
-        
         # Create a rule instance using the factory
         rule = RuleFactory.create_rule(rule_type, interaction.channel, duration)
         
-        # Store active rule
-        self.active_rules[channel_id] = rule
-        
-        # Cancel existing timer if there is one
-        if channel_id in self.rule_timers and not self.rule_timers[channel_id].done():
-            self.rule_timers[channel_id].cancel()
-        
-        # Create a new timer
-        self.rule_timers[channel_id] = asyncio.create_task(self.end_rule_timer(channel_id, duration))
-        
-        # Announce the rule
-        await interaction.response.send_message(f"🤖 **AI MOD ANNOUNCEMENT** 🤖\n\n{rule.description}\n\nThis rule will be enforced for the next {duration} minutes!")
+        await self.activate_rule(interaction, rule, rule.description, duration, scope, rule_type)
 
     @app_commands.command(name="custom_rule", description="Create a custom rule enforced by AI")
     @app_commands.describe(
         rule="The rule to enforce",
         duration="Duration in minutes for the rule to be active (1-60)",
-        use_ai="Whether to use AI for checking (more expensive but handles complex rules)"
+        use_ai="Whether to use AI for checking (more expensive but handles complex rules)",
+        scope="Where the rule applies (default: this channel)"
     )
-    async def custom_rule(self, interaction: discord.Interaction, rule: str, duration: int = 15, use_ai: bool = False):
+    @app_commands.choices(scope=SCOPE_CHOICES)
+    async def custom_rule(self, interaction: discord.Interaction, rule: str, duration: int = 15, use_ai: bool = False,
+                          scope: str = SCOPE_CHANNEL):
         """Create a custom rule to be enforced by the bot"""
         if not 1 <= duration <= 60:
             await interaction.response.send_message("Duration must be between 1 and 60 minutes", ephemeral=True)
             return
         
-        channel_id = interaction.channel_id
-        
         # Format the rule
         formatted_rule = f"For the next {duration} minutes, {rule}"
+        if len(formatted_rule) > RULE_TEXT_MAX_CHARS:
+            limit = RULE_TEXT_MAX_CHARS - len(formatted_rule) + len(rule)
+            await interaction.response.send_message(f"Rules can be at most {limit} characters long", ephemeral=True)
+            return
         
         # Create a rule instance using the factory
+        rule_type = "ai" if use_ai else "custom"
         rule_instance = RuleFactory.create_rule(
-            "ai" if use_ai else "custom", 
+            rule_type, 
             interaction.channel, 
             duration, 
             formatted_rule
         )
         
-        # Store active rule
-        self.active_rules[channel_id] = rule_instance
-        
-        # Cancel existing timer if there is one
-        if channel_id in self.rule_timers and not self.rule_timers[channel_id].done():
-            self.rule_timers[channel_id].cancel()
-        
-        # Create a new timer
-        self.rule_timers[channel_id] = asyncio.create_task(self.end_rule_timer(channel_id, duration))
-        
-        # Announce the rule
-        await interaction.response.send_message(f"🤖 **AI MOD ANNOUNCEMENT** 🤖\n\n{formatted_rule}\n\nThis rule will be enforced for the next {duration} minutes!")
+        await self.activate_rule(interaction, rule_instance, formatted_rule, duration, scope, rule_type)
 
     @app_commands.command(name="end_rule", description="End the currently active rule in this channel")
     async def end_rule_command(self, interaction: discord.Interaction):
-        """End the currently active rule in this channel"""
-        channel_id = interaction.channel_id
+        """End the rule that applies in this channel (everywhere it applies)"""
+        active = self.resolve_rule(interaction.channel)
         
-        if channel_id not in self.active_rules:
+        if active is None:
             await interaction.response.send_message("There is no active rule in this channel", ephemeral=True)
             return
         
         # End the rule
-        await self.end_rule(channel_id)
+        await self.end_rule(active)
         await interaction.response.send_message("The active rule has been ended!")
 
-    async def end_rule_timer(self, channel_id, duration):
+    @app_commands.command(name="mod_stats", description="Show AI Mod API budget usage")
+    async def mod_stats(self, interaction: discord.Interaction):
+        """Show current API budget usage"""
+        usage = get_scheduler().usage()
+        dispatch = self.dispatcher.stats()
+        fair = get_fair_scheduler().stats(top=3)
+        shadow = get_event_store().shadow_summary(since=time.time() - 86400)
+        budget = f"${usage['daily_budget']:.2f}" if usage['daily_budget'] else "unlimited"
+        backends = "not configured"
+        if OPENAI_API_KEY:
+            from cogs.openai_handler import get_handler
+            backends = ", ".join(f"{name} {count}" for name, count in get_handler(OPENAI_API_KEY).router.stats().items())
+        
+        await interaction.response.send_message(
+            f"📊 **AI MOD STATS** 📊\n\n"
+            f"**Requests:** {usage['requests_available']:.0f}/{usage['requests_per_minute']:.0f} available this minute\n"
+            f"**Tokens:** {usage['tokens_available']:.0f}/{usage['tokens_per_minute']:.0f} available this minute\n"
+            f"**Queued:** {usage['queued']}\n"
+            f"**Today:** {usage['requests_today']} requests, {usage['tokens_today']} tokens, "
+            f"${usage['spent_today']:.2f} of {budget} ({usage['refused_today']} refused)\n"
+            f"**Active rules:** {len(self.active_rules)}\n"
+            f"**Backends:** {backends}\n"
+            f"**Dispatch:** {dispatch['queued']} queued in {dispatch['channels']} channels, "
+            f"{dispatch['running']}/{dispatch['max_concurrency']} running, {dispatch['processed']} checked, "
+            f"{dispatch['dropped']} dropped, {dispatch['overflow_local']} AI checks done locally "
+            f"({dispatch['overflow_policy']}, max depth {dispatch['max_depth_seen']})\n"
+            f"**Fair share:** {fair['in_flight']}/{fair['max_in_flight']} in flight, {fair['waiting']} waiting, "
+            f"{fair['shed']} shed; busiest: " + (", ".join(
+                f"{guild_id} {guild['share']:.0%} (wait avg {guild['wait_avg_ms']:.0f} ms, max {guild['wait_max_ms']:.0f} ms)"
+                for guild_id, guild in fair['guilds'].items()
+            ) or "none") + "\n"
+            f"**Shadow (24h):** " + (", ".join(
+                f"{pair['candidate']} vs {pair['primary']} {pair['agreement']:.0%} agree over {pair['messages']} "
+                f"({pair['candidate_latency_ms']:.0f} vs {pair['primary_latency_ms']:.0f} ms, "
+                f"${pair['candidate_cost']:.3f} vs ${pair['primary_cost']:.3f})"
+                for pair in shadow
+            ) or "none") + "\n"
+            f"**Edits:** " + ", ".join(f"{key} {count}" for key, count in self.edits.stats().items()) + "\n"
+            f"**State:** " + ", ".join(
+                f"{s['name']} {s['entries']} entries/{s['bytes'] / 1024:.0f} KiB" for s in all_stats()
+            ),
+            ephemeral=True
+        )
+
+    @app_commands.command(name="leaderboard", description="Show who broke the rules most (and least)")
+    async def leaderboard_command(self, interaction: discord.Interaction):
+        """Show the server's top violators, most compliant users and most broken rules"""
+        board = self.leaderboard.board(interaction.guild_id) if interaction.guild_id else None
+        if board is None:
+            await interaction.response.send_message("No messages have been checked in this server yet.", ephemeral=True)
+            return
+        
+        def count(value, error):
+            # Space-Saving counts may be overestimated by up to `error`
+            return f"{value - error}-{value}" if error else str(value)
+        
+        def users(entries):
+            return "\n".join(f"{rank}. <@{user_id}> {count(value, error)}"
+                             for rank, (user_id, value, error) in enumerate(entries, 1)) or "Nobody yet"
+        
+        rules = "\n".join(f"{rank}. {name}: {count(value, error)} violations ({rate:.0%} of checked messages)"
+                          for rank, (name, value, error, rate) in enumerate(board['rules'], 1)) or "None yet"
+        await interaction.response.send_message(
+            f"🏆 **AI MOD LEADERBOARD** 🏆\n\n"
+            f"{board['violations']} violations in {board['checked']} checked messages\n\n"
+            f"**Most violations:**\n{users(board['violators'])}\n\n"
+            f"**Most compliant:**\n{users(board['compliant'])}\n\n"
+            f"**Most broken rules:**\n{rules}",
+            allowed_mentions=discord.AllowedMentions.none()
+        )
+
+    @app_commands.command(name="mod_config", description="View or change AI Mod tuning settings")
+    @app_commands.describe(
+        setting="The setting to view or change (leave empty to list all)",
+        value="New value (leave empty to view)"
+    )
+    @app_commands.choices(setting=[app_commands.Choice(name=name, value=name) for name in SETTINGS])
+    @app_commands.default_permissions(administrator=True)
+    async def mod_config(self, interaction: discord.Interaction, setting: str = None, value: str = None):
+        """View or change runtime settings (applied immediately and saved to the runtime config file)"""
+        if setting is None:
+            lines = [f"`{name}` = {self.runtime_config[name]} ({self.runtime_config.sources[name]})" for name in SETTINGS]
+            await interaction.response.send_message("⚙️ **AI MOD CONFIG** ⚙️\n\n" + "\n".join(lines), ephemeral=True)
+            return
+        
+        if value is None:
+            await interaction.response.send_message(
+                f"`{setting}` = {self.runtime_config[setting]} ({self.runtime_config.sources[setting]})\n"
+                f"{SETTINGS[setting].description}",
+                ephemeral=True
+            )
+            return
+        
+        try:
+            new_value = self.runtime_config.set(setting, value)
+        except (ValueError, OSError) as e:
+            await interaction.response.send_message(f"Could not change `{setting}`: {e}", ephemeral=True)
+            return
+        
+        logging.info(f"{interaction.user} set {setting} to {new_value}")
+        await interaction.response.send_message(f"`{setting}` is now {new_value}", ephemeral=True)
+
+    async def end_rule_timer(self, active, duration):
         """Timer to automatically end a rule after the specified duration"""
         try:
-            await asyncio.sleep(duration * 60)  # Convert minutes to seconds
-            if channel_id in self.active_rules:
-                await self.end_rule(channel_id)
+            await self.clock.sleep(duration * 60)  # Convert minutes to seconds
+            await self.end_rule(active)
         except asyncio.CancelledError:
             pass
         except Exception as e:
             logging.error(f"Error in rule timer: {e}")
 
-    async def end_rule(self, channel_id):
-        """End an active rule in a channel"""
-        if channel_id in self.active_rules:
-            rule = self.active_rules[channel_id]
-            channel = rule.channel
-            
-            # Remove the rule
-            del self.active_rules[channel_id]
-            
-            # Send end message
-            await channel.send(f"🤖 **AI MOD ANNOUNCEMENT** 🤖\n\nThe rule: '{rule.description}' has ended. You are free... for now! 😈")
+    def resolve_rule(self, channel):
+        """Return the activation that applies in a channel, or None"""
+        guild = getattr(channel, "guild", None)
+        return self.active_rules.resolve(channel.id, getattr(channel, "category_id", None),
+                                         guild.id if guild else None)
+
+    def release_rule(self, active):
+        """Stop an activation's timer and release its per-channel state"""
+        active.rule.cleanup(active.channel_ids)
+        
+        # Stop the expiry timer (unless it is the one ending the rule)
+        timer = active.timer
+        if timer and timer is not asyncio.current_task() and not timer.done():
+            timer.cancel()
+
+    async def end_rule(self, active):
+        """End an active rule everywhere it applies"""
+        if not self.active_rules.remove(active):
+            return  # Already ended or replaced
+        self.release_rule(active)
+        
+        # Send end message
+        channel = self.bot.get_channel(active.announce_channel_id)
+        if channel is None:
+            return  # Channel deleted or no longer visible
+        await channel.send(f"🤖 **AI MOD ANNOUNCEMENT** 🤖\n\nThe rule: '{active.rule.description}' has ended. You are free... for now! 😈")
 
     @commands.Cog.listener()
     async def on_message(self, message):
         """Check messages against active rules"""
-        # Ignore bot messages to prevent feedback loops
-        if message.author.bot:
+        # Ignore bot messages to prevent feedback loops, and everything once shutting down
+        if message.author.bot or self.draining:
             return
             
         channel_id = message.channel.id
         
-        # If there's an active rule for this channel
-        if channel_id in self.active_rules:
-            rule = self.active_rules[channel_id]
+        # If there's an active rule for this channel, category or server
+        active = self.resolve_rule(message.channel)
+        if active is not None:
+            rule = active.rule
             
             # Check if the rule is still active
             if rule.is_expired():
-                await self.end_rule(channel_id)
+                await self.end_rule(active)
                 return
+            
+            active.channel_ids.add(channel_id)
                 
-            # Check message against the rule
-            violation = await rule.check_message(message)
+            # Trace a sample of messages from the moment Discord created them
+            trace = self.tracer.start_trace(
+                "message", start_ns=int(message.created_at.timestamp() * 1e9),
+                **{"channel.id": channel_id, "guild.id": message.guild.id if message.guild else 0,
+                   "message.id": message.id, "rule.name": rule.name}
+            )
             
-            # If there's a violation, handle it
-            if violation:
-                await self.handle_rule_violation(message, violation)
+            # Queue the check; the dispatcher keeps per-channel order and sheds load
+            with self.tracer.activate(trace):
+                queued = self.dispatcher.submit(channel_id, MessageContext(message), rule)
+            if trace:
+                trace.set_attribute("dispatch.queued", queued)
+                trace.end()
 
-    async def handle_rule_violation(self, message, violation):
+    @commands.Cog.listener()
+    async def on_message_edit(self, before, after):
+        """Recheck edited messages, skipping edits that can't change the verdict"""
+        if after.author.bot or self.draining:
+            return
+        
+        active = self.resolve_rule(after.channel)
+        if active is None:
+            return
+        rule = active.rule
+        if rule.is_expired():
+            await self.end_rule(active)
+            return
+        
+        # Stateful rules judge a message against the ones before it, which an edit can't be replayed into
+        if getattr(rule, "stateful", False):
+            return
+        
+        self.edits.submit(after, rule)
+
+    def recheck_edit(self, message, rule):
+        """Queue an edited message through the normal check pipeline (called by the edit tracker)"""
+        channel_id = message.channel.id
+        active = self.resolve_rule(message.channel)
+        if active is None or active.rule is not rule:
+            return  # The rule ended or was replaced while the recheck waited
+        active.channel_ids.add(channel_id)
+        
+        trace = self.tracer.start_trace(
+            "message.edit",
+            **{"channel.id": channel_id, "guild.id": message.guild.id if message.guild else 0,
+               "message.id": message.id, "rule.name": rule.name}
+        )
+        with self.tracer.activate(trace):
+            queued = self.dispatcher.submit(channel_id, MessageContext(message), rule)
+        if trace:
+            trace.set_attribute("dispatch.queued", queued)
+            trace.end()
+
+    async def check_and_handle(self, ctx, rule, local_only=False):
+        """Check a message's MessageContext against a rule and handle any violation (run by the dispatcher)
+        
+        With `local_only` (overflow of a full queue), AI rules use their local keyword check instead of a model.
+        """
+        uses_ai = getattr(rule, "uses_ai", False)
+        with self.tracer.span("rule.check", **{"rule.name": rule.name, "rule.uses_ai": uses_ai}):
+            if local_only and uses_ai:
+                local_check = getattr(rule, "local_check", None)
+                violation = local_check(ctx.content) if local_check else keyword_check(rule.rule_text, ctx)
+            else:
+                violation = await rule.check_message(ctx)
+        if ctx.author_id is not None:
+            self.leaderboard.record(ctx.guild_id, ctx.author_id, rule.name, bool(violation))
+        
+        if not violation:
+            # Remember what passed so later edits can be compared against it
+            self.edits.record(ctx.message_id, ctx.content)
+            return
+        
+        # Handle the violation without holding up the channel's queue
+        self.edits.forget(ctx.message_id)  # The message is being deleted
+        # Started here so a traced message's trace stays open until the violation is handled
+        span = self.tracer.start_span("violation.handle")
+        task = asyncio.create_task(self.handle_rule_violation(ctx.message, violation, span))
+        self.violation_tasks.add(task)
+        task.add_done_callback(self.violation_tasks.discard)
+
+    async def handle_rule_violation(self, message, violation, span=None):
         """Handle a rule violation by deleting the message and notifying the user"""
         try:
-            # Create a notification mentioning the user
-            violation_msg = await message.channel.send(
-                f"{message.author.mention} 🚨 **RULE VIOLATION** 🚨\n{violation}",
-                allowed_mentions=discord.AllowedMentions(users=True)
-            )
-            
-            # Try to delete the violating message
-            try:
-                await message.delete()
-            except discord.errors.Forbidden:
-                logging.warning(f"Bot doesn't have permission to delete messages in {message.channel.name}")
-            except discord.errors.NotFound:
-                # Message already deleted
-                pass
-            except Exception as e:
-                logging.error(f"Error deleting message: {e}")
+            with self.tracer.activate(span):
+                # Create a notification mentioning the user
+                with self.tracer.span("discord.send"):
+                    violation_msg = await message.channel.send(
+                        f"{message.author.mention} 🚨 **RULE VIOLATION** 🚨\n{violation}",
+                        allowed_mentions=discord.AllowedMentions(users=True)
+                    )
+                
+                # Try to delete the violating message
+                try:
+                    with self.tracer.span("discord.delete"):
+                        await message.delete()
+                except discord.errors.Forbidden:
+                    logging.warning(f"Bot doesn't have permission to delete messages in {message.channel.name}")
+                except discord.errors.NotFound:
+                    # Message already deleted
+                    pass
+                except Exception as e:
+                    logging.error(f"Error deleting message: {e}")
+            if span:
+                span.end()
             
             # Delete our violation message after a delay
-            await asyncio.sleep(BOT_MESSAGE_DELETE_DELAY)
-            try:
-                await violation_msg.delete()
-            except:
-                pass
+            self.delete_later(violation_msg)
                 
         except Exception as e:
             logging.error(f"Error handling rule violation: {e}")
+        finally:
+            if span:
+                span.end()  # No-op unless sending failed
+
+    def delete_later(self, notice, delay=None):
+        """Delete a violation notice after `delay` seconds (default: the message delete delay)"""
+        task = asyncio.create_task(self.delete_notice(notice, self.message_delete_delay if delay is None else delay))
+        self.pending_notices[task] = notice
+        task.add_done_callback(lambda task: self.pending_notices.pop(task, None))
+
+    async def delete_notice(self, notice, delay=0):
+        """Delete a violation notice, returning False if it should be tried again later"""
+        await self.clock.sleep(delay)
+        try:
+            await notice.delete()
+        except (discord.errors.NotFound, discord.errors.Forbidden):
+            pass  # Already gone, or never ours to delete
+        except Exception as e:
+            logging.error(f"Error deleting violation notice: {e}")
+            return False
+        return True
 
 async def setup(bot):
     await bot.add_cog(AIMod(bot))
\ No newline at end of file
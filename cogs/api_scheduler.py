@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import date
+from typing import Dict, Optional
+
+from config import (
+    OPENAI_REQUESTS_PER_MINUTE,
+    OPENAI_TOKENS_PER_MINUTE,
+    OPENAI_DAILY_BUDGET,
+    OPENAI_COST_PER_1K_TOKENS,
+)
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0  # Verdicts a user is waiting on
+PRIORITY_BACKGROUND = 1   # Buffered batches and other latency-tolerant work
+PRIORITY_SHADOW = 2       # Shadow evaluations that no user is waiting on
+
+
+class TokenBucket:
+    """Token bucket that refills continuously up to a per-minute limit"""
+
+    def __init__(self, per_minute: int):
+        """Initialize the bucket
+
+        Args:
+            per_minute: Number of tokens that become available every minute
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Return how many seconds until `amount` tokens are available"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def set_rate(self, per_minute: int) -> None:
+        """Change the per-minute limit, keeping the tokens already available"""
+        self._refill()
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = min(self.tokens, self.capacity)
+
+    def consume(self, amount: float) -> None:
+        """Take `amount` tokens out of the bucket (may go negative for oversized requests)"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class APIScheduler:
+    """Central scheduler for all OpenAI traffic
+
+    Every completion request waits here until both the requests-per-minute and
+    tokens-per-minute buckets have room. Waiting requests are served by priority
+    (interactive before background), then in arrival order. Once the daily spend
+    cap is reached, requests are refused so callers can fall back to local checks.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int,
+                 daily_budget: float = 0, cost_per_1k_tokens: float = OPENAI_COST_PER_1K_TOKENS):
+        """Initialize the scheduler
+
+        Args:
+            requests_per_minute: Account-wide request limit
+            tokens_per_minute: Account-wide token limit
+            daily_budget: Maximum spend per day in USD (0 disables the cap)
+            cost_per_1k_tokens: Price used to turn token usage into spend
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.daily_budget = daily_budget
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.queue = []  # heap of (priority, sequence, estimated_tokens, future)
+        self.sequence = itertools.count()
+        self.dispatcher = None  # asyncio.Task draining the queue
+        self.wakeup = None      # asyncio.Event set when a new request is queued
+
+        # Usage counters, reset at midnight
+        self.day = date.today()
+        self.spent_tokens = 0
+        self.request_count = 0
+        self.refused_count = 0
+
+    def _roll_day(self) -> None:
+        """Reset the daily counters when the date changes"""
+        today = date.today()
+        if today != self.day:
+            self.day = today
+            self.spent_tokens = 0
+            self.request_count = 0
+            self.refused_count = 0
+
+    @property
+    def spent(self) -> float:
+        """Estimated spend today in USD"""
+        return self.spent_tokens / 1000 * self.cost_per_1k_tokens
+
+    def budget_exhausted(self) -> bool:
+        """Check if the daily spend cap has been reached"""
+        self._roll_day()
+        return bool(self.daily_budget) and self.spent >= self.daily_budget
+
+    async def acquire(self, estimated_tokens: int, priority: int = PRIORITY_INTERACTIVE) -> bool:
+        """Wait for room in the budget to send a request
+
+        Args:
+            estimated_tokens: Prompt plus response tokens the request may use
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+
+        Returns:
+            True if the request may be sent, False if the daily budget is exhausted
+        """
+        if self.budget_exhausted():
+            self.refused_count += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.sequence), estimated_tokens, future))
+
+        if self.dispatcher is None or self.dispatcher.done():
+            self.wakeup = asyncio.Event()
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        else:
+            self.wakeup.set()
+
+        return await future
+
+    async def _dispatch(self) -> None:
+        """Release queued requests as the buckets refill"""
+        while self.queue:
+            priority, _, estimated_tokens, future = self.queue[0]
+            if future.done():
+                # The caller gave up (e.g. cancelled while waiting)
+                heapq.heappop(self.queue)
+                continue
+
+            wait = max(self.requests.time_until(1), self.tokens.time_until(estimated_tokens))
+            if wait > 0:
+                # Sleep until the buckets refill, but wake early if a more urgent request arrives
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.queue)
+            self.requests.consume(1)
+            self.tokens.consume(estimated_tokens)
+            self.request_count += 1
+            future.set_result(True)
+
+    def apply_settings(self, settings) -> None:
+        """Swap in new limits from the runtime config (see cogs/runtime_config.py)"""
+        self.requests.set_rate(settings["openai_requests_per_minute"])
+        self.tokens.set_rate(settings["openai_tokens_per_minute"])
+        self.daily_budget = settings["openai_daily_budget"]
+        if self.wakeup is not None:
+            self.wakeup.set()  # Re-check waiting requests against the new limits
+
+    def record_usage(self, total_tokens: int) -> None:
+        """Record the tokens a completed request actually used
+
+        Args:
+            total_tokens: Prompt plus completion tokens reported by the API
+        """
+        was_exhausted = self.budget_exhausted()
+        self.spent_tokens += total_tokens
+        if not was_exhausted and self.budget_exhausted():
+            logging.warning(f"Daily OpenAI budget of ${self.daily_budget:.2f} reached; falling back to local checks")
+
+    def usage(self) -> Dict[str, float]:
+        """Return a snapshot of current budget usage"""
+        self._roll_day()
+        # time_until(0) refreshes both buckets before they are read
+        self.requests.time_until(0)
+        self.tokens.time_until(0)
+        return {
+            "requests_available": max(0.0, self.requests.tokens),
+            "requests_per_minute": self.requests.capacity,
+            "tokens_available": max(0.0, self.tokens.tokens),
+            "tokens_per_minute": self.tokens.capacity,
+            "queued": len(self.queue),
+            "requests_today": self.request_count,
+            "refused_today": self.refused_count,
+            "tokens_today": self.spent_tokens,
+            "spent_today": self.spent,
+            "daily_budget": self.daily_budget,
+        }
+
+
+_scheduler: Optional[APIScheduler] = None
+
+
+def get_scheduler() -> APIScheduler:
+    """Return the process-wide scheduler, creating it on first use"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = APIScheduler(
+            OPENAI_REQUESTS_PER_MINUTE,
+            OPENAI_TOKENS_PER_MINUTE,
+            OPENAI_DAILY_BUDGET,
+        )
+        from cogs.runtime_config import get_runtime_config
+        get_runtime_config().subscribe(_scheduler.apply_settings)
+    return _scheduler
@@ -0,0 +1,257 @@
+import logging
+import math
+import re
+from typing import Callable, Dict, List, Optional
+
+from config import OPENAI_BASE_URL, OPENAI_COST_PER_1K_TOKENS, LOCAL_LLM_BASE_URL, LOCAL_LLM_MODEL, INFERENCE_ROUTES
+
+SYSTEM_PROMPT = "You are April Fools AI Mod, a strict but humorous enforcer of rules."
+
+# Verdict words at the start of an answer or of a "MESSAGE i:" line
+_VERDICT_PATTERN = re.compile(r'^(?:MESSAGE \d+:\s*)?(YES|NO)\b', re.MULTILINE)
+
+
+class CompletionRequest:
+    """A verdict request: the rendered prompt plus the structured parts it was built from
+
+    `prefix` is the static system prompt (see cogs/prompts.py) and `prompt`
+    the variable part sent after it.
+    """
+
+    __slots__ = ("prompt", "max_tokens", "rule_text", "contents", "prefix")
+
+    def __init__(self, prompt: str, max_tokens: int, rule_text: Optional[str] = None,
+                 contents: Optional[List[str]] = None, prefix: str = SYSTEM_PROMPT):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.rule_text = rule_text
+        self.contents = contents or []
+        self.prefix = prefix
+
+
+class Completion:
+    """A backend's answer in the bot's YES/NO or "MESSAGE i:" format"""
+
+    __slots__ = ("text", "total_tokens", "confidences", "backend")
+
+    def __init__(self, text: str, total_tokens: int, confidences: List[float], backend: str):
+        self.text = text
+        self.total_tokens = total_tokens
+        self.confidences = confidences  # 0-1 per message, how sure the backend is of each verdict
+        self.backend = backend
+
+
+class InferenceBackend:
+    """Base class for anything that can answer verdict requests"""
+
+    name = "base"
+    metered = False  # True if requests count against the API budget
+    cost_per_1k_tokens = 0.0
+
+    async def complete(self, request: CompletionRequest, want_confidence: bool = False) -> Completion:
+        """Answer a request
+
+        Args:
+            request: The request to answer
+            want_confidence: Whether the caller will use the confidence (may cost extra work)
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class OpenAIBackend(InferenceBackend):
+    """The OpenAI chat-completions API"""
+
+    name = "openai"
+    metered = True
+    cost_per_1k_tokens = OPENAI_COST_PER_1K_TOKENS
+
+    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo", base_url: Optional[str] = OPENAI_BASE_URL):
+        """Initialize the backend
+
+        Args:
+            api_key: The API key
+            model: The model to use for completions
+            base_url: Alternative chat-completions endpoint
+        """
+        from cogs.openai_handler import get_client
+        self.client = get_client(api_key, base_url)
+        self.model = model
+        self.supports_logprobs = True
+
+    async def complete(self, request: CompletionRequest, want_confidence: bool = False) -> Completion:
+        kwargs = {}
+        if want_confidence and self.supports_logprobs:
+            kwargs["logprobs"] = True
+
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": request.prefix},
+                {"role": "user", "content": request.prompt}
+            ],
+            max_tokens=request.max_tokens,
+            **kwargs
+        )
+
+        choice = response.choices[0]
+        text = (choice.message.content or "").strip()
+        total_tokens = response.usage.total_tokens if response.usage else (len(request.prefix) + len(request.prompt)) // 4 + request.max_tokens
+        count = max(1, len(request.contents))
+        return Completion(text, total_tokens, self._confidences(text, choice, count), self.name)
+
+    async def close(self) -> None:
+        """Close the HTTP client and drop it from the shared clients"""
+        from cogs.openai_handler import release_client
+        release_client(self.client)
+        await self.client.close()
+
+    def _confidences(self, text: str, choice, count: int) -> List[float]:
+        """Derive per-message confidence from the probability of each YES/NO token, in order"""
+        if not _VERDICT_PATTERN.search(text):
+            return [0.0] * count  # No usable verdict at all
+
+        logprobs = getattr(choice, "logprobs", None)
+        content = getattr(logprobs, "content", None) if logprobs else None
+        if not content:
+            return [1.0] * count  # Nothing to go on, trust the answer
+
+        probabilities = [math.exp(token.logprob) for token in content if token.token.strip() in ("YES", "NO")]
+        return (probabilities + [1.0] * count)[:count]
+
+
+class OpenAICompatibleBackend(OpenAIBackend):
+    """A self-hosted OpenAI-compatible server (llama.cpp, vLLM, ...) on our own hardware"""
+
+    name = "local"
+    metered = False
+    cost_per_1k_tokens = 0.0
+
+    def __init__(self, base_url: str, model: str, api_key: str = "local"):
+        super().__init__(api_key, model, base_url)
+
+
+class RuleBasedBackend(InferenceBackend):
+    """In-process keyword checks, answering in the same format as the models
+
+    Rules register a local check for their rule text. Keyword checks both
+    miss real attempts and accept messages that only happen to contain a
+    keyword, so neither answer is confident enough to be final on a
+    cheap-first route: both stay below every min_confidence in
+    INFERENCE_ROUTES and escalate. A keyword answer only stands when this
+    backend is the last one in a chain.
+    """
+
+    name = "rules"
+    pass_confidence = 0.7
+    fail_confidence = 0.6
+
+    def __init__(self):
+        self.checks: Dict[str, Callable[[str], Optional[str]]] = {}  # {rule_text: check(content) -> reason}
+
+    def register(self, rule_text: str, check: Callable[[str], Optional[str]]) -> None:
+        """Register a local check returning None if a message complies, or a violation reason"""
+        self.checks[rule_text] = check
+
+    def unregister(self, rule_text: str) -> None:
+        """Drop the local check of a rule that has ended"""
+        self.checks.pop(rule_text, None)
+
+    async def complete(self, request: CompletionRequest, want_confidence: bool = False) -> Completion:
+        check = self.checks.get(request.rule_text)
+        if check is None or not request.contents:
+            return Completion("", 0, [0.0] * len(request.contents), self.name)
+
+        answers = []
+        confidences = []
+        for content in request.contents:
+            reason = check(content)
+            if reason is None:
+                answers.append("YES")
+                confidences.append(self.pass_confidence)
+            else:
+                answers.append(f"NO: {reason}")
+                confidences.append(self.fail_confidence)
+
+        if len(answers) == 1:
+            text = answers[0]
+        else:
+            text = "\n".join(f"MESSAGE {i + 1}: {answer}" for i, answer in enumerate(answers))
+        return Completion(text, 0, confidences, self.name)
+
+
+class BackendRouter:
+    """Routes each request to the cheapest suitable backend, escalating when unsure
+
+    Routes come from INFERENCE_ROUTES in config, keyed by rule type, with a
+    "default" entry. A route's `chain` lists backends from cheapest to
+    strongest. Messages at most `short_message_chars` long walk the chain: a
+    backend's verdict for a message is kept if its confidence is at least
+    `min_confidence`, and the rest escalate to the next backend. Longer
+    messages go straight to the strongest backend. Backends that aren't
+    configured are skipped.
+    """
+
+    def __init__(self, backends: Dict[str, InferenceBackend], routes: Dict[str, dict] = INFERENCE_ROUTES):
+        """Initialize the router
+
+        Args:
+            backends: Available backends by name
+            routes: Routing table by rule type, with a "default" entry
+        """
+        self.backends = backends
+        self.routes = routes
+        self.counts: Dict[str, int] = {name: 0 for name in backends}
+        self.escalations = 0
+
+    def backend(self, name: str) -> Optional[InferenceBackend]:
+        return self.backends.get(name)
+
+    def plan(self, rule_key: Optional[str]) -> List[InferenceBackend]:
+        """Return the backends a rule's requests may use, cheapest first"""
+        route = self.routes.get(rule_key) or self.routes["default"]
+        chain = [self.backends[name] for name in route["chain"] if name in self.backends]
+        return chain or [self.backends["openai"]]
+
+    def is_short(self, rule_key: Optional[str], content: str) -> bool:
+        """Check whether a message is short enough to try the cheaper backends first"""
+        route = self.routes.get(rule_key) or self.routes["default"]
+        return len(content) <= route.get("short_message_chars", 0)
+
+    def min_confidence(self, rule_key: Optional[str]) -> float:
+        route = self.routes.get(rule_key) or self.routes["default"]
+        return route.get("min_confidence", 0.0)
+
+    def note(self, backend: InferenceBackend, escalated: bool) -> None:
+        self.counts[backend.name] = self.counts.get(backend.name, 0) + 1
+        if escalated:
+            self.escalations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts, escalations=self.escalations)
+
+    async def close(self) -> None:
+        for backend in self.backends.values():
+            try:
+                await backend.close()
+            except Exception as e:
+                logging.warning(f"Error closing backend {backend.name}: {e}")
+
+
+def build_router(api_key: str, model: str, base_url: Optional[str] = OPENAI_BASE_URL) -> BackendRouter:
+    """Create a router with every backend the configuration enables
+
+    Args:
+        api_key: The OpenAI API key
+        model: The OpenAI model
+        base_url: Alternative endpoint for the OpenAI backend
+    """
+    backends: Dict[str, InferenceBackend] = {
+        "openai": OpenAIBackend(api_key, model, base_url),
+        "rules": RuleBasedBackend(),
+    }
+    if LOCAL_LLM_BASE_URL:
+        backends["local"] = OpenAICompatibleBackend(LOCAL_LLM_BASE_URL, LOCAL_LLM_MODEL)
+    return BackendRouter(backends)
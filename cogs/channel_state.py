@@ -0,0 +1,168 @@
+import sys
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from cogs.clock import get_clock
+
+_MISSING = object()
+
+
+class ChannelStateStore:
+    """Bounded per-channel state with TTL and LRU eviction
+
+    Behaves like a dict keyed by channel ID. Entries expire `ttl` seconds
+    after they were last written, and once `max_entries` is exceeded the
+    least recently used entry is evicted. `on_evict(key, value)` is called
+    for entries removed by expiry or eviction (not for explicit deletes),
+    so owners can cancel tasks or flush work tied to the entry.
+
+    Every store registers itself so `all_stats()` can report entry counts
+    and approximate memory for the whole bot.
+    """
+
+    registry = weakref.WeakSet()
+
+    def __init__(self, name: str, max_entries: int = 10000, ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        """Initialize the store
+
+        Args:
+            name: Name shown in stats
+            max_entries: Maximum number of entries before LRU eviction
+            ttl: Default seconds an entry lives after it was written (None for no expiry)
+            on_evict: Optional callback for entries removed by expiry or eviction
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.expires: Dict[Hashable, float] = {}  # {key: monotonic deadline} for entries with a TTL
+        self.evictions = 0
+        self.writes = 0
+        ChannelStateStore.registry.add(self)
+
+    def _expired(self, key, now: float) -> bool:
+        deadline = self.expires.get(key)
+        return deadline is not None and now >= deadline
+
+    def _evict(self, key) -> None:
+        value = self.entries.pop(key)
+        self.expires.pop(key, None)
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        """Store a value, overriding the default TTL if `ttl` is given"""
+        ttl = self.ttl if ttl is None else ttl
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if ttl is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = get_clock().monotonic() + ttl
+
+        # Purge expired entries every so often so idle channels don't linger
+        self.writes += 1
+        if self.writes % 256 == 0:
+            self.purge_expired()
+
+        while len(self.entries) > self.max_entries:
+            self._evict(next(iter(self.entries)))
+
+    def get(self, key, default=None):
+        """Return the value for `key` if present and not expired"""
+        value = self.entries.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        if self._expired(key, get_clock().monotonic()):
+            self._evict(key)
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def pop(self, key, default=None):
+        """Remove and return the value for `key` without calling `on_evict`"""
+        self.expires.pop(key, None)
+        return self.entries.pop(key, default)
+
+    def purge_expired(self) -> int:
+        """Remove all expired entries and return how many were removed"""
+        now = get_clock().monotonic()
+        expired = [key for key, deadline in self.expires.items() if now >= deadline]
+        for key in expired:
+            self._evict(key)
+        return len(expired)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.expires.clear()
+
+    def keys(self) -> List[Hashable]:
+        self.purge_expired()
+        return list(self.entries.keys())
+
+    def items(self) -> List[tuple]:
+        self.purge_expired()
+        return list(self.entries.items())
+
+    def values(self) -> List[Any]:
+        self.purge_expired()
+        return list(self.entries.values())
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key) -> None:
+        if key not in self.entries:
+            raise KeyError(key)
+        self.pop(key)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the entries (shallow sizes of keys and values)"""
+        total = sys.getsizeof(self.entries) + sys.getsizeof(self.expires)
+        for key, value in self.entries.items():
+            total += sys.getsizeof(key) + sys.getsizeof(value)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count, approximate memory and evictions for this store"""
+        self.purge_expired()
+        return {
+            "name": self.name,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "bytes": self.memory_bytes(),
+            "evictions": self.evictions,
+        }
+
+
+def all_stats() -> List[Dict[str, Any]]:
+    """Return stats for every live store, aggregated by name"""
+    totals: Dict[str, Dict[str, Any]] = {}
+    for store in list(ChannelStateStore.registry):
+        stats = store.stats()
+        total = totals.setdefault(stats["name"], {"name": stats["name"], "stores": 0, "entries": 0,
+                                                   "bytes": 0, "evictions": 0})
+        total["stores"] += 1
+        total["entries"] += stats["entries"]
+        total["bytes"] += stats["bytes"]
+        total["evictions"] += stats["evictions"]
+    return sorted(totals.values(), key=lambda s: s["name"])
@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+
+class Clock:
+    """Source of time for rules, the cog and the handler
+
+    Rule expiry, timers, batching waits and rate limits all read the time
+    and sleep through the process-wide clock (see `get_clock`), so a
+    simulation can swap in a `VirtualClock` and run hours of traffic
+    without waiting for them.
+    """
+
+    def now(self) -> datetime:
+        """Wall-clock time, for rule end times"""
+        return datetime.now()
+
+    def monotonic(self) -> float:
+        """Seconds from an arbitrary start, for intervals and TTLs"""
+        return time.monotonic()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+    async def wait(self, tasks, timeout: float) -> Tuple[set, set]:
+        """Wait for `tasks` to finish, for at most `timeout` seconds on this clock
+
+        Returns:
+            (done, pending) sets of tasks, as asyncio.wait
+        """
+        if not tasks:
+            return set(), set()
+        return await asyncio.wait(set(tasks), timeout=timeout)
+
+
+class VirtualClock(Clock):
+    """A clock that only moves when `advance` is called
+
+    Sleepers wait on futures ordered by deadline. `advance` wakes them in
+    deadline order, setting the time to each deadline as it goes, and lets
+    the woken tasks run until the event loop is idle before moving on, so
+    anything they schedule inside the window also runs at its own time.
+    """
+
+    def __init__(self, start: Optional[datetime] = None):
+        """Initialize the clock
+
+        Args:
+            start: Wall-clock time at virtual second zero (default: now)
+        """
+        self.start = start or datetime.now()
+        self.elapsed = 0.0
+        self.sleepers: List[Tuple[float, int, asyncio.Future]] = []  # Heap of (deadline, sequence, future)
+        self.sequence = itertools.count()
+        # Metrics
+        self.wakeups = 0
+        self.max_sleepers = 0
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    async def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.sleepers, (self.elapsed + seconds, next(self.sequence), future))
+        self.max_sleepers = max(self.max_sleepers, len(self.sleepers))
+        await future  # A cancelled sleeper's future is cancelled too and skipped by `advance`
+
+    async def wait(self, tasks, timeout: float) -> Tuple[set, set]:
+        pending = set(tasks)
+        if not pending:
+            return set(), set()
+        timer = asyncio.ensure_future(self.sleep(timeout))
+        try:
+            while pending and not timer.done():
+                await asyncio.wait(pending | {timer}, return_when=asyncio.FIRST_COMPLETED)
+                pending = {task for task in pending if not task.done()}
+        finally:
+            timer.cancel()
+        return {task for task in tasks if task.done()}, pending
+
+    def pending(self) -> int:
+        """Sleepers still waiting (including cancelled ones not yet skipped)"""
+        return len(self.sleepers)
+
+    def next_deadline(self) -> Optional[float]:
+        """The earliest time a live sleeper wakes, or None if there are none"""
+        while self.sleepers and self.sleepers[0][2].done():
+            heapq.heappop(self.sleepers)
+        return self.sleepers[0][0] if self.sleepers else None
+
+    async def settle(self, max_steps: int = 1000) -> None:
+        """Yield to the event loop until nothing else is ready to run"""
+        loop = asyncio.get_running_loop()
+        for _ in range(max_steps):
+            await asyncio.sleep(0)
+            # _ready is the loop's queue of runnable callbacks (CPython's asyncio); without it, yield max_steps times
+            ready = getattr(loop, "_ready", None)
+            if ready is not None and not ready:
+                return
+
+    async def advance(self, seconds: float) -> None:
+        """Move time forward by `seconds`, running everything due on the way"""
+        target = self.elapsed + seconds
+        await self.settle()
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > target:
+                break
+            self.elapsed = max(self.elapsed, deadline)
+            # Wake every sleeper due at this instant together, then let them run
+            while self.sleepers and self.sleepers[0][0] <= self.elapsed:
+                _, _, future = heapq.heappop(self.sleepers)
+                if not future.done():
+                    future.set_result(None)
+                    self.wakeups += 1
+            await self.settle()
+        self.elapsed = max(self.elapsed, target)
+
+
+_clock: Clock = Clock()
+
+
+def get_clock() -> Clock:
+    """Return the process-wide clock"""
+    return _clock
+
+
+def set_clock(clock: Clock) -> None:
+    """Replace the process-wide clock (before creating the cog, handler and rules that read it)"""
+    global _clock
+    _clock = clock
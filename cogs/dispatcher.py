@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict
+
+from cogs.clock import get_clock
+from cogs.tracing import current_span, get_tracer
+
+# What to do with a message once its channel's queue is full
+OVERFLOW_FAIL_OPEN = "fail_open"    # Let the message through unchecked
+OVERFLOW_LOCAL_ONLY = "local_only"  # Still check it, AI rules with their local keyword check only
+OVERFLOW_SAMPLED = "sampled"        # Check a random sample, let the rest through
+OVERFLOW_POLICIES = (OVERFLOW_FAIL_OPEN, OVERFLOW_LOCAL_ONLY, OVERFLOW_SAMPLED)
+
+
+class _ChannelQueue:
+    """Pending messages and running worker count for one channel"""
+
+    __slots__ = ("items", "workers")
+
+    def __init__(self):
+        self.items = deque()  # (message, rule, local_only, queue_span) waiting to be checked; queue_span is None unless traced
+        self.workers = 0
+
+
+class MessageDispatcher:
+    """Bounded per-channel work queues in front of rule checks
+
+    Each channel gets its own FIFO queue. Stateful rules (like the rhyme
+    chain) are processed by a single worker per channel so messages are
+    checked in order, even when the channel's rule changes while messages
+    are queued; other rules may use a few workers per channel. All
+    workers share a global concurrency cap. Once a channel's queue reaches
+    `max_depth`, new messages are handled by the overflow policy instead of
+    queueing (with a hard cap at twice the depth), so one busy channel can't
+    starve the rest.
+    """
+
+    def __init__(self, process: Callable[[Any, Any], Awaitable[None]], max_concurrency: int = 50,
+                 max_depth: int = 20, channel_concurrency: int = 4,
+                 overflow_policy: str = OVERFLOW_LOCAL_ONLY, sample_rate: float = 0.25):
+        """Initialize the dispatcher
+
+        Args:
+            process: Coroutine function called with (message, rule, local_only) to check a message;
+                local_only is True for overflow messages of AI rules, which must not call a model
+            max_concurrency: Maximum checks running at once across all channels
+            max_depth: Maximum messages queued per channel before the overflow policy applies
+            channel_concurrency: Maximum workers per channel for rules that are not stateful
+            overflow_policy: One of OVERFLOW_POLICIES
+            sample_rate: Fraction of overflow messages still checked with the sampled policy
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.process = process
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_depth = max_depth
+        self.channel_concurrency = channel_concurrency
+        self.overflow_policy = overflow_policy
+        self.sample_rate = sample_rate
+        self.queues: Dict[int, _ChannelQueue] = {}  # {channel_id: _ChannelQueue}, removed when idle
+        self.tracer = get_tracer()
+        self.workers = set()  # Running worker tasks
+        self.running = 0      # Checks currently holding the semaphore
+
+        # Metrics
+        self.processed = 0
+        self.dropped = 0
+        self.overflow_checked = 0
+        self.overflow_local = 0  # Overflow messages of AI rules checked locally
+        self.max_depth_seen = 0
+
+    def submit(self, channel_id: int, message, rule) -> bool:
+        """Queue a message for checking without waiting for the result
+
+        Args:
+            channel_id: The channel the message was sent in
+            message: The MessageContext of the message to check
+            rule: The rule to check it against
+
+        Returns:
+            True if the message was queued, False if it was let through unchecked
+        """
+        queue = self.queues.get(channel_id)
+        if queue is None:
+            queue = self.queues[channel_id] = _ChannelQueue()
+
+        depth = len(queue.items)
+        local_only = False
+        if depth >= self.max_depth:
+            # Overflow messages the policy still accepts may use up to twice the depth limit
+            if depth >= 2 * self.max_depth or not self._accept_overflow(rule):
+                self.dropped += 1
+                span = current_span()
+                if span:
+                    span.set_attribute("dispatch.dropped", True)
+                if not queue.items and queue.workers == 0:
+                    del self.queues[channel_id]
+                return False
+            # Past a full queue, AI rules don't add model requests
+            local_only = self.overflow_policy == OVERFLOW_LOCAL_ONLY and getattr(rule, "uses_ai", False)
+            if local_only:
+                self.overflow_local += 1
+
+        queue.items.append((message, rule, local_only,
+                            self.tracer.start_span("dispatch.queue", **{"queue.depth": depth})))
+        self.max_depth_seen = max(self.max_depth_seen, len(queue.items))
+
+        worker_limit = 1 if getattr(rule, "stateful", False) else self.channel_concurrency
+        if queue.workers < worker_limit:
+            queue.workers += 1
+            task = asyncio.create_task(self._worker(channel_id, queue))
+            self.workers.add(task)
+            task.add_done_callback(self.workers.discard)
+        return True
+
+    def _accept_overflow(self, rule) -> bool:
+        """Decide whether a message arriving at a full queue should still be checked"""
+        if self.overflow_policy == OVERFLOW_LOCAL_ONLY:
+            accept = True  # AI rules are checked locally (see submit)
+        elif self.overflow_policy == OVERFLOW_SAMPLED:
+            accept = random.random() < self.sample_rate
+        else:
+            accept = False
+
+        if accept:
+            self.overflow_checked += 1
+        return accept
+
+    async def _worker(self, channel_id: int, queue: _ChannelQueue) -> None:
+        """Check queued messages for one channel until its queue is empty"""
+        try:
+            while queue.items:
+                # Workers spawned for an earlier, non-stateful rule step aside until one is left
+                if queue.workers > 1 and getattr(queue.items[0][1], "stateful", False):
+                    break
+                message, rule, local_only, queue_span = queue.items.popleft()
+                async with self.semaphore:
+                    self.running += 1
+                    try:
+                        # Continue the message's trace, which was started in another task
+                        with self.tracer.activate(queue_span and queue_span.parent), self.tracer.span("dispatch.run"):
+                            if queue_span:
+                                queue_span.end()
+                            await self.process(message, rule, local_only)
+                    except Exception as e:
+                        logging.error(f"Error checking message in channel {channel_id}: {e}")
+                    finally:
+                        self.running -= 1
+                self.processed += 1
+        finally:
+            queue.workers -= 1
+            if not queue.items and queue.workers == 0 and self.queues.get(channel_id) is queue:
+                del self.queues[channel_id]
+
+    async def drain(self, timeout: float) -> Dict[str, int]:
+        """Wait up to `timeout` seconds for queued messages to be checked (on shutdown)
+
+        The caller stops submitting first. Workers still running at the
+        deadline are cancelled.
+
+        Returns:
+            Messages checked while draining ("checked") and messages left
+            unchecked at the deadline ("abandoned")
+        """
+        processed = self.processed
+        await get_clock().wait(self.workers, timeout)
+        abandoned = self.depth() + self.running
+        for task in list(self.workers):
+            task.cancel()
+        self.queues.clear()
+        return {"checked": self.processed - processed, "abandoned": abandoned}
+
+    def depth(self) -> int:
+        """Total messages waiting across all channels"""
+        return sum(len(queue.items) for queue in self.queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and drop metrics"""
+        return {
+            "queued": self.depth(),
+            "channels": len(self.queues),
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "max_depth_seen": self.max_depth_seen,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "overflow_checked": self.overflow_checked,
+            "overflow_local": self.overflow_local,
+            "overflow_policy": self.overflow_policy,
+        }
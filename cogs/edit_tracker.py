@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from cogs.channel_state import ChannelStateStore
+from cogs.clock import get_clock
+from cogs.fingerprint import simhash
+from config import CHANNEL_STATE_TTL, EDIT_RECHECK_INTERVAL, EDIT_SMALL_DISTANCE, EDIT_TRACKED_MESSAGES
+
+
+class _CheckedMessage:
+    """What a message looked like when it was last checked"""
+
+    __slots__ = ("content", "fingerprint", "checked_at", "pending", "timer")
+
+    def __init__(self, content: Optional[str], fingerprint: int, checked_at: float):
+        self.content = content
+        self.fingerprint = fingerprint
+        self.checked_at = checked_at
+        self.pending = None  # (message, rule) waiting for a rate-limited recheck
+        self.timer = None    # asyncio.Task running the pending recheck
+
+
+class EditTracker:
+    """Decides which message edits need a recheck, and when
+
+    Remembers the content and SimHash of every message that passed its
+    check, keyed by message id. An edit is ignored if its content is
+    unchanged. For AI rules whose verdicts ignore case, emoji and
+    punctuation (`ignores_formatting`), it is also ignored if it is within
+    `small_distance` SimHash bits of the last checked version, since such
+    an edit can't plausibly flip the model's verdict. SimHash discards
+    exactly what other rules judge, so their edits are always rechecked,
+    or removing an emoji or a capital letter would slip past them. Each
+    message is rechecked at most once per `recheck_interval`: later edits
+    wait, and only the newest one is checked when the interval is up.
+    """
+
+    def __init__(self, recheck: Callable[[Any, Any], None], max_entries: int = EDIT_TRACKED_MESSAGES,
+                 ttl: Optional[float] = CHANNEL_STATE_TTL, recheck_interval: float = EDIT_RECHECK_INTERVAL,
+                 small_distance: int = EDIT_SMALL_DISTANCE):
+        """Initialize the tracker
+
+        Args:
+            recheck: Called with (message, rule) to queue a recheck
+            max_entries: Maximum messages remembered before LRU eviction
+            ttl: Seconds a message is remembered after its last check
+            recheck_interval: Minimum seconds between rechecks of one message
+            small_distance: Max SimHash bits an edit may change and keep an AI verdict
+        """
+        self.recheck = recheck
+        self.recheck_interval = recheck_interval
+        self.small_distance = small_distance
+        self.checked = ChannelStateStore("edit_tracker", max_entries, ttl,
+                                         on_evict=lambda _, entry: entry.timer and entry.timer.cancel())
+
+        # Metrics
+        self.unchanged = 0
+        self.small = 0
+        self.deferred = 0
+        self.rechecked = 0
+
+    def record(self, message_id: int, content: str) -> None:
+        """Remember a message that passed its check as the baseline for later edits"""
+        entry = self.checked.get(message_id)
+        if entry is None:
+            self.checked[message_id] = _CheckedMessage(content, simhash(content), get_clock().monotonic())
+        else:
+            entry.content, entry.fingerprint = content, simhash(content)
+            self.checked[message_id] = entry  # Refresh the TTL
+
+    def submit(self, message, rule) -> str:
+        """Handle an edit, queueing a recheck if it needs one
+
+        Args:
+            message: The edited Discord message
+            rule: The rule that applies in its channel
+
+        Returns:
+            "unchanged", "small", "deferred" or "rechecked"
+        """
+        entry = self.checked.get(message.id)
+        if entry is None:
+            # Sent before tracking started (or forgotten); check it like a new message
+            entry = self.checked[message.id] = _CheckedMessage(None, 0, 0.0)
+
+        if message.content == entry.content:
+            self.unchanged += 1
+            return "unchanged"
+
+        if getattr(rule, "uses_ai", False) and getattr(rule, "ignores_formatting", False) and entry.content is not None:
+            distance = bin(simhash(message.content) ^ entry.fingerprint).count("1")
+            if distance <= self.small_distance:
+                self.small += 1
+                return "small"
+
+        wait = entry.checked_at + self.recheck_interval - get_clock().monotonic()
+        if wait > 0:
+            # Check only the newest version once the interval is up
+            entry.pending = (message, rule)
+            if entry.timer is None or entry.timer.done():
+                entry.timer = asyncio.create_task(self._recheck_later(message.id, wait))
+            self.deferred += 1
+            return "deferred"
+
+        self._recheck(entry, message, rule)
+        return "rechecked"
+
+    def _recheck(self, entry: _CheckedMessage, message, rule) -> None:
+        entry.checked_at = get_clock().monotonic()
+        entry.pending = None
+        self.rechecked += 1
+        self.recheck(message, rule)
+
+    async def _recheck_later(self, message_id: int, wait: float) -> None:
+        await get_clock().sleep(wait)
+        entry = self.checked.get(message_id)
+        if entry is None or entry.pending is None:
+            return
+        entry.timer = None
+        message, rule = entry.pending
+        try:
+            self._recheck(entry, message, rule)
+        except Exception as e:
+            logging.error(f"Error rechecking edited message {message_id}: {e}")
+
+    def forget(self, message_id: int) -> None:
+        """Drop a message (e.g. once it was deleted)"""
+        entry = self.checked.pop(message_id)
+        if entry is not None and entry.timer is not None:
+            entry.timer.cancel()
+
+    def close(self) -> None:
+        """Cancel pending rechecks and forget every message"""
+        for entry in self.checked.values():
+            if entry.timer is not None:
+                entry.timer.cancel()
+        self.checked.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tracked": len(self.checked),
+            "unchanged": self.unchanged,
+            "small": self.small,
+            "deferred": self.deferred,
+            "rechecked": self.rechecked,
+        }
@@ -0,0 +1,162 @@
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import EVENT_STORE_FILE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow_results (
+    ts REAL NOT NULL,
+    rule_key TEXT NOT NULL,
+    primary_backend TEXT NOT NULL,
+    primary_violation INTEGER,
+    primary_latency_ms REAL,
+    primary_cost REAL,
+    candidate_backend TEXT NOT NULL,
+    candidate_violation INTEGER,
+    candidate_latency_ms REAL,
+    candidate_cost REAL
+);
+CREATE INDEX IF NOT EXISTS shadow_results_ts ON shadow_results (ts);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+_SHADOW_COLUMNS = ("ts", "rule_key", "primary_backend", "primary_violation", "primary_latency_ms", "primary_cost",
+                   "candidate_backend", "candidate_violation", "candidate_latency_ms", "candidate_cost")
+
+
+class EventStore:
+    """Local SQLite store for measurements and state the bot keeps between runs
+
+    Rows are buffered in memory and written in one transaction once
+    `flush_size` rows are waiting or `flush_interval` seconds have passed
+    since the last write, so recording an event never waits on the disk
+    for more than a batched insert.
+    """
+
+    def __init__(self, path: str = EVENT_STORE_FILE, flush_size: int = 100, flush_interval: float = 10.0):
+        """Open (or create) the store
+
+        Args:
+            path: SQLite database file (":memory:" for a throwaway store)
+            flush_size: Buffered rows that trigger a write
+            flush_interval: Seconds after which buffered rows are written on the next record
+        """
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+        self.pending: List[Tuple[Any, ...]] = []
+        self.flushed_at = time.monotonic()
+
+    def record_shadow(self, rule_key: str, primary_backend: str, primary_violation: Optional[bool],
+                      primary_latency_ms: float, primary_cost: float, candidate_backend: str,
+                      candidate_violation: Optional[bool], candidate_latency_ms: float, candidate_cost: float) -> None:
+        """Record one message judged by the enforcing backend and a shadow candidate
+
+        A verdict of None means the backend gave no usable answer.
+        """
+        self.pending.append((time.time(), rule_key, primary_backend, primary_violation, primary_latency_ms,
+                             primary_cost, candidate_backend, candidate_violation, candidate_latency_ms, candidate_cost))
+        if len(self.pending) >= self.flush_size or time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered rows"""
+        self.flushed_at = time.monotonic()
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    f"INSERT INTO shadow_results ({', '.join(_SHADOW_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(_SHADOW_COLUMNS))})", rows
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Could not write {len(rows)} events to {self.path}: {e}")
+
+    def shadow_summary(self, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Summarize shadow results per (primary, candidate) backend pair
+
+        Args:
+            since: Only rows recorded after this Unix time (default: all)
+
+        Returns:
+            One dict per pair with the message count, an agreement matrix
+            {(primary_violation, candidate_violation): count} over messages
+            both backends answered, and average latency (ms) and total cost
+            (USD) for each side
+        """
+        self.flush()
+        where, params = ("WHERE ts >= ?", (since,)) if since is not None else ("", ())
+        pairs = {}
+        for row in self.connection.execute(
+            f"SELECT primary_backend, candidate_backend, COUNT(*), AVG(primary_latency_ms), SUM(primary_cost), "
+            f"AVG(candidate_latency_ms), SUM(candidate_cost) FROM shadow_results {where} "
+            f"GROUP BY primary_backend, candidate_backend", params
+        ):
+            pairs[row[0], row[1]] = {
+                "primary": row[0], "candidate": row[1], "messages": row[2],
+                "primary_latency_ms": row[3] or 0.0, "primary_cost": row[4] or 0.0,
+                "candidate_latency_ms": row[5] or 0.0, "candidate_cost": row[6] or 0.0,
+                "matrix": {}, "unanswered": 0,
+            }
+        for primary, candidate, primary_violation, candidate_violation, count in self.connection.execute(
+            f"SELECT primary_backend, candidate_backend, primary_violation, candidate_violation, COUNT(*) "
+            f"FROM shadow_results {where} GROUP BY 1, 2, 3, 4", params
+        ):
+            pair = pairs[primary, candidate]
+            if primary_violation is None or candidate_violation is None:
+                pair["unanswered"] += count
+            else:
+                pair["matrix"][bool(primary_violation), bool(candidate_violation)] = count
+        for pair in pairs.values():
+            answered = sum(pair["matrix"].values())
+            agreed = pair["matrix"].get((True, True), 0) + pair["matrix"].get((False, False), 0)
+            pair["agreement"] = agreed / answered if answered else 0.0
+        return sorted(pairs.values(), key=lambda pair: pair["messages"], reverse=True)
+
+    def save_state(self, name: str, value: Any) -> None:
+        """Store a JSON-serializable value under `name`, replacing the previous one"""
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO state (name, value, updated) VALUES (?, ?, ?)",
+                    (name, json.dumps(value, separators=(",", ":")), time.time())
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Could not save {name} to {self.path}: {e}")
+
+    def load_state(self, name: str) -> Optional[Any]:
+        """Return the value last stored under `name`, or None"""
+        row = self.connection.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except ValueError as e:
+            logging.error(f"Ignoring unreadable {name} in {self.path}: {e}")
+            return None
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+
+_event_store: Optional[EventStore] = None
+
+
+def get_event_store() -> EventStore:
+    """Return the shared event store, opening EVENT_STORE_FILE on first use"""
+    global _event_store
+    if _event_store is None:
+        _event_store = EventStore()
+    return _event_store
@@ -0,0 +1,205 @@
+import asyncio
+from collections import deque
+from typing import Any, Dict, Hashable, Optional
+
+from cogs.clock import get_clock
+from config import (
+    FAIR_GUILD_WEIGHTS,
+    FAIR_MAX_IN_FLIGHT,
+    FAIR_GUILD_MAX_IN_FLIGHT,
+    FAIR_GUILD_MAX_PENDING,
+    FAIR_QUANTUM,
+)
+
+
+class _GuildQueue:
+    """One guild's waiting checks, DRR state and metrics"""
+
+    __slots__ = ("guild_id", "weight", "waiting", "deficit", "fresh", "in_flight",
+                 "served", "served_cost", "shed", "wait_total", "wait_max")
+
+    def __init__(self, guild_id: Hashable, weight: float):
+        self.guild_id = guild_id
+        self.weight = weight
+        self.waiting = deque()  # (cost, future, enqueued_at)
+        self.deficit = 0.0
+        self.fresh = True       # True until the guild's current turn has added its quantum
+        self.in_flight = 0
+        # Metrics
+        self.served = 0
+        self.served_cost = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class FairScheduler:
+    """Deficit round robin over guilds for checks that need the API
+
+    At most `max_in_flight` checks are inside the handler at once, and at
+    most `guild_max_in_flight` of them from any one guild. When a slot frees
+    up, guilds with waiting checks are visited in turn. On each turn a guild
+    adds `quantum * weight` to its deficit and is let through for checks
+    costing up to that many estimated tokens. A busy guild's backlog
+    therefore waits in its own queue, and any other guild's next check
+    enters within one round. Each guild can have at most `guild_max_pending`
+    checks waiting. Further checks are shed, and the caller decides what to
+    do with them.
+    """
+
+    def __init__(self, max_in_flight: int = FAIR_MAX_IN_FLIGHT, guild_max_in_flight: int = FAIR_GUILD_MAX_IN_FLIGHT,
+                 guild_max_pending: int = FAIR_GUILD_MAX_PENDING, quantum: int = FAIR_QUANTUM,
+                 weights: Optional[Dict[Hashable, float]] = None, default_weight: float = 1.0):
+        """Initialize the scheduler
+
+        Args:
+            max_in_flight: Checks allowed inside the handler at once, across guilds
+            guild_max_in_flight: Checks allowed inside the handler at once for one guild
+            guild_max_pending: Checks one guild may have waiting before more are shed
+            quantum: Estimated tokens a guild of weight 1 may send per turn
+            weights: {guild_id: weight} relative shares (default: FAIR_GUILD_WEIGHTS)
+            default_weight: Weight of guilds not in `weights`
+
+        Raises:
+            ValueError: If a weight is not positive (the guild could never be served)
+        """
+        self.max_in_flight = max_in_flight
+        self.guild_max_in_flight = guild_max_in_flight
+        self.guild_max_pending = guild_max_pending
+        self.quantum = quantum
+        self.weights = FAIR_GUILD_WEIGHTS if weights is None else weights
+        self.default_weight = default_weight
+        if not all(weight > 0 for weight in [default_weight, *self.weights.values()]):
+            raise ValueError("Fair scheduler weights must be positive")
+        self.guilds: Dict[Hashable, _GuildQueue] = {}
+        self.active = deque()  # Guild queues with waiting checks, in round-robin order
+        self.in_flight = 0
+
+    def apply_settings(self, settings) -> None:
+        """Swap in new limits from the runtime config (see cogs/runtime_config.py)"""
+        self.max_in_flight = settings["fair_max_in_flight"]
+        self.guild_max_in_flight = settings["fair_guild_max_in_flight"]
+        self.guild_max_pending = settings["fair_guild_max_pending"]
+        self._dispatch()  # Higher limits may let waiting checks in
+
+    def _queue(self, guild_id: Hashable) -> _GuildQueue:
+        queue = self.guilds.get(guild_id)
+        if queue is None:
+            queue = self.guilds[guild_id] = _GuildQueue(guild_id, self.weights.get(guild_id, self.default_weight))
+        return queue
+
+    async def acquire(self, guild_id: Hashable, cost: int) -> bool:
+        """Wait until a guild may send a check costing `cost` estimated tokens
+
+        Returns:
+            True once the check holds a slot (release it with `release`), or
+            False if the guild already has `guild_max_pending` checks waiting
+        """
+        queue = self._queue(guild_id)
+        if len(queue.waiting) >= self.guild_max_pending:
+            queue.shed += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        queue.waiting.append((max(1, cost), future, get_clock().monotonic()))
+        if len(queue.waiting) == 1 and queue not in self.active:
+            self.active.append(queue)
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(guild_id)  # Granted just before the caller was cancelled
+            raise
+        return True
+
+    def release(self, guild_id: Hashable) -> None:
+        """Give back a slot taken by `acquire`"""
+        queue = self.guilds[guild_id]
+        queue.in_flight -= 1
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting checks in deficit round robin order"""
+        stuck = 0  # Turns in a row that could make no progress (guild at its in-flight cap, or no share)
+        while self.in_flight < self.max_in_flight and self.active and stuck < len(self.active):
+            queue = self.active[0]
+            while queue.waiting and queue.waiting[0][1].done():
+                queue.waiting.popleft()  # The caller gave up
+            if not queue.waiting:
+                self.active.popleft()
+                queue.deficit, queue.fresh = 0.0, True
+                continue
+
+            if queue.in_flight >= self.guild_max_in_flight:
+                self.active.rotate(-1)
+                stuck += 1
+                continue
+
+            share = 0.0
+            if queue.fresh:
+                share = self.quantum * queue.weight
+                queue.deficit += share
+                queue.fresh = False
+            cost, future, enqueued_at = queue.waiting[0]
+            if cost > queue.deficit:
+                # Turn over; the deficit carries to the guild's next turn
+                queue.fresh = True
+                self.active.rotate(-1)
+                # A turn that added nothing can't lead to a grant, so a pass of them must not loop forever
+                stuck = 0 if share > 0 else stuck + 1
+                continue
+
+            queue.waiting.popleft()
+            queue.deficit -= cost
+            queue.in_flight += 1
+            self.in_flight += 1
+            wait = get_clock().monotonic() - enqueued_at
+            queue.served += 1
+            queue.served_cost += cost
+            queue.wait_total += wait
+            queue.wait_max = max(queue.wait_max, wait)
+            future.set_result(True)
+            stuck = 0
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        """Return overall counters and the `top` guilds by served cost
+
+        Each guild reports its waiting and in-flight checks, checks served
+        and shed, share of all served cost, and average and maximum wait in ms.
+        """
+        total_cost = sum(queue.served_cost for queue in self.guilds.values()) or 1
+        busiest = sorted(self.guilds.values(), key=lambda queue: queue.served_cost, reverse=True)[:top]
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waiting": sum(len(queue.waiting) for queue in self.guilds.values()),
+            "shed": sum(queue.shed for queue in self.guilds.values()),
+            "guilds": {
+                queue.guild_id: {
+                    "waiting": len(queue.waiting),
+                    "in_flight": queue.in_flight,
+                    "served": queue.served,
+                    "shed": queue.shed,
+                    "share": queue.served_cost / total_cost,
+                    "wait_avg_ms": queue.wait_total / queue.served * 1000 if queue.served else 0.0,
+                    "wait_max_ms": queue.wait_max * 1000,
+                }
+                for queue in busiest
+            },
+        }
+
+
+_fair_scheduler: Optional[FairScheduler] = None
+
+
+def get_fair_scheduler() -> FairScheduler:
+    """Return the process-wide fair scheduler, creating it on first use"""
+    global _fair_scheduler
+    if _fair_scheduler is None:
+        _fair_scheduler = FairScheduler()
+        from cogs.runtime_config import get_runtime_config
+        get_runtime_config().subscribe(_fair_scheduler.apply_settings)
+    return _fair_scheduler
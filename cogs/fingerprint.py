@@ -0,0 +1,134 @@
+import re
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple, Any
+
+from cogs.clock import get_clock
+
+# Discord custom emojis, mentions and anything that is not a letter, digit or space
+_NOISE_PATTERN = re.compile(r'<a?:\w+:\d+>|<[@#][!&]?\d+>|[^\w\s]|_')
+# Runs of the same character ("heyyyyy" -> "hey")
+_REPEAT_PATTERN = re.compile(r'(.)\1+')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+_MASK = (1 << 64) - 1
+# Messages are cut to this many characters before fingerprinting
+_MAX_CHARS = 2000
+
+# Per-bit counters are packed into 16-bit lanes of one big integer so a
+# feature hash can be added with a handful of integer operations instead
+# of a 64-step loop. _SPREAD maps a byte to its bits spread across 8 lanes.
+_LANE = 16
+_SPREAD = [sum(((byte >> i) & 1) << (i * _LANE) for i in range(8)) for byte in range(256)]
+
+
+def normalize(text: str) -> str:
+    """Reduce a message to the parts that matter for near-duplicate detection
+
+    Lowercases the text, strips emoji, mentions and punctuation, collapses
+    repeated letters and whitespace.
+    """
+    text = _NOISE_PATTERN.sub(' ', text[:_MAX_CHARS].lower())
+    text = _REPEAT_PATTERN.sub(r'\1', text)
+    return _SPACE_PATTERN.sub(' ', text).strip()
+
+
+def simhash(text: str) -> int:
+    """Compute a 64-bit SimHash over character trigrams of normalized text
+
+    Similar texts produce fingerprints with a small Hamming distance.
+    """
+    text = normalize(text)
+    if len(text) < 3:
+        return hash(text) & _MASK
+
+    features = {text[i:i + 3] for i in range(len(text) - 2)}
+    counts = 0
+    for feature in features:
+        h = hash(feature) & _MASK
+        for k in range(8):
+            counts += _SPREAD[(h >> (k * 8)) & 0xFF] << (k * 8 * _LANE)
+
+    # A bit is set when more than half of the features have it set
+    threshold = len(features) / 2
+    lane_mask = (1 << _LANE) - 1
+    fingerprint = 0
+    for bit in range(64):
+        if (counts >> (bit * _LANE)) & lane_mask > threshold:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class FingerprintIndex:
+    """Bounded index of recent verdicts keyed by SimHash fingerprint
+
+    Fingerprints are split into `max_distance + 1` bands. Two fingerprints
+    within `max_distance` bits of each other must share at least one band
+    exactly, so a lookup only compares against the few entries in matching
+    band buckets instead of the whole index.
+    """
+
+    def __init__(self, max_distance: int = 3, max_entries: int = 1000, ttl: float = 600):
+        """Initialize the index
+
+        Args:
+            max_distance: Maximum Hamming distance for two messages to count as near-duplicates
+            max_entries: Maximum number of fingerprints kept (oldest are evicted first)
+            ttl: Seconds a verdict can be reused after it was recorded
+        """
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.entries: "OrderedDict[int, Tuple[Any, float]]" = OrderedDict()  # {fingerprint: (verdict, recorded_at)}
+        self.buckets: Dict[Tuple[int, int], Set[int]] = {}  # {(band, band_value): {fingerprint, ...}}
+        self.hits = 0
+        self.misses = 0
+
+    def _band_keys(self, fingerprint: int):
+        band_mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield band, (fingerprint >> (band * self.band_bits)) & band_mask
+
+    def _remove(self, fingerprint: int) -> None:
+        del self.entries[fingerprint]
+        for key in self._band_keys(fingerprint):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del self.buckets[key]
+
+    def lookup(self, text: str) -> Optional[Any]:
+        """Return the verdict of a recent near-duplicate of `text`, or None"""
+        fingerprint = simhash(text)
+        now = get_clock().monotonic()
+
+        for key in self._band_keys(fingerprint):
+            for candidate in self.buckets.get(key, ()):
+                if bin(candidate ^ fingerprint).count('1') > self.max_distance:
+                    continue
+                verdict, recorded_at = self.entries[candidate]
+                if now - recorded_at > self.ttl:
+                    continue
+                self.hits += 1
+                return verdict
+
+        self.misses += 1
+        return None
+
+    def add(self, text: str, verdict: Any) -> None:
+        """Record the verdict for `text`"""
+        fingerprint = simhash(text)
+        if fingerprint in self.entries:
+            self._remove(fingerprint)
+
+        self.entries[fingerprint] = (verdict, get_clock().monotonic())
+        for key in self._band_keys(fingerprint):
+            self.buckets.setdefault(key, set()).add(fingerprint)
+
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def __len__(self) -> int:
+        return len(self.entries)
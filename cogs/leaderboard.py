@@ -0,0 +1,165 @@
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from config import LEADERBOARD_CAPACITY, LEADERBOARD_RULE_CAPACITY
+
+
+class SpaceSaving:
+    """Approximate top-k counter in a fixed number of slots (Metwally et al.'s Space-Saving)
+
+    Keeps at most `capacity` keys. A new key arriving when all slots are
+    taken replaces a key with the lowest count and inherits that count, which
+    is remembered as the new key's maximum overcount. Any key counted more
+    than total / capacity times is guaranteed to be present. Keys are grouped
+    by count (the "stream summary"), so adding one is O(1).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+        self.buckets: Dict[int, Dict[Hashable, None]] = {}  # {count: keys with that count, oldest first}
+        self.min_count = 0
+        self.total = 0
+
+    def _move(self, key: Hashable, old: int, new: int) -> None:
+        if old:
+            bucket = self.buckets[old]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[old]
+                if self.min_count == old:
+                    self.min_count = new  # Counts only grow by one, so the next lowest is `new`
+        self.buckets.setdefault(new, {})[key] = None
+        self.counts[key] = new
+        if not old and (not self.min_count or new < self.min_count):
+            self.min_count = new
+
+    def add(self, key: Hashable) -> None:
+        """Count one occurrence of `key`"""
+        self.total += 1
+        count = self.counts.get(key)
+        if count is not None:
+            self._move(key, count, count + 1)
+            return
+        if len(self.counts) < self.capacity:
+            self.errors[key] = 0
+            self._move(key, 0, 1)
+            return
+        # Replace the oldest key with the lowest count
+        floor = self.min_count
+        bucket = self.buckets[floor]
+        evicted = next(iter(bucket))
+        del bucket[evicted], self.counts[evicted], self.errors[evicted]
+        if not bucket:
+            del self.buckets[floor]
+            self.min_count = floor + 1
+        self.buckets.setdefault(floor + 1, {})[key] = None
+        self.counts[key] = floor + 1
+        self.errors[key] = floor
+
+    def top(self, k: int) -> List[Tuple[Hashable, int, int]]:
+        """Return up to `k` (key, count, max overcount) entries, highest count first"""
+        return sorted(((key, count, self.errors[key]) for key, count in self.counts.items()),
+                      key=lambda entry: entry[1], reverse=True)[:k]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "total": self.total,
+                "entries": [[key, count, self.errors[key]] for key, count in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], capacity: Optional[int] = None) -> "SpaceSaving":
+        """Rebuild a counter saved with `to_dict`, keeping the highest counts if `capacity` shrank"""
+        sketch = cls(capacity or data["capacity"])
+        entries = sorted(data["entries"], key=lambda entry: entry[1], reverse=True)[:sketch.capacity]
+        for key, count, error in reversed(entries):
+            sketch.errors[key] = error
+            sketch._move(key, 0, count)
+        sketch.total = data["total"]
+        return sketch
+
+
+class _GuildCounters:
+    """One guild's violation and compliance counters"""
+
+    __slots__ = ("violators", "compliant", "rule_violations", "rule_checks")
+
+    def __init__(self, capacity: int, rule_capacity: int):
+        self.violators = SpaceSaving(capacity)        # Violations by user id
+        self.compliant = SpaceSaving(capacity)        # Passing messages by user id
+        self.rule_violations = SpaceSaving(rule_capacity)  # Violations by rule name
+        self.rule_checks = SpaceSaving(rule_capacity)      # Checked messages by rule name
+
+
+class Leaderboard:
+    """Per-guild violation and compliance counts in constant memory
+
+    Each guild keeps Space-Saving counters of its top violators, its most
+    compliant users and its most broken rules, so recording a verdict is
+    O(1) and a guild's footprint doesn't grow with its member count. Counts
+    near the bottom of a board may be overestimated by up to the error
+    shown for them. The counters are saved to the event store every
+    LEADERBOARD_SAVE_INTERVAL seconds and restored on startup.
+    """
+
+    STATE_KEY = "leaderboard"
+
+    def __init__(self, capacity: int = LEADERBOARD_CAPACITY, rule_capacity: int = LEADERBOARD_RULE_CAPACITY):
+        """Initialize the leaderboard
+
+        Args:
+            capacity: Users tracked per counter per guild
+            rule_capacity: Rules tracked per counter per guild
+        """
+        self.capacity = capacity
+        self.rule_capacity = rule_capacity
+        self.guilds: Dict[int, _GuildCounters] = {}
+        self.dirty = False  # True if there are counts that haven't been saved
+
+    def record(self, guild_id: Optional[int], user_id: int, rule_name: str, violated: bool) -> None:
+        """Count one checked message"""
+        if guild_id is None:
+            return
+        counters = self.guilds.get(guild_id)
+        if counters is None:
+            counters = self.guilds[guild_id] = _GuildCounters(self.capacity, self.rule_capacity)
+        counters.rule_checks.add(rule_name)
+        if violated:
+            counters.violators.add(user_id)
+            counters.rule_violations.add(rule_name)
+        else:
+            counters.compliant.add(user_id)
+        self.dirty = True
+
+    def board(self, guild_id: int, k: int = 5) -> Optional[Dict[str, Any]]:
+        """Return a guild's top `k` violators, compliant users and rules, or None if it has no counts
+
+        Users and rules are (key, count, max overcount) entries. Rules also
+        carry their violation rate among the messages they checked.
+        """
+        counters = self.guilds.get(guild_id)
+        if counters is None:
+            return None
+        checks = dict((name, count) for name, count, _ in counters.rule_checks.top(self.rule_capacity))
+        return {
+            "checked": counters.rule_checks.total,
+            "violations": counters.violators.total,
+            "violators": counters.violators.top(k),
+            "compliant": counters.compliant.top(k),
+            "rules": [(name, count, error, count / checks[name] if checks.get(name) else 0.0)
+                      for name, count, error in counters.rule_violations.top(k)],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"guilds": [[guild_id, {name: getattr(counters, name).to_dict() for name in _GuildCounters.__slots__}]
+                           for guild_id, counters in self.guilds.items()]}
+
+    def load(self, data: Dict[str, Any]) -> None:
+        """Replace the counts with ones saved by `to_dict`"""
+        self.guilds = {}
+        for guild_id, saved in data.get("guilds", []):
+            counters = self.guilds[guild_id] = _GuildCounters(self.capacity, self.rule_capacity)
+            for name in _GuildCounters.__slots__:
+                if name in saved:
+                    capacity = self.rule_capacity if name.startswith("rule_") else self.capacity
+                    setattr(counters, name, SpaceSaving.from_dict(saved[name], capacity))
+        self.dirty = False
@@ -0,0 +1,243 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import LEXICON_PACK_FILE
+
+# Layout (little-endian, every section 8-byte aligned):
+#   header:    magic, format version, section count
+#   directory: per section, its name, kind, offset and length
+#   sections:  string tables (sorted keys, offsets, open-addressing hash index, key and value bytes)
+#              or arrays (dtype, shape, raw data)
+MAGIC = b"APLXPACK"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sII")
+_ENTRY = struct.Struct("<32sIIQQ")  # name, kind, padding, offset, length
+_TABLE_HEADER = struct.Struct("<II")  # key count, hash slots
+_ARRAY_HEADER = struct.Struct("<8sII")  # dtype, ndim, padding
+KIND_TABLE, KIND_ARRAY = 1, 2
+
+
+def _hash(key: bytes) -> int:
+    # Stable across processes, unlike hash()
+    return zlib.crc32(key)
+
+
+def _align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _encode_table(entries: Dict[str, str]) -> bytes:
+    keys = sorted(key.encode("utf-8") for key in entries)
+    values = [entries[key.decode("utf-8")].encode("utf-8") for key in keys]
+    slots = 1 << max(3, (len(keys) * 2 - 1).bit_length())  # Load factor at most one half
+    index = np.zeros(slots, dtype="<u4")
+    for i, key in enumerate(keys):
+        slot = _hash(key) & (slots - 1)
+        while index[slot]:
+            slot = (slot + 1) & (slots - 1)
+        index[slot] = i + 1
+    key_offsets = np.cumsum([0] + [len(key) for key in keys], dtype="<u4")
+    value_offsets = np.cumsum([0] + [len(value) for value in values], dtype="<u4")
+    return (_TABLE_HEADER.pack(len(keys), slots) + key_offsets.tobytes() + value_offsets.tobytes()
+            + index.tobytes() + b"".join(keys) + b"".join(values))
+
+
+def _encode_array(array: np.ndarray) -> bytes:
+    array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+    header = _ARRAY_HEADER.pack(array.dtype.str.encode("ascii"), array.ndim, 0)
+    shape = struct.pack(f"<{array.ndim}Q", *array.shape)
+    return header + shape + array.tobytes()
+
+
+def write_pack(path: str, tables: Dict[str, Dict[str, str]], arrays: Dict[str, np.ndarray]) -> None:
+    """Write string tables and arrays as a lexicon pack
+
+    The pack is written next to `path` and renamed over it, so processes
+    that have the old pack mapped keep reading it undisturbed.
+    """
+    sections: List[Tuple[str, int, bytes]] = [(name, KIND_TABLE, _encode_table(entries))
+                                              for name, entries in tables.items()]
+    sections += [(name, KIND_ARRAY, _encode_array(array)) for name, array in arrays.items()]
+    offset = _align(_HEADER.size + _ENTRY.size * len(sections))
+    directory, body = [], []
+    for name, kind, data in sections:
+        directory.append(_ENTRY.pack(name.encode("utf-8"), kind, 0, offset, len(data)))
+        padded = data + b"\0" * (_align(len(data)) - len(data))
+        body.append(padded)
+        offset += len(padded)
+    head = _HEADER.pack(MAGIC, FORMAT_VERSION, len(sections)) + b"".join(directory)
+    head += b"\0" * (_align(len(head)) - len(head))
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(head)
+        f.writelines(body)
+    os.replace(temporary, path)
+
+
+class LexiconTable:
+    """A read-only string-to-string table inside a mapped pack
+
+    Nothing is decoded up front: a lookup hashes the key, probes the hash
+    index and decodes just the value it finds.
+    """
+
+    def __init__(self, buffer: memoryview):
+        self.count, self.slots = _TABLE_HEADER.unpack_from(buffer)
+        start = _TABLE_HEADER.size
+        words = self.count + 1
+        self.key_offsets = buffer[start:start + 4 * words].cast("I")
+        start += 4 * words
+        self.value_offsets = buffer[start:start + 4 * words].cast("I")
+        start += 4 * words
+        self.index = buffer[start:start + 4 * self.slots].cast("I")
+        start += 4 * self.slots
+        self.keys_start = start
+        self.values_start = start + self.key_offsets[self.count]
+        self.buffer = buffer
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _find(self, key: str) -> int:
+        encoded = key.encode("utf-8")
+        mask = self.slots - 1
+        slot = _hash(encoded) & mask
+        buffer, key_offsets, keys_start = self.buffer, self.key_offsets, self.keys_start
+        while True:
+            entry = self.index[slot]
+            if not entry:
+                return -1
+            i = entry - 1
+            if buffer[keys_start + key_offsets[i]:keys_start + key_offsets[i + 1]] == encoded:
+                return i
+            slot = (slot + 1) & mask
+
+    def _value(self, i: int) -> str:
+        start = self.values_start
+        return str(self.buffer[start + self.value_offsets[i]:start + self.value_offsets[i + 1]], "utf-8")
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        i = self._find(key)
+        return default if i < 0 else self._value(i)
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) >= 0
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """(key, value) pairs in sorted key order"""
+        start = self.keys_start
+        for i in range(self.count):
+            key = str(self.buffer[start + self.key_offsets[i]:start + self.key_offsets[i + 1]], "utf-8")
+            yield key, self._value(i)
+
+
+class LexiconPack:
+    """A lexicon pack mapped read-only, so every process shares one copy of its pages
+
+    Built by tools/build_lexicon_pack.py. Tables and arrays are views into
+    the mapping: opening the pack reads only its directory.
+    """
+
+    def __init__(self, path: str):
+        """Map a pack
+
+        Raises:
+            ValueError: If the file is not a pack of this format version
+        """
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        self.sections: Dict[str, Tuple[int, memoryview]] = {}
+        self.tables: Dict[str, LexiconTable] = {}
+        try:
+            magic, version, count = _HEADER.unpack_from(self.buffer)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} lexicon pack")
+            for i in range(count):
+                name, kind, _, offset, length = _ENTRY.unpack_from(self.buffer, _HEADER.size + i * _ENTRY.size)
+                if offset + length > len(self.buffer):
+                    raise ValueError(f"{path} is truncated")
+                self.sections[name.rstrip(b"\0").decode("utf-8")] = (kind, self.buffer[offset:offset + length])
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    def table(self, name: str) -> Optional[LexiconTable]:
+        """The string table `name`, or None if the pack doesn't have it"""
+        table = self.tables.get(name)
+        if table is None:
+            kind, buffer = self.sections.get(name, (None, None))
+            if kind != KIND_TABLE:
+                return None
+            table = self.tables[name] = LexiconTable(buffer)
+        return table
+
+    def array(self, name: str) -> Optional[np.ndarray]:
+        """The array `name` as a read-only view of the mapping, or None if the pack doesn't have it"""
+        kind, buffer = self.sections.get(name, (None, None))
+        if kind != KIND_ARRAY:
+            return None
+        dtype, ndim, _ = _ARRAY_HEADER.unpack_from(buffer)
+        shape = struct.unpack_from(f"<{ndim}Q", buffer, _ARRAY_HEADER.size)
+        start = _ARRAY_HEADER.size + 8 * ndim
+        return np.frombuffer(buffer[start:], dtype=np.dtype(dtype.rstrip(b"\0").decode("ascii"))).reshape(shape)
+
+    def meta(self) -> Dict[str, str]:
+        """What the pack was built from (library versions, encodings), see tools/build_lexicon_pack.py"""
+        table = self.table("meta")
+        return dict(table.items()) if table else {}
+
+    def close(self) -> None:
+        """Unmap the pack (only once no tables or arrays from it are in use)"""
+        self.tables.clear()
+        self.sections = {}
+        self.buffer.release()
+        self.mmap.close()
+
+
+_pack: Optional[LexiconPack] = None
+_pack_checked = False
+
+
+def get_lexicon() -> Optional[LexiconPack]:
+    """Return the process-wide lexicon pack, or None if LEXICON_PACK_FILE is missing or unreadable
+
+    Callers fall back to loading their data from the original libraries.
+    """
+    global _pack, _pack_checked
+    if not _pack_checked:
+        _pack_checked = True
+        if sys.byteorder != "little":
+            logging.warning("Lexicon packs are little-endian; loading lexicons from their libraries instead")
+        elif LEXICON_PACK_FILE and os.path.exists(LEXICON_PACK_FILE):
+            try:
+                _pack = LexiconPack(LEXICON_PACK_FILE)
+            except (OSError, ValueError, struct.error) as e:
+                logging.warning(f"Ignoring lexicon pack {LEXICON_PACK_FILE}: {e}")
+    return _pack
+
+
+def emoji_char_test() -> Callable[[str], bool]:
+    """Return a test for single characters that are emojis (keys of emoji.EMOJI_DATA)
+
+    Uses the pack's code point bitmap if there is one, so emoji.EMOJI_DATA is never loaded.
+    """
+    pack = get_lexicon()
+    bitmap = pack.array("emoji_chars") if pack else None
+    if bitmap is not None:
+        bits = memoryview(bitmap)
+        size = len(bits)
+
+        def test(char: str) -> bool:
+            code = ord(char)
+            return (code >> 3) < size and bool(bits[code >> 3] >> (code & 7) & 1)
+        return test
+    import emoji
+    return emoji.EMOJI_DATA.__contains__
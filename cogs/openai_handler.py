@@ -1,90 +1,776 @@
 import openai
 import logging
 import asyncio
-import time
-from datetime import datetime, timedelta
+import re
+from collections import Counter
 from typing import List, Dict, Optional, Tuple, Any
+from cogs.api_scheduler import APIScheduler, get_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from cogs.fingerprint import FingerprintIndex
+from cogs.channel_state import ChannelStateStore
+from cogs.backends import BackendRouter, Completion, CompletionRequest, InferenceBackend, build_router
+from cogs.tracing import get_tracer
+from cogs.runtime_config import get_runtime_config
+from cogs.fair_scheduler import get_fair_scheduler
+from cogs.shadow import ShadowEvaluator
+from cogs.clock import Clock, get_clock
+from cogs.prompts import PromptBuilder, rule_digest
+from config import (OPENAI_BASE_URL, NEAR_DUPLICATE_RULE_TYPES, NEAR_DUPLICATE_MAX_DISTANCE, NEAR_DUPLICATE_CACHE_SIZE,
+                    NEAR_DUPLICATE_TTL)
+from config import CHANNEL_STATE_MAX_ENTRIES, LONG_MESSAGE_POLICIES
+
+# Shared clients, so handlers reuse one connection pool per endpoint
+_clients: Dict[Tuple[str, Optional[str]], openai.AsyncOpenAI] = {}
+
+
+def get_client(api_key: str, base_url: Optional[str] = OPENAI_BASE_URL) -> openai.AsyncOpenAI:
+    """Return the shared AsyncOpenAI client for an API key and endpoint, creating it on first use
+    
+    Args:
+        api_key: The OpenAI API key
+        base_url: Alternative chat-completions endpoint (default: OPENAI_BASE_URL)
+    """
+    key = (api_key, base_url)
+    if key not in _clients:
+        _clients[key] = openai.AsyncOpenAI(api_key=api_key, base_url=base_url)
+    return _clients[key]
+
+
+def release_client(client: openai.AsyncOpenAI) -> None:
+    """Drop a client that is being closed from the shared clients, so later callers get a fresh one"""
+    for key, cached in list(_clients.items()):
+        if cached is client:
+            del _clients[key]
+
+
+# Where a long message may be split: after sentence-ending punctuation, or at line breaks
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_chunks(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most `max_chars`, breaking between sentences where possible
+    
+    Consecutive sentences are packed into the same chunk. Sentences longer
+    than a chunk are broken between words, and words longer than a chunk are cut.
+    """
+    pieces = []
+    for sentence in _SENTENCE_BREAK.split(text):
+        sentence = sentence.strip()
+        if len(sentence) <= max_chars:
+            if sentence:
+                pieces.append(sentence)
+            continue
+        piece = ""
+        for word in sentence.split():
+            while len(word) > max_chars:
+                if piece:
+                    pieces.append(piece)
+                    piece = ""
+                pieces.append(word[:max_chars])
+                word = word[max_chars:]
+            if not word:
+                continue
+            if piece and len(piece) + 1 + len(word) > max_chars:
+                pieces.append(piece)
+                piece = word
+            else:
+                piece = f"{piece} {word}" if piece else word
+        if piece:
+            pieces.append(piece)
+    
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def combine_verdicts(policy: str, verdicts: List[Optional[Tuple[bool, Optional[str]]]]) -> Optional[Tuple[bool, Optional[str]]]:
+    """Combine the chunk verdicts of one message under a LONG_MESSAGE_POLICIES policy
+    
+    Chunks without a usable verdict are left out of the vote.
+    
+    Args:
+        policy: "any", "all" or "majority"
+        verdicts: A (complies, violation_reason) verdict or None per chunk
+        
+    Returns:
+        The message's verdict, or None if no chunk has one
+    """
+    decided = [verdict for verdict in verdicts if verdict is not None]
+    if not decided:
+        return None
+    reasons = [reason for complies, reason in decided if not complies]
+    if policy == "all":
+        violates = len(reasons) == len(decided)
+    elif policy == "majority":
+        violates = 2 * len(reasons) > len(decided)
+    else:
+        violates = bool(reasons)
+    return (False, reasons[0]) if violates else (True, None)
+
+
+class PendingCheck:
+    """A message waiting in a buffer or cross-channel batch for its verdict
+    
+    Holds only what the check needs (the channel id, the interned rule digest
+    and the content) rather than Discord objects or the rule text.
+    """
+    
+    __slots__ = ("content", "channel_id", "digest", "future", "callback", "wait_span")
+    
+    def __init__(self, content: str, channel_id: int, digest: str, future: Optional[asyncio.Future] = None,
+                 callback=None, wait_span=None):
+        self.content = content
+        self.channel_id = channel_id
+        self.digest = digest
+        self.future = future      # Resolved with the verdict (cross-channel batches)
+        self.callback = callback  # Called with the verdict (per-channel buffers)
+        self.wait_span = wait_span
+    
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+    
+    async def resolve(self, content: str, complies: bool, reason: Optional[str]) -> None:
+        """Deliver the verdict (usable as a process_batch callback)"""
+        if self.future is not None:
+            if not self.future.done():
+                self.future.set_result((complies, reason))
+        elif self.callback is not None:
+            await self.callback(content, complies, reason)
+    
+    def end_wait(self, error: Optional[str] = None) -> None:
+        if self.wait_span:
+            self.wait_span.end(error)
+
 
 class OpenAIHandler:
     """Handler for OpenAI API calls with cost-saving optimizations"""
     
-    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo"):
+    def __init__(self, api_key: str, model: Optional[str] = None, scheduler: Optional[APIScheduler] = None,
+                 base_url: Optional[str] = OPENAI_BASE_URL, router: Optional[BackendRouter] = None,
+                 clock: Optional[Clock] = None):
         """Initialize the OpenAI handler
         
         Args:
             api_key: The OpenAI API key
-            model: The model to use for completions (default: gpt-3.5-turbo)
-        """
-        self.client = openai.AsyncOpenAI(api_key=api_key)
-        self.model = model
-        self.message_buffer = {}  # {channel_id: [message1, message2, ...]}
-        self.buffer_timers = {}   # {channel_id: asyncio.Task}
-        self.last_api_call = {}   # {channel_id: datetime}
-        self.rate_limit_delay = 1.0  # Seconds between API calls to same channel
-        self.max_buffer_size = 5  # Max number of messages to buffer before processing
-        self.buffer_timeout = 2.0  # Seconds to wait before processing buffered messages
-        self.max_tokens = 4000    # Max tokens allowed in a single API call
-        self.token_safety_margin = 400  # Tokens to reserve for the response
+            model: The model to use for completions (default: the openai_model runtime setting, followed live)
+            scheduler: The budget scheduler to send metered requests through (default: the shared one)
+            base_url: Alternative chat-completions endpoint, e.g. the local stub server (default: OPENAI_BASE_URL)
+            router: The inference backends to route requests to (default: every configured backend)
+            clock: What batching waits and rate limits sleep on (default: the process-wide clock)
+        """
+        runtime_config = get_runtime_config()
+        self.fixed_model = model
+        self.router = router or build_router(api_key, model or runtime_config["openai_model"], base_url)
+        self.scheduler = scheduler or get_scheduler()
+        self.fair_scheduler = get_fair_scheduler()  # Shares the checks in progress between guilds
+        self.rule_keys = {}  # {rule_text: rule type}, selects the routing table for a rule
+        self.prompts = PromptBuilder()  # Renders each rule's cacheable prompt prefix
+        self.rule_uses = Counter()  # {rule_text: number of live rules using it}
+        self.shadow = ShadowEvaluator(self)  # Candidate backends judging the same messages on the side
+        self.tracer = get_tracer()
+        self.clock = clock or get_clock()
+        # Per-channel state; entries are removed once a channel has nothing pending
+        # An evicted buffer is still checked, so its callers get their verdicts
+        self.message_buffer = ChannelStateStore("message_buffer", CHANNEL_STATE_MAX_ENTRIES,
+                                                on_evict=self.flush_evicted)  # {channel_id: [PendingCheck, ...]}
+        self.buffer_timers = ChannelStateStore("buffer_timers", CHANNEL_STATE_MAX_ENTRIES,
+                                               on_evict=lambda _, task: task.cancel())  # {channel_id: asyncio.Task}
+        # Only needed until rate_limit_delay (at most 60 seconds) has passed
+        self.last_api_call = ChannelStateStore("last_api_call", CHANNEL_STATE_MAX_ENTRIES, ttl=60.0)  # {channel_id: datetime}
+        self.verdict_indexes = {}  # {rule_text: FingerprintIndex} of recent verdicts
+        
+        # Cross-channel batching of messages checked against the same rule
+        self.pending_batches = {}  # {rule_digest: [PendingCheck, ...]}
+        self.rule_texts = {}       # {rule_digest: rule_text} of every rule checked through a buffer or batch
+        self.batch_timers = {}     # {rule_digest: asyncio.Task}
+        self.flush_tasks = set()   # Batches being sent right now
+        self.draining = False      # Set on shutdown: everything waiting is sent at once
         
         # Rough token estimation (character count / 4)
         self.token_estimator = lambda text: len(text) // 4
+        
+        # Buffer, batch and token limits come from the runtime config and follow its changes
+        runtime_config.subscribe(self.apply_settings)
     
-    async def check_rule_compliance(self, rule_text: str, message_content: str) -> Tuple[bool, Optional[str]]:
-        """Check if a message complies with a rule
+    def apply_settings(self, settings) -> None:
+        """Swap in new tunables from the runtime config (see cogs/runtime_config.py)
+        
+        Args:
+            settings: The runtime config's current values
+        """
+        self.max_buffer_size = settings["max_buffer_size"]          # Max number of messages to buffer before processing
+        self.buffer_timeout = settings["buffer_timeout"]            # Seconds to wait before processing buffered messages
+        self.rate_limit_delay = settings["rate_limit_delay"]        # Seconds between API calls to same channel
+        self.max_tokens = settings["max_tokens"]                    # Max tokens allowed in a single API call
+        self.token_safety_margin = settings["token_safety_margin"]  # Tokens to reserve for the response
+        self.max_batch_size = settings["max_batch_size"]            # Max messages merged into one request
+        self.batch_wait = settings["batch_wait"]  # Max seconds the oldest pending message waits for a batch to fill
+        self.long_message_chunk_tokens = settings["long_message_chunk_tokens"]  # Max tokens per chunk of a long message
+        self.long_message_max_chunks = settings["long_message_max_chunks"]      # Most chunks checked per message
+        # Longer messages are checked in chunks right away instead of waiting in a buffer or batch
+        self.max_content_chars = max(0, self.max_tokens - self.token_safety_margin) * 4
+        
+        openai_backend = self.router.backend("openai")
+        if openai_backend is not None and self.fixed_model is None:
+            openai_backend.model = settings["openai_model"]
+    
+    def verdict_index(self, rule_text: str) -> Optional[FingerprintIndex]:
+        """Get the near-duplicate verdict index for a rule
+        
+        Args:
+            rule_text: The rule whose verdicts the index holds
+            
+        Returns:
+            The index, or None if the rule's type doesn't reuse verdicts (see NEAR_DUPLICATE_RULE_TYPES)
+        """
+        if self.rule_keys.get(rule_text) not in NEAR_DUPLICATE_RULE_TYPES:
+            return None
+        if rule_text not in self.verdict_indexes:
+            self.verdict_indexes[rule_text] = FingerprintIndex(
+                NEAR_DUPLICATE_MAX_DISTANCE, NEAR_DUPLICATE_CACHE_SIZE, NEAR_DUPLICATE_TTL
+            )
+        return self.verdict_indexes[rule_text]
+    
+    def cached_verdict(self, rule_text: str, message_content: str) -> Optional[Tuple[bool, Optional[str]]]:
+        """Return the verdict of a recently judged near-duplicate of a message, or None"""
+        index = self.verdict_index(rule_text)
+        return index.lookup(message_content) if index is not None else None
+    
+    def remember_verdict(self, rule_text: str, message_content: str, verdict: Tuple[bool, Optional[str]]) -> None:
+        """Record a verdict for reuse by near-duplicates of the message"""
+        index = self.verdict_index(rule_text)
+        if index is not None:
+            index.add(message_content, verdict)
+    
+    def clear_channel(self, channel_id: int) -> None:
+        """Drop all buffered messages and timers for a channel (e.g. when its rule ends)
+        
+        Args:
+            channel_id: The channel ID to clear
+        """
+        timer = self.buffer_timers.pop(channel_id)
+        if timer and not timer.done():
+            timer.cancel()
+        for check in self.message_buffer.pop(channel_id, []):
+            check.end_wait("channel cleared")
+        self.last_api_call.pop(channel_id)
+        
+        # Let the channel's messages waiting in cross-channel batches through
+        for digest, checks in self.pending_batches.items():
+            for check in checks:
+                if check.channel_id == channel_id and not check.done:
+                    check.future.set_result((True, None))
+                    check.end_wait("channel cleared")
+            self.pending_batches[digest] = [check for check in checks if check.channel_id != channel_id]
+    
+    def budget_exhausted(self) -> bool:
+        """Check if the daily API budget is used up and callers should use local checks"""
+        return self.scheduler.budget_exhausted()
+    
+    def register_rule(self, rule_key: str, rule_text: str, local_check=None) -> None:
+        """Tell the router which routing table a rule's requests use, and count one more use of the rule
+        
+        Args:
+            rule_key: The rule type (a key of INFERENCE_ROUTES)
+            rule_text: The rule text requests are made for
+            local_check: Optional function returning None if a message complies, or a violation
+                reason, used by the rule-based backend
+        """
+        self.rule_keys[rule_text] = rule_key
+        self.rule_uses[rule_text] += 1
+        rules_backend = self.router.backend("rules")
+        if local_check is not None and rules_backend is not None:
+            rules_backend.register(rule_text, local_check)
+    
+    def unregister_rule(self, rule_text: str) -> None:
+        """Release one use of an ended rule, dropping its state once every rule using its text has ended"""
+        if self.rule_uses[rule_text] <= 1:
+            self.rule_uses.pop(rule_text, None)
+            self.verdict_indexes.pop(rule_text, None)
+            self.forget_rule(rule_text)
+        else:
+            self.rule_uses[rule_text] -= 1
+    
+    def forget_rule(self, rule_text: str) -> None:
+        """Drop the routing, local check and digest of a rule no live rule uses
+        
+        Kept while messages checked against the rule still wait in a buffer or
+        batch; the flush that sends them calls this again.
+        
+        Args:
+            rule_text: The rule text to forget
+        """
+        if rule_text in self.rule_uses:
+            return
+        digest = rule_digest(rule_text)
+        if any(not check.done for check in self.pending_batches.get(digest, [])):
+            return
+        if any(check.digest == digest for checks in self.message_buffer.values() for check in checks):
+            return
+        self.pending_batches.pop(digest, None)
+        self.rule_texts.pop(digest, None)
+        self.rule_keys.pop(rule_text, None)
+        rules_backend = self.router.backend("rules")
+        if rules_backend is not None:
+            rules_backend.unregister(rule_text)
+    
+    def begin_drain(self) -> int:
+        """Stop waiting for buffers and batches to fill and send everything pending now (on shutdown)
+        
+        Checks submitted after this are sent right away too.
+        
+        Returns:
+            The number of messages that were waiting
+        """
+        self.draining = True
+        waiting = 0
+        for channel_id in self.buffer_timers.keys():
+            timer = self.buffer_timers.pop(channel_id)
+            if timer and not timer.done():
+                timer.cancel()
+        for channel_id in self.message_buffer.keys():
+            waiting += len(self.message_buffer.get(channel_id, []))
+            self._spawn_flush(self.process_buffer(channel_id))
+        for digest, timer in list(self.batch_timers.items()):
+            if not timer.done():
+                timer.cancel()
+        self.batch_timers.clear()
+        for digest, checks in list(self.pending_batches.items()):
+            waiting += sum(not check.done for check in checks)
+            self._spawn_flush(self.flush_batch(digest))
+        return waiting
+    
+    def _spawn_flush(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+    
+    async def drain(self, timeout: float) -> Dict[str, int]:
+        """Send everything pending, wait up to `timeout` seconds for the answers, then close
+        
+        Returns:
+            How many messages were waiting when the drain began ("waiting"), and
+            how many were still unanswered at the deadline ("abandoned"); those
+            are let through
+        """
+        waiting = self.begin_drain()
+        deadline = self.clock.monotonic() + timeout
+        # Flushes can start more flushes (e.g. a long message's chunks), so wait until none are left
+        while self.flush_tasks and self.clock.monotonic() < deadline:
+            await self.clock.wait(self.flush_tasks, deadline - self.clock.monotonic())
+        
+        abandoned = sum(len(checks) for checks in self.message_buffer.values())
+        for task in list(self.flush_tasks):
+            task.cancel()
+        for checks in self.pending_batches.values():
+            for check in checks:
+                if not check.done:
+                    abandoned += 1
+                    if check.future is not None:
+                        check.future.set_result((True, None))
+                    check.end_wait("shutdown")
+        self.pending_batches.clear()
+        await self.close()
+        return {"waiting": waiting, "abandoned": abandoned}
+    
+    async def close(self) -> None:
+        """Stop shadow evaluations and close every backend's connections"""
+        self.shadow.close()
+        await self.router.close()
+    
+    async def create_completion(self, backend: InferenceBackend, request: CompletionRequest,
+                                priority: int = PRIORITY_INTERACTIVE,
+                                want_confidence: bool = False) -> Optional[Completion]:
+        """Send a request to a backend, through the budget scheduler if the backend is metered
+        
+        Args:
+            backend: The backend to ask
+            request: The request to send
+            priority: Scheduling priority (PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND)
+            want_confidence: Whether to ask the backend for per-verdict confidence
+            
+        Returns:
+            The backend's answer, or None if the daily budget is exhausted
+        """
+        with self.tracer.span("inference", **{"backend": backend.name, "messages": len(request.contents)}):
+            if not backend.metered:
+                return await backend.complete(request, want_confidence)
+            
+            estimated_tokens = self.token_estimator(request.prefix) + self.token_estimator(request.prompt) + request.max_tokens
+            with self.tracer.span("scheduler.acquire", **{"tokens.estimated": estimated_tokens}):
+                acquired = await self.scheduler.acquire(estimated_tokens, priority)
+            if not acquired:
+                logging.info("Daily API budget exhausted, skipping completion request")
+                return None
+            
+            completion = await backend.complete(request, want_confidence)
+            self.scheduler.record_usage(completion.total_tokens or estimated_tokens)
+            return completion
+    
+    def build_prompt(self, rule_text: str, message_content: str) -> str:
+        """Create the variable part of the prompt for checking one message against a rule
         
         Args:
             rule_text: The rule to check against
             message_content: The message content to check
+        """
+        return self.prompts.single(rule_text, message_content)
+    
+    def parse_answer(self, text: str, count: int) -> List[Optional[Tuple[bool, Optional[str]]]]:
+        """Parse a single or "MESSAGE i:" answer into one verdict per message
+        
+        Args:
+            text: The backend's answer
+            count: How many messages the request held
             
         Returns:
-            Tuple of (complies, violation_reason)
-            complies: True if the message complies with the rule, False otherwise
-            violation_reason: Explanation of the violation if not compliant, None otherwise
+            A (complies, violation_reason) verdict per message, or None where the answer was unusable
         """
-        # Check if message is too large for the API (reserve tokens for the rule and response)
-        estimated_tokens = self.token_estimator(message_content) + self.token_estimator(rule_text) + self.token_safety_margin
-        if estimated_tokens > self.max_tokens:
-            logging.warning(f"Message too large for API check: ~{estimated_tokens} tokens")
-            return True, None  # Skip checking very large messages
+        def parse_verdict(answer: str) -> Optional[Tuple[bool, Optional[str]]]:
+            if answer.startswith("YES"):
+                return True, None
+            if answer.startswith("NO:"):
+                return False, answer[3:].strip()
+            return None
         
-        try:
-            # Create the prompt for OpenAI
-            prompt = f"""
-            You are April Fools AI Mod, a bot that enforces fun rules on a Discord server.
+        if count == 1 and not text.startswith("MESSAGE "):
+            return [parse_verdict(text)]
+        
+        lines = text.split("\n")
+        verdicts = []
+        for i in range(count):
+            message_prefix = f"MESSAGE {i+1}: "
             
-            RULE: {rule_text}
+            # Find the corresponding line in the response
+            for line in lines:
+                if line.startswith(message_prefix):
+                    verdicts.append(parse_verdict(line[len(message_prefix):].strip()))
+                    break
+            else:
+                verdicts.append(None)
+        return verdicts
+    
+    async def judge(self, rule_text: str, contents: List[str],
+                    priority: int = PRIORITY_INTERACTIVE) -> List[Optional[Tuple[bool, Optional[str]]]]:
+        """Get verdicts for messages from the cheapest backend that is confident about them
+        
+        Each backend in the rule's route answers the messages still undecided;
+        verdicts below the route's confidence threshold are asked again of the
+        next backend, and the last backend's answers are final. Long messages
+        only go to the last backend. A failing
+        backend passes all of its messages on, except the last, whose errors
+        are raised to the caller.
+        
+        Args:
+            rule_text: The rule to check against
+            contents: The message contents to check
+            priority: Scheduling priority for metered requests
             
-            USER MESSAGE: "{message_content}"
+        Returns:
+            A (complies, violation_reason) verdict per message, or None where no
+            backend gave a usable answer or the budget ran out
+        """
+        verdicts: List[Optional[Tuple[bool, Optional[str]]]] = [None] * len(contents)
+        # For shadow evaluation: which backend decided each message, how long it took and what it cost
+        decisions: List[Optional[Tuple[str, float, float]]] = [None] * len(contents)
+        costs = [0.0] * len(contents)
+        started = self.clock.monotonic()
+        rule_key = self.rule_keys.get(rule_text)
+        plan = self.router.plan(rule_key)
+        min_confidence = self.router.min_confidence(rule_key)
+        # Long messages skip the cheap backends and join at the last one
+        pending, skipped = [], []
+        for i, content in enumerate(contents):
+            (pending if self.router.is_short(rule_key, content) else skipped).append(i)
+        
+        for step, backend in enumerate(plan):
+            is_last = step == len(plan) - 1
+            if is_last and skipped:
+                pending = sorted(pending + skipped)
+            if not pending:
+                continue
+            subset = [contents[i] for i in pending]
+            request = self.build_request(rule_text, subset)
             
-            Does this message follow the rule? Respond with:
-            - "YES" if the message follows the rule
-            - "NO: [brief explanation of violation]" if the message violates the rule
+            try:
+                completion = await self.create_completion(backend, request, priority, want_confidence=not is_last)
+            except Exception as e:
+                if is_last:
+                    raise
+                logging.warning(f"Backend {backend.name} failed, escalating: {e}")
+                self.router.note(backend, escalated=True)
+                continue
+            if completion is None:
+                break  # Over budget, leave the rest undecided
             
-            Keep your explanation very brief and humorous.
-            """
+            undecided = []
+            elapsed_ms = (self.clock.monotonic() - started) * 1000
+            cost_share = completion.total_tokens / 1000 * backend.cost_per_1k_tokens / len(subset)
+            answers = self.parse_answer(completion.text, len(subset))
+            for index, verdict, confidence in zip(pending, answers, completion.confidences):
+                costs[index] += cost_share
+                if is_last or (verdict is not None and confidence >= min_confidence):
+                    verdicts[index] = verdict
+                    decisions[index] = (backend.name, elapsed_ms, costs[index])
+                else:
+                    undecided.append(index)
+            self.router.note(backend, escalated=bool(undecided))
             
-            # Call OpenAI API using the new client
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are April Fools AI Mod, a strict but humorous enforcer of rules."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=150
-            )
+            pending = undecided
+        
+        self.shadow.observe(rule_text, contents, verdicts, decisions)
+        return verdicts
+    
+    def build_request(self, rule_text: str, contents: List[str]) -> CompletionRequest:
+        """Build the request checking one or more messages against a rule
+        
+        Args:
+            rule_text: The rule to check against
+            contents: The message contents, in order
+        """
+        prefix = self.prompts.prefix(rule_text)
+        if len(contents) == 1:
+            return CompletionRequest(self.build_prompt(rule_text, contents[0]), 150, rule_text, contents, prefix)
+        # Leave room for one verdict line per message
+        return CompletionRequest(self.build_batch_prompt(rule_text, contents),
+                                 max(300, 40 * len(contents)), rule_text, contents, prefix)
+    
+    async def check_rule_compliance(self, rule_text: str, message_content: str,
+                                    priority: int = PRIORITY_INTERACTIVE) -> Tuple[bool, Optional[str]]:
+        """Check if a message complies with a rule
+        
+        Args:
+            rule_text: The rule to check against
+            message_content: The message content to check
+            priority: Scheduling priority for the API request
             
-            result = response.choices[0].message.content.strip()
+        Returns:
+            Tuple of (complies, violation_reason)
+            complies: True if the message complies with the rule, False otherwise
+            violation_reason: Explanation of the violation if not compliant, None otherwise
+        """
+        # Messages too large for one request (with the prompt and response) are checked in chunks
+        estimated_tokens = self.token_estimator(message_content) + self.prompt_overhead(rule_text) + self.token_safety_margin
+        if estimated_tokens > self.max_tokens:
+            return await self.check_long_message(rule_text, message_content, priority)
+        
+        # Reuse the verdict of a recently judged near-duplicate
+        cached = self.cached_verdict(rule_text, message_content)
+        if cached is not None:
+            return cached
+        
+        try:
+            verdict = (await self.judge(rule_text, [message_content], priority))[0]
+            if verdict is None:
+                return True, None  # Over budget or no usable answer, let the message through
             
-            # If the message doesn't follow the rule
-            if result.startswith("NO:"):
-                return False, result[3:].strip()
-            else:
-                return True, None
+            self.remember_verdict(rule_text, message_content, verdict)
+            return verdict
                 
         except Exception as e:
             logging.error(f"Error checking message against rule: {e}")
             return True, None  # In case of API errors, let messages through
     
+    def content_budget(self, rule_text: str) -> int:
+        """Return how many tokens of message content fit in one batched request for a rule"""
+        overhead = self.prompt_overhead(rule_text) + self.token_safety_margin
+        return max(1, self.max_tokens - overhead)
+    
+    def pack_batches(self, rule_text: str, contents: List[str]) -> List[List[int]]:
+        """Group messages, in order, into batches whose prompts fit in `max_tokens`
+        
+        Args:
+            rule_text: The rule to check against
+            contents: The message contents
+            
+        Returns:
+            Lists of indexes into `contents`, one per request
+        """
+        budget = self.content_budget(rule_text)
+        batches, batch, used = [], [], 0
+        for i, content in enumerate(contents):
+            cost = self.token_estimator(f'MESSAGE {len(batch) + 1}: "{content}"\n')
+            if batch and used + cost > budget:
+                batches.append(batch)
+                batch, used = [], 0
+            batch.append(i)
+            used += cost
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def chunk_message(self, rule_text: str, message_content: str) -> List[str]:
+        """Split a long message into the chunks that will be judged
+        
+        Chunks hold at most `long_message_chunk_tokens` (and never more than
+        fits in one request). Past `long_message_max_chunks`, the chunks judged
+        are spread evenly over the message, always including the first and last.
+        """
+        chunk_tokens = min(self.long_message_chunk_tokens, self.content_budget(rule_text) - 10)
+        chunks = split_chunks(message_content, max(1, chunk_tokens) * 4)
+        limit = self.long_message_max_chunks
+        if len(chunks) > limit:
+            if limit == 1:
+                return chunks[:1]
+            step = (len(chunks) - 1) / (limit - 1)
+            chunks = [chunks[round(i * step)] for i in range(limit)]
+        return chunks
+    
+    async def check_long_message(self, rule_text: str, message_content: str,
+                                 priority: int = PRIORITY_INTERACTIVE) -> Tuple[bool, Optional[str]]:
+        """Check a message too long for one request by judging it in chunks
+        
+        The chunks (see chunk_message) are judged as batched requests, as few
+        as fit in `max_tokens`, and their verdicts are combined with the rule
+        type's LONG_MESSAGE_POLICIES entry. Cost grows linearly with the
+        message's length, up to `long_message_max_chunks` chunks.
+        
+        Args:
+            rule_text: The rule to check against
+            message_content: The message content to check
+            priority: Scheduling priority for the API requests
+            
+        Returns:
+            Tuple of (complies, violation_reason), as for check_rule_compliance
+        """
+        cached = self.cached_verdict(rule_text, message_content)
+        if cached is not None:
+            return cached
+        
+        chunks = self.chunk_message(rule_text, message_content)
+        policy = LONG_MESSAGE_POLICIES.get(self.rule_keys.get(rule_text), LONG_MESSAGE_POLICIES["default"])
+        try:
+            with self.tracer.span("long_message", **{"chunks": len(chunks), "policy": policy}):
+                verdicts = []
+                for batch in self.pack_batches(rule_text, chunks):
+                    verdicts.extend(await self.judge(rule_text, [chunks[i] for i in batch], priority))
+        except Exception as e:
+            logging.error(f"Error checking long message against rule: {e}")
+            return True, None  # In case of API errors, let messages through
+        
+        verdict = combine_verdicts(policy, verdicts)
+        if verdict is None:
+            return True, None  # Over budget or no usable answer, let the message through
+        self.remember_verdict(rule_text, message_content, verdict)
+        return verdict
+    
+    async def submit(self, rule_text: str, channel_id: int, message_content: str,
+                     guild_id: Optional[int] = None) -> Tuple[bool, Optional[str]]:
+        """Check a message as part of a batch shared by every channel using the same rule
+        
+        Messages for the same rule text are merged into one request across all
+        channels, so long rule prompts are paid once per batch. A batch is sent
+        when it is full or `batch_wait` seconds after its first message arrived,
+        which bounds the extra latency for every channel. Before joining a
+        batch, a message waits for its guild's turn in the fair scheduler, so
+        a busy guild can't crowd out the others.
+        
+        Args:
+            rule_text: The rule to check against
+            channel_id: The channel ID where the message was sent
+            message_content: The message content to check
+            guild_id: The guild the message was sent in (None for DMs and tools)
+            
+        Returns:
+            Tuple of (complies, violation_reason), as for check_rule_compliance
+        """
+        # Reuse the verdict of a recently judged near-duplicate
+        cached = self.cached_verdict(rule_text, message_content)
+        if cached is not None:
+            return cached
+        
+        with self.tracer.span("fair.wait", **{"guild.id": guild_id or 0}):
+            granted = await self.fair_scheduler.acquire(guild_id, self.token_estimator(message_content))
+        if not granted:
+            # The guild's queue is full; use the rule's keyword check, if it has one
+            rules_backend = self.router.backend("rules")
+            local_check = rules_backend.checks.get(rule_text) if rules_backend is not None else None
+            reason = local_check(message_content) if local_check else None
+            return reason is None, reason
+        
+        try:
+            if len(message_content) > self.max_content_chars:
+                return await self.check_long_message(rule_text, message_content)
+            return await self.join_batch(rule_text, channel_id, message_content)
+        finally:
+            self.fair_scheduler.release(guild_id)
+    
+    async def join_batch(self, rule_text: str, channel_id: int, message_content: str) -> Tuple[bool, Optional[str]]:
+        """Add a message to its rule's cross-channel batch and wait for the verdict (see submit)"""
+        digest = rule_digest(rule_text)
+        future = asyncio.get_running_loop().create_future()
+        self.rule_texts[digest] = rule_text
+        wait_span = self.tracer.start_span("batch.wait", **{"rule.digest": digest})
+        self.pending_batches.setdefault(digest, []).append(
+            PendingCheck(message_content, channel_id, digest, future=future, wait_span=wait_span)
+        )
+        
+        if self.draining or len(self.pending_batches[digest]) >= self.max_batch_size:
+            timer = self.batch_timers.pop(digest, None)
+            if timer and not timer.done():
+                timer.cancel()
+            task = asyncio.create_task(self.flush_batch(digest))
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+        elif digest not in self.batch_timers:
+            # The timer starts with the first message and is not reset by later ones
+            self.batch_timers[digest] = asyncio.create_task(self.batch_timeout_task(digest))
+        
+        return await future
+    
+    async def batch_timeout_task(self, digest: str) -> None:
+        """Task to send a cross-channel batch once its first message has waited `batch_wait`
+        
+        Args:
+            digest: The rule digest of the batch
+        """
+        await self.clock.sleep(self.batch_wait)
+        if self.batch_timers.get(digest) is asyncio.current_task():
+            del self.batch_timers[digest]
+        await self.flush_batch(digest)
+    
+    async def flush_batch(self, digest: str) -> None:
+        """Send all pending messages for a rule and route each verdict back to its caller
+        
+        Args:
+            digest: The rule digest of the batch
+        """
+        checks = [check for check in self.pending_batches.pop(digest, []) if not check.done]
+        rule_text = self.rule_texts.get(digest)
+        if not checks or rule_text is None:
+            return
+        
+        # In each traced message's own trace, the wait ends here and the batch request begins
+        request_spans = []
+        for check in checks:
+            if check.wait_span:
+                request_spans.append(self.tracer.start_span("batch.request", check.wait_span.parent,
+                                                            **{"batch.size": len(checks)}))
+                check.end_wait()
+        
+        try:
+            if len(checks) == 1:
+                complies, reason = await self.check_rule_compliance(rule_text, checks[0].content)
+                await checks[0].resolve(checks[0].content, complies, reason)
+            else:
+                await self.process_batch(rule_text, [(check.content, check.resolve) for check in checks])
+        finally:
+            # Never leave a caller waiting, whatever happened above
+            for check in checks:
+                if not check.done:
+                    check.future.set_result((True, None))
+            for span in request_spans:
+                span.end()
+            if rule_text not in self.rule_uses:
+                self.forget_rule(rule_text)
+    
     async def add_to_buffer(self, channel_id: int, rule_text: str, message_content: str, callback) -> None:
         """Add a message to the buffer for batch processing
         
@@ -94,15 +780,27 @@ class OpenAIHandler:
             message_content: The message content to check
             callback: Function to call with the result (message_content, complies, violation_reason)
         """
+        if len(message_content) > self.max_content_chars:
+            await callback(message_content, *await self.check_long_message(rule_text, message_content, PRIORITY_BACKGROUND))
+            return
+        
         # Initialize buffer for this channel if it doesn't exist
         if channel_id not in self.message_buffer:
             self.message_buffer[channel_id] = []
         
         # Add message to buffer
-        self.message_buffer[channel_id].append((message_content, rule_text, callback))
+        digest = rule_digest(rule_text)
+        self.rule_texts[digest] = rule_text
+        wait_span = self.tracer.start_span("buffer.wait", **{"channel.id": channel_id})
+        self.message_buffer[channel_id].append(
+            PendingCheck(message_content, channel_id, digest, callback=callback, wait_span=wait_span)
+        )
         
         # If buffer is full, process it immediately
         if len(self.message_buffer[channel_id]) >= self.max_buffer_size:
+            timer = self.buffer_timers.pop(channel_id)
+            if timer and not timer.done():
+                timer.cancel()
             await self.process_buffer(channel_id)
         else:
             # Otherwise, set/reset a timer to process the buffer after a delay
@@ -117,7 +815,11 @@ class OpenAIHandler:
         Args:
             channel_id: The channel ID whose buffer to process
         """
-        await asyncio.sleep(self.buffer_timeout)
+        await self.clock.sleep(self.buffer_timeout)
+        
+        # This timer is done; drop it so idle channels don't keep an entry
+        if self.buffer_timers.get(channel_id) is asyncio.current_task():
+            self.buffer_timers.pop(channel_id)
         await self.process_buffer(channel_id)
     
     async def process_buffer(self, channel_id: int) -> None:
@@ -127,111 +829,119 @@ class OpenAIHandler:
             channel_id: The channel ID whose buffer to process
         """
         # Check if buffer is empty
-        if channel_id not in self.message_buffer or not self.message_buffer[channel_id]:
+        if not self.message_buffer.get(channel_id):
             return
         
         # Apply rate limiting if needed
-        if channel_id in self.last_api_call:
-            time_since_last_call = (datetime.now() - self.last_api_call[channel_id]).total_seconds()
+        last_call = self.last_api_call.get(channel_id)
+        if last_call is not None and not self.draining:
+            time_since_last_call = (self.clock.now() - last_call).total_seconds()
             if time_since_last_call < self.rate_limit_delay:
-                await asyncio.sleep(self.rate_limit_delay - time_since_last_call)
+                with self.tracer.span("rate_limit.sleep", **{"channel.id": channel_id}):
+                    await self.clock.sleep(self.rate_limit_delay - time_since_last_call)
+        
+        # Take messages out of the buffer (new messages start a fresh entry)
+        messages = self.message_buffer.pop(channel_id, [])
+        await self.check_buffered(messages)
         
-        # Get messages from buffer
-        messages = self.message_buffer[channel_id].copy()
-        self.message_buffer[channel_id] = []
+        # Update last API call timestamp
+        self.last_api_call[channel_id] = self.clock.now()
+    
+    def flush_evicted(self, channel_id: int, checks: List[PendingCheck]) -> None:
+        """Check the messages of a buffer evicted from message_buffer instead of dropping them"""
+        if checks:
+            self._spawn_flush(self.check_buffered(checks))
+    
+    async def check_buffered(self, messages: List[PendingCheck]) -> None:
+        """Check messages taken out of a channel buffer and deliver their verdicts
         
+        Args:
+            messages: The buffered checks, in arrival order
+        """
         # If we have multiple messages with the same rule, we can batch them together
         rule_groups = {}
-        for content, rule, callback in messages:
+        for check in messages:
+            check.end_wait()
+            rule = self.rule_texts.get(check.digest)
+            if rule is None:
+                # The rule ended and was forgotten while an evicted buffer waited to be flushed
+                await check.resolve(check.content, True, None)
+                continue
+            
+            # Answer near-duplicates of recently judged messages without the API
+            cached = self.cached_verdict(rule, check.content)
+            if cached is not None:
+                await check.resolve(check.content, *cached)
+                continue
+            
             if rule not in rule_groups:
                 rule_groups[rule] = []
-            rule_groups[rule].append((content, callback))
+            rule_groups[rule].append((check.content, check.resolve))
         
         # Process each rule group
         for rule, message_group in rule_groups.items():
             if len(message_group) == 1:
                 # If only one message, process it directly
                 content, callback = message_group[0]
-                complies, reason = await self.check_rule_compliance(rule, content)
+                complies, reason = await self.check_rule_compliance(rule, content, PRIORITY_BACKGROUND)
                 await callback(content, complies, reason)
             else:
                 # For multiple messages, create a batch request
-                await self.process_batch(rule, message_group)
+                await self.process_batch(rule, message_group, PRIORITY_BACKGROUND)
         
-        # Update last API call timestamp
-        self.last_api_call[channel_id] = datetime.now()
+        for rule in {self.rule_texts.get(check.digest) for check in messages}:
+            if rule is not None and rule not in self.rule_uses:
+                self.forget_rule(rule)
+    
+    def build_batch_prompt(self, rule: str, contents: List[str]) -> str:
+        """Create the variable part of the prompt for checking several messages against one rule
+        
+        Args:
+            rule: The rule to check against
+            contents: The message contents, in order
+        """
+        return self.prompts.batch(rule, contents)
+    
+    def prompt_overhead(self, rule_text: str) -> int:
+        """Estimate the tokens of a batched request for a rule before any messages are added"""
+        return self.token_estimator(self.prompts.prefix(rule_text)) + self.token_estimator(self.build_batch_prompt(rule_text, []))
     
-    async def process_batch(self, rule: str, message_group: List[Tuple[str, Any]]) -> None:
+    async def process_batch(self, rule: str, message_group: List[Tuple[str, Any]],
+                            priority: int = PRIORITY_INTERACTIVE) -> None:
         """Process a batch of messages with the same rule
         
         Args:
             rule: The rule to check against
             message_group: List of (content, callback) tuples
+            priority: Scheduling priority for the API request
         """
-        # Format messages for batch processing
-        messages_text = "\n".join([f"MESSAGE {i+1}: \"{content}\"" for i, (content, _) in enumerate(message_group)])
+        contents = [content for content, _ in message_group]
+        prompt = self.build_batch_prompt(rule, contents)
         
         # Check if batch is too large for the API
-        estimated_tokens = self.token_estimator(messages_text) + self.token_estimator(rule) + self.token_safety_margin
+        estimated_tokens = self.token_estimator(self.prompts.prefix(rule)) + self.token_estimator(prompt) + self.token_safety_margin
         if estimated_tokens > self.max_tokens:
-            # If too large, process individually
-            for content, callback in message_group:
-                complies, reason = await self.check_rule_compliance(rule, content)
-                await callback(content, complies, reason)
+            # If too large, split it into batches that fit (a message too long on its own is checked in chunks)
+            batches = self.pack_batches(rule, contents)
+            for batch in batches:
+                group = [message_group[i] for i in batch]
+                if len(group) > 1 and len(batches) > 1:
+                    await self.process_batch(rule, group, priority)
+                    continue
+                for content, callback in group:
+                    complies, reason = await self.check_rule_compliance(rule, content, priority)
+                    await callback(content, complies, reason)
             return
         
         try:
-            # Create the prompt for batch processing
-            prompt = f"""
-            You are April Fools AI Mod, a bot that enforces fun rules on a Discord server.
-            
-            RULE: {rule}
-            
-            {messages_text}
-            
-            For each message, indicate if it follows the rule by responding with a list in this format:
-            MESSAGE 1: [YES/NO: reason if no]
-            MESSAGE 2: [YES/NO: reason if no]
-            ...and so on.
-            
-            Keep your explanations very brief and humorous.
-            """
-            
-            # Call OpenAI API using the new client
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are April Fools AI Mod, a strict but humorous enforcer of rules."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300
-            )
-            
-            result = response.choices[0].message.content.strip()
-            
-            # Parse the results
-            lines = result.split("\n")
-            for i, (content, callback) in enumerate(message_group):
-                message_prefix = f"MESSAGE {i+1}: "
-                
-                # Find the corresponding line in the response
-                for line in lines:
-                    if line.startswith(message_prefix):
-                        response_part = line[len(message_prefix):].strip()
-                        
-                        if response_part.startswith("YES"):
-                            await callback(content, True, None)
-                        elif response_part.startswith("NO:"):
-                            reason = response_part[3:].strip()
-                            await callback(content, False, reason)
-                        else:
-                            # If format is unexpected, assume the message is compliant
-                            await callback(content, True, None)
-                        
-                        break
-                else:
-                    # If we didn't find a line for this message, assume it's compliant
+            verdicts = await self.judge(rule, contents, priority)
+            for (content, callback), verdict in zip(message_group, verdicts):
+                if verdict is None:
+                    # Over budget or unexpected format, assume the message is compliant
                     await callback(content, True, None)
+                else:
+                    self.remember_verdict(rule, content, verdict)
+                    await callback(content, *verdict)
                     
         except Exception as e:
             logging.error(f"Error in batch processing: {e}")
@@ -239,9 +949,32 @@ class OpenAIHandler:
             # In case of API errors, process messages individually if there aren't too many
             if len(message_group) <= 3:
                 for content, callback in message_group:
-                    complies, reason = await self.check_rule_compliance(rule, content)
+                    complies, reason = await self.check_rule_compliance(rule, content, priority)
                     await callback(content, complies, reason)
             else:
                 # Otherwise, just let all messages through
                 for content, callback in message_group:
-                    await callback(content, True, None)
\ No newline at end of file
+                    await callback(content, True, None)
+
+# Handlers shared by all rules, so batches and caches span every channel
+_handlers: Dict[str, OpenAIHandler] = {}
+
+
+def get_handler(api_key: str) -> OpenAIHandler:
+    """Return the shared OpenAIHandler for an API key, creating it on first use
+    
+    Args:
+        api_key: The OpenAI API key
+    """
+    if api_key not in _handlers:
+        _handlers[api_key] = OpenAIHandler(api_key)
+    return _handlers[api_key]
+
+
+def release_handler(api_key: str) -> Optional[OpenAIHandler]:
+    """Remove the shared handler for an API key so the next get_handler creates a new one
+    
+    Returns:
+        The handler (for the caller to drain), or None if there was none
+    """
+    return _handlers.pop(api_key, None)
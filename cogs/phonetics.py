@@ -0,0 +1,379 @@
+import logging
+import random
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from cogs.lexicon import get_lexicon
+from config import RHYME_NEAR_THRESHOLD, RHYME_NEIGHBORS, RHYME_NEIGHBOR_CACHE
+
+try:
+    import pronouncing
+    PRONOUNCING_AVAILABLE = True
+except ImportError:
+    PRONOUNCING_AVAILABLE = False
+    logging.warning("Pronouncing library not available. Rhymes use letter-to-sound guesses only.")
+
+# ARPAbet vowels as (height, backness) in a rough vowel chart: close vowels are similar
+_VOWELS = {
+    "IY": (3.0, 0.0), "IH": (2.5, 0.3), "EY": (2.0, 0.0), "EH": (1.5, 0.2), "AE": (0.5, 0.2),
+    "AA": (0.0, 2.0), "AO": (1.0, 2.0), "OW": (2.0, 2.0), "UH": (2.5, 1.7), "UW": (3.0, 2.0),
+    "AH": (1.0, 1.0), "ER": (1.5, 1.0), "AY": (0.5, 0.6), "AW": (0.5, 1.5), "OY": (1.0, 1.6),
+}
+# ARPAbet consonants as (place, manner, voiced); place runs from the lips (0) to the glottis (7)
+_STOP, _FRICATIVE, _AFFRICATE, _NASAL, _LIQUID, _GLIDE = range(6)
+_CONSONANTS = {
+    "P": (0, _STOP, 0), "B": (0, _STOP, 1), "T": (3, _STOP, 0), "D": (3, _STOP, 1),
+    "K": (6, _STOP, 0), "G": (6, _STOP, 1), "F": (1, _FRICATIVE, 0), "V": (1, _FRICATIVE, 1),
+    "TH": (2, _FRICATIVE, 0), "DH": (2, _FRICATIVE, 1), "S": (3, _FRICATIVE, 0), "Z": (3, _FRICATIVE, 1),
+    "SH": (4, _FRICATIVE, 0), "ZH": (4, _FRICATIVE, 1), "HH": (7, _FRICATIVE, 0),
+    "CH": (4, _AFFRICATE, 0), "JH": (4, _AFFRICATE, 1), "M": (0, _NASAL, 1), "N": (3, _NASAL, 1),
+    "NG": (6, _NASAL, 1), "L": (3, _LIQUID, 1), "R": (4, _LIQUID, 1), "W": (0, _GLIDE, 1), "Y": (5, _GLIDE, 1),
+}
+_DIPHTHONGS = {"EY", "AY", "AW", "OY", "OW"}
+PHONEMES = list(_VOWELS) + list(_CONSONANTS)
+PHONEME_IDS = {phoneme: i for i, phoneme in enumerate(PHONEMES)}
+PAD = len(PHONEMES)  # Fills codas shorter than CODA_LENGTH
+CODA_LENGTH = 6      # Phonemes after the stressed vowel that are compared, counted from the end
+VOWEL_WEIGHT = 0.6   # Share of the score from the stressed vowel; the rest comes from what follows it
+SUGGESTION_MAX_LENGTH = 7  # Longest dictionary word offered as an example rhyme
+SUGGESTION_WORDS = 50      # Words kept per rhyming part for suggestions, shortest first
+
+
+def _similarity_matrix() -> np.ndarray:
+    """Pairwise phoneme similarity in [0, 1], with a row and column of zeros for PAD"""
+    sim = np.zeros((PAD + 1, PAD + 1), dtype=np.float32)
+    for a, (height_a, back_a) in _VOWELS.items():
+        for b, (height_b, back_b) in _VOWELS.items():
+            distance = ((height_a - height_b) ** 2 + (back_a - back_b) ** 2) ** 0.5
+            if (a in _DIPHTHONGS) != (b in _DIPHTHONGS):
+                distance += 1.0  # "bright" doesn't rhyme with "chat", though AY starts near AE
+            sim[PHONEME_IDS[a], PHONEME_IDS[b]] = max(0.0, 1.0 - distance / 2.5)
+    for a, (place_a, manner_a, voiced_a) in _CONSONANTS.items():
+        for b, (place_b, manner_b, voiced_b) in _CONSONANTS.items():
+            if a == b:
+                score = 1.0
+            else:
+                score = (0.5 * (manner_a == manner_b) + 0.3 * (1 - abs(place_a - place_b) / 7)
+                         + 0.2 * (voiced_a == voiced_b))
+            sim[PHONEME_IDS[a], PHONEME_IDS[b]] = min(score, 1.0 if a == b else 0.9)
+    return sim
+
+
+SIMILARITY = _similarity_matrix()
+
+# Letter-to-sound rules for words missing from the CMU dictionary (slang, typos, names), longest spelling first
+_SPELLINGS = sorted({
+    "tion": "SH AH N", "sion": "ZH AH N", "ough": "AO", "augh": "AO", "eigh": "EY", "igh": "AY",
+    "tch": "CH", "dge": "JH", "ck": "K", "ch": "CH", "sh": "SH", "th": "TH", "ph": "F", "wh": "W",
+    "ng": "NG", "qu": "K W", "kn": "N", "wr": "R", "gh": "",
+    "ee": "IY", "ea": "IY", "ie": "IY", "oo": "UW", "ai": "EY", "ay": "EY", "ey": "EY", "oa": "OW",
+    "ow": "OW", "ou": "AW", "oi": "OY", "oy": "OY", "au": "AO", "aw": "AO", "ew": "UW", "ue": "UW",
+    "ar": "AA R", "er": "ER", "ir": "ER", "ur": "ER", "or": "AO R",
+    "a": "AE", "e": "EH", "i": "IH", "o": "AA", "u": "AH",
+    "b": "B", "c": "K", "d": "D", "f": "F", "g": "G", "h": "HH", "j": "JH", "k": "K", "l": "L", "m": "M",
+    "n": "N", "p": "P", "r": "R", "s": "S", "t": "T", "v": "V", "w": "W", "x": "K S", "z": "Z",
+}.items(), key=lambda rule: -len(rule[0]))
+_LONG_VOWELS = {"a": "EY", "e": "IY", "i": "AY", "o": "OW", "u": "UW"}
+_DOUBLED = re.compile(r'([bcdfgklmnprstvz])\1+')
+_MAGIC_E = re.compile(r'([aeiou])([bcdfgklmnprstvz])e$')
+_NOT_LETTER = re.compile(r'[^a-z]')
+_VOWEL_LETTER = re.compile(r'[aeiouy]')
+
+
+def guess_phones(word: str) -> List[str]:
+    """Guess ARPAbet pronunciations from spelling
+
+    Stress can't be told from spelling, so words with several vowels get
+    one guess stressing the second-to-last vowel ("rizzler") and one
+    stressing the last ("cravat"). Returns an empty list if the word has no
+    vowel sound (e.g. "brrr").
+    """
+    word = _DOUBLED.sub(r'\1', _NOT_LETTER.sub('', word.lower()))
+    if not word or not _VOWEL_LETTER.search(word):
+        return []
+    long_vowel = None
+    match = _MAGIC_E.search(word)
+    if match and not (match.start() > 0 and word[match.start() - 1] in "aeiou"):
+        # A single vowel, one consonant and a final e: the e is silent and lengthens the vowel ("vibe")
+        long_vowel = match.start()
+        word = word[:-1]
+    phones = []
+    i = 0
+    while i < len(word):
+        letter = word[i]
+        if i == long_vowel:
+            phones.append(_LONG_VOWELS[letter])
+            i += 1
+            continue
+        if letter == "y":
+            if i == 0:
+                phones.append("Y")
+            elif i == len(word) - 1:
+                # "sky" but "happy" ("ay", "ey" and "oy" are matched as vowel spellings)
+                phones.append("AY" if not _VOWEL_LETTER.search(word[:i]) else "IY")
+            else:
+                phones.append("IH")
+            i += 1
+            continue
+        if letter == "c" and i + 1 < len(word) and word[i + 1] in "eiy":
+            phones.append("S")
+            i += 1
+            continue
+        if letter == "e" and i == len(word) - 1 and len(phones) > 1:
+            break  # Silent final e
+        for spelling, sounds in _SPELLINGS:
+            if word.startswith(spelling, i):
+                phones.extend(sounds.split())
+                i += len(spelling)
+                break
+        else:
+            i += 1
+    vowels = [index for index, phone in enumerate(phones) if phone in _VOWELS]
+    return [" ".join(phone + ("1" if index == stressed else "0") if phone in _VOWELS else phone
+                     for index, phone in enumerate(phones))
+            for stressed in vowels[-2:]]
+
+
+def rhyme_anchors(phones: str) -> List[int]:
+    """Where the rhyming part of a pronunciation may start, in vowels counted from the end (1 is the last)
+
+    The first anchor is the last vowel with primary stress ("tomorrow"
+    rhymes on AA1, not on the final OW2), or with secondary stress if
+    none has primary stress, or the last vowel if none is stressed. A
+    secondary stress after it is a second anchor, so compounds rhyme on
+    their last part too ("airport"/"support"). Empty if there is no vowel.
+    """
+    stresses = [phone[-1] for phone in phones.split() if phone[-1].isdigit()]
+    if not stresses:
+        return []
+    primary = [i for i, stress in enumerate(stresses) if stress == "1"]
+    secondary = [i for i, stress in enumerate(stresses) if stress == "2"]
+    start = primary[-1] if primary else secondary[-1] if secondary else len(stresses) - 1
+    anchors = [len(stresses) - start]
+    if secondary and secondary[-1] > start:
+        anchors.append(len(stresses) - secondary[-1])
+    return anchors
+
+
+@lru_cache(maxsize=RHYME_NEIGHBOR_CACHE)
+def encode_tail(phones: str, syllables: Optional[int] = None) -> Optional[Tuple[int, Tuple[int, ...]]]:
+    """Encode the rhyming part of a pronunciation as (first vowel id, coda ids)
+
+    The rhyming part starts `syllables` vowels from the end (default: the
+    first of rhyme_anchors). The coda is everything after that vowel, cut
+    to its last CODA_LENGTH phonemes and padded at the front with PAD, so
+    codas line up from the end. Returns None if the pronunciation has
+    fewer vowels.
+    """
+    parts = phones.split()
+    vowels = [i for i, phone in enumerate(parts) if phone[-1].isdigit()]
+    if syllables is None:
+        anchors = rhyme_anchors(phones)
+        syllables = anchors[0] if anchors else 0
+    if not 0 < syllables <= len(vowels):
+        return None
+    ids = [PHONEME_IDS.get(phone.rstrip("012"), PAD) for phone in parts[vowels[-syllables]:]]
+    coda = ids[1:][-CODA_LENGTH:]
+    return ids[0], tuple([PAD] * (CODA_LENGTH - len(coda)) + coda)
+
+
+def aligned_tails(phones_a: str, phones_b: str) -> Iterator[Tuple[Tuple[int, Tuple[int, ...]], Tuple[int, Tuple[int, ...]]]]:
+    """Pairs of rhyming parts to compare for two pronunciations
+
+    For each pair of anchors, both words are cut the same number of vowels
+    from the end, at the earlier of the two anchors, so a stress difference
+    doesn't hide a rhyme: "hello" (OW1) and "yellow" (EH1 L OW0) compare
+    EH L OW with EH L OW. If one word is too short to line up that way,
+    each is cut at its own anchor.
+    """
+    for syllables_a in rhyme_anchors(phones_a):
+        for syllables_b in rhyme_anchors(phones_b):
+            syllables = max(syllables_a, syllables_b)
+            tail_a, tail_b = encode_tail(phones_a, syllables), encode_tail(phones_b, syllables)
+            if tail_a is None or tail_b is None:
+                tail_a, tail_b = encode_tail(phones_a, syllables_a), encode_tail(phones_b, syllables_b)
+            yield tail_a, tail_b
+
+
+def score_tails(vowels_a: np.ndarray, codas_a: np.ndarray, vowels_b: np.ndarray, codas_b: np.ndarray) -> np.ndarray:
+    """Rhyme scores in [0, 1] of every tail in `a` against every tail in `b`, vectorized
+
+    Args:
+        vowels_a: (A,) stressed vowel ids
+        codas_a: (A, CODA_LENGTH) coda ids
+        vowels_b: (B,) stressed vowel ids to compare with
+        codas_b: (B, CODA_LENGTH) coda ids to compare with
+
+    Returns:
+        (A, B) scores: VOWEL_WEIGHT times the vowel similarity plus the rest
+        times the mean similarity of coda positions where either tail has a
+        phoneme (a phoneme against padding scores 0)
+    """
+    codas_a, codas_b = codas_a[:, None, :], codas_b[None, :, :]
+    present = (codas_a != PAD) | (codas_b != PAD)
+    counted = present.sum(axis=2)
+    coda_sim = (SIMILARITY[codas_a, codas_b] * present).sum(axis=2) / np.maximum(counted, 1)
+    coda_sim[counted == 0] = 1.0
+    return VOWEL_WEIGHT * SIMILARITY[vowels_a[:, None], vowels_b[None, :]] + (1 - VOWEL_WEIGHT) * coda_sim
+
+
+def phones_for_word(word: str) -> List[str]:
+    """CMU dictionary pronunciations of a lowercase word, from the lexicon pack if there is one"""
+    pack = get_lexicon()
+    table = pack.table("cmudict") if pack else None
+    if table is not None:
+        phones = table.get(word)
+        return phones.split("\n") if phones else []
+    return pronouncing.phones_for_word(word) if PRONOUNCING_AVAILABLE else []
+
+
+def group_by_tail(lookup: Iterable[Tuple[str, List[str]]]) -> Tuple[np.ndarray, np.ndarray, List[List[str]]]:
+    """Group dictionary words by the rhyming part of their first pronunciation
+
+    Returns:
+        (vowels, codas, words): the (U,) stressed vowels and (U, CODA_LENGTH)
+        codas of the U distinct rhyming parts, and the SUGGESTION_WORDS
+        shortest words of up to SUGGESTION_MAX_LENGTH letters with each
+    """
+    tail_ids, words = {}, []
+    for word, pronunciations in lookup:
+        tail = encode_tail(pronunciations[0])
+        if tail is None or not word.isalpha():
+            continue
+        index = tail_ids.get(tail)
+        if index is None:
+            index = tail_ids[tail] = len(words)
+            words.append([])
+        if len(word) <= SUGGESTION_MAX_LENGTH:
+            words[index].append(word)
+    words = [sorted(group, key=lambda word: (len(word), word))[:SUGGESTION_WORDS] for group in words]
+    return (np.array([vowel for vowel, _ in tail_ids], dtype=np.int8),
+            np.array([coda for _, coda in tail_ids], dtype=np.int8).reshape(-1, CODA_LENGTH), words)
+
+
+def index_signature() -> Dict[str, str]:
+    """What a prebuilt rhyme index must have been built with to be usable"""
+    return {"phonemes": " ".join(PHONEMES), "coda_length": str(CODA_LENGTH), "anchor": "primary stress",
+            "suggestion_max_length": str(SUGGESTION_MAX_LENGTH), "suggestion_words": str(SUGGESTION_WORDS)}
+
+
+@lru_cache(maxsize=RHYME_NEIGHBOR_CACHE)
+def word_pronunciations(word: str) -> Tuple[str, ...]:
+    """Known pronunciations of a lowercase word with a vowel sound, or guessed ones if it has none"""
+    pronunciations = phones_for_word(word) or guess_phones(word)
+    return tuple(phones for phones in pronunciations if rhyme_anchors(phones))
+
+
+class Rhymer:
+    """Scores how well two words rhyme and suggests rhymes, without leaving the process
+
+    Words are looked up in the CMU dictionary (through `pronouncing`), or
+    pronounced from their spelling if they aren't in it, and reduced to
+    their rhyming part: the last vowel with primary stress and the phonemes
+    after it (see rhyme_anchors and aligned_tails).
+    Two words score 1.0 if those parts match, and less the further apart
+    their sounds are, so "time"/"mine" or "cat"/"cap" still count at the
+    default threshold while "cat"/"dog" don't. Every distinct rhyming part
+    in the dictionary is kept in NumPy arrays (mapped from the lexicon pack
+    if there is one), so a word's nearest sounds are found in one
+    vectorized pass and then remembered.
+    """
+
+    def __init__(self, threshold: float = RHYME_NEAR_THRESHOLD, neighbors: int = RHYME_NEIGHBORS):
+        """Initialize the rhymer
+
+        Args:
+            threshold: Score two words need to count as a rhyme
+            neighbors: Nearest rhyming parts kept per word for suggestions
+        """
+        self.threshold = threshold
+        self.neighbors = neighbors
+        self.vowels: Optional[np.ndarray] = None  # (U,) stressed vowel of each distinct rhyming part
+        self.codas: Optional[np.ndarray] = None   # (U, CODA_LENGTH) codas
+        self.words: Optional[Callable[[int], List[str]]] = None  # Dictionary words with a rhyming part
+        self.nearest = lru_cache(maxsize=RHYME_NEIGHBOR_CACHE)(self._nearest)
+
+    def score(self, word1: str, word2: str) -> Optional[float]:
+        """Best rhyme score over the words' pronunciations, or None if either has no vowel sound"""
+        pronunciations1, pronunciations2 = word_pronunciations(word1.lower()), word_pronunciations(word2.lower())
+        if not pronunciations1 or not pronunciations2:
+            return None
+        pairs = [pair for phones1 in pronunciations1 for phones2 in pronunciations2
+                 for pair in aligned_tails(phones1, phones2)]
+        vowels1 = np.array([tail1[0] for tail1, _ in pairs], dtype=np.intp)
+        codas1 = np.array([tail1[1] for tail1, _ in pairs], dtype=np.intp)
+        vowels2 = np.array([tail2[0] for _, tail2 in pairs], dtype=np.intp)
+        codas2 = np.array([tail2[1] for _, tail2 in pairs], dtype=np.intp)
+        return float(np.diagonal(score_tails(vowels1, codas1, vowels2, codas2)).max())
+
+    def rhymes(self, word1: str, word2: str) -> Optional[bool]:
+        """Whether two words rhyme at the threshold, or None if it can't be told"""
+        score = self.score(word1, word2)
+        return None if score is None else score >= self.threshold
+
+    def build_index(self) -> None:
+        """Group the dictionary's short words by rhyming part (about 30k of them), on first suggestion
+
+        Maps the index from the lexicon pack if it has one built with the
+        same encoding, otherwise builds it from the CMU dictionary.
+        """
+        if self.vowels is not None:
+            return
+        pack = get_lexicon()
+        if pack is not None and all(pack.meta().get(key) == value for key, value in index_signature().items()):
+            vowels, codas, table = pack.array("rhyme_vowels"), pack.array("rhyme_codas"), pack.table("rhyme_words")
+            if vowels is not None and codas is not None and table is not None:
+                self.words = lambda index: table.get(str(index), "").split()
+                self.codas = codas
+                self.vowels = vowels  # Set last: it marks the index as built
+                return
+        if not PRONOUNCING_AVAILABLE:
+            return
+        pronouncing.init_cmu()
+        vowels, codas, words = group_by_tail(pronouncing.lookup.items())
+        self.words = words.__getitem__
+        self.codas = codas
+        self.vowels = vowels  # Set last: it marks the index as built
+
+    def _nearest(self, word: str) -> List[int]:
+        """Indexes of the rhyming parts closest to the word's, best first"""
+        pronunciations = word_pronunciations(word)
+        if not pronunciations:
+            return []
+        # Only the first pronunciation: a guessed word's second stress would pull in rhymes for its last syllable.
+        # Each of its anchors is tried, so "airport" finds "sort" as well as "airport"
+        tails = [encode_tail(pronunciations[0], syllables) for syllables in rhyme_anchors(pronunciations[0])]
+        vowels = np.array([vowel for vowel, _ in tails], dtype=np.intp)
+        codas = np.array([coda for _, coda in tails], dtype=np.intp)
+        scores = score_tails(vowels, codas, self.vowels, self.codas).max(axis=0)
+        count = min(self.neighbors, len(scores))
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [int(index) for index in top if scores[index] >= self.threshold]
+
+    def suggestions(self, word: str, count: int = 3) -> List[str]:
+        """A few short dictionary words that rhyme with `word`, closest rhymes first"""
+        self.build_index()
+        if self.vowels is None:
+            return []
+        word = word.lower()
+        pool = []
+        for index in self.nearest(word):
+            pool.extend(w for w in self.words(index) if w != word)
+            if len(pool) >= 4 * count:
+                break
+        return random.sample(pool, min(count, len(pool)))
+
+
+_rhymer: Optional[Rhymer] = None
+
+
+def get_rhymer() -> Rhymer:
+    """Return the process-wide rhymer"""
+    global _rhymer
+    if _rhymer is None:
+        _rhymer = Rhymer()
+    return _rhymer
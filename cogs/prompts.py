@@ -0,0 +1,64 @@
+import hashlib
+import sys
+from functools import lru_cache
+from typing import List
+
+from config import RULE_TEXT_MAX_CHARS
+
+PERSONA = "You are April Fools AI Mod, a bot that enforces fun rules on a Discord server."
+
+INSTRUCTIONS = """Each request names the rule above by its id and gives the messages to check against it.
+For a single USER MESSAGE, respond with:
+- "YES" if the message follows the rule
+- "NO: [brief explanation of violation]" if the message violates the rule
+For numbered messages, respond with one line per message in this format:
+MESSAGE 1: [YES/NO: reason if no]
+MESSAGE 2: [YES/NO: reason if no]
+...and so on.
+Keep your explanations very brief and humorous."""
+
+
+@lru_cache(maxsize=256)
+def rule_digest(rule_text: str) -> str:
+    """Return the short, interned digest identifying a rule's text"""
+    return sys.intern(hashlib.sha1(rule_text.encode('utf-8')).hexdigest()[:16])
+
+
+def rule_id(rule_text: str) -> str:
+    """Return the short id a rule is referred to by in prompts (stable across restarts)"""
+    return rule_digest(rule_text)[:6]
+
+
+@lru_cache(maxsize=256)
+def _render_prefix(rule_text: str) -> str:
+    definition = ' '.join(rule_text.split())
+    if len(definition) > RULE_TEXT_MAX_CHARS:
+        definition = definition[:RULE_TEXT_MAX_CHARS - 3] + "..."
+    return f"{PERSONA}\n\nRULE:\n[{rule_id(rule_text)}] {definition}\n\n{INSTRUCTIONS}"
+
+
+class PromptBuilder:
+    """Renders verdict prompts as a static prefix plus a short variable part
+
+    The prefix (persona, the rule keyed by its short id, and the answer
+    format) is sent as the system message and is byte-for-byte the same
+    for every request checking against that rule, so provider-side prefix
+    caching can reuse it across channels and guilds. Requests only add the
+    rule id and the messages. A prefix holds only its own rule: rule text
+    can be written by users, and must not reach requests made for other
+    rules or guilds. Rendered prefixes are memoized per rule, and rule text
+    is cut to RULE_TEXT_MAX_CHARS.
+    """
+
+    def prefix(self, rule_text: str) -> str:
+        """Return the static prefix for a request checking against `rule_text`"""
+        return _render_prefix(rule_text)
+
+    def single(self, rule_text: str, content: str) -> str:
+        """Return the variable part of a request for one message"""
+        return f'RULE [{rule_id(rule_text)}]\nUSER MESSAGE: "{content}"'
+
+    def batch(self, rule_text: str, contents: List[str]) -> str:
+        """Return the variable part of a request for numbered messages"""
+        lines = "\n".join(f'MESSAGE {i + 1}: "{content}"' for i, content in enumerate(contents))
+        return f"RULE [{rule_id(rule_text)}]\n{lines}"
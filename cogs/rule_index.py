@@ -0,0 +1,78 @@
+from typing import Dict, Iterator, Optional
+
+# Where a rule applies, from most to least specific
+SCOPE_CHANNEL = "channel"
+SCOPE_CATEGORY = "category"
+SCOPE_GUILD = "guild"
+SCOPES = (SCOPE_CHANNEL, SCOPE_CATEGORY, SCOPE_GUILD)
+
+
+class ActiveRule:
+    """One activated rule, shared by every channel in its scope"""
+
+    __slots__ = ("rule", "scope", "scope_id", "announce_channel_id", "channel_ids", "timer", "rule_type")
+
+    def __init__(self, rule, scope: str, scope_id: int, announce_channel_id: int, rule_type: Optional[str] = None):
+        """Initialize the activation
+
+        Args:
+            rule: The rule instance
+            scope: SCOPE_CHANNEL, SCOPE_CATEGORY or SCOPE_GUILD
+            scope_id: The id of the channel, category or guild
+            announce_channel_id: Channel the rule was activated from, where its end is announced
+            rule_type: The RuleFactory type the rule was created from, so it can be recreated after a restart
+        """
+        self.rule = rule
+        self.scope = scope
+        self.scope_id = scope_id
+        self.announce_channel_id = announce_channel_id
+        self.channel_ids = {announce_channel_id}  # Channels the rule has seen messages in, for cleanup
+        self.timer = None  # asyncio.Task ending the rule when it expires
+        self.rule_type = rule_type
+
+
+class RuleIndex:
+    """Active rules indexed by channel, category and guild
+
+    Each scope has its own dict, so finding the rule for a message takes at
+    most three lookups no matter how many channels a rule covers. The most
+    specific scope wins: a channel rule overrides a category rule, which
+    overrides a guild rule. Activating or ending a rule touches one entry.
+    """
+
+    def __init__(self):
+        self.scopes: Dict[str, Dict[int, ActiveRule]] = {scope: {} for scope in SCOPES}
+
+    def __len__(self) -> int:
+        return sum(len(rules) for rules in self.scopes.values())
+
+    def __iter__(self) -> Iterator[ActiveRule]:
+        for rules in self.scopes.values():
+            yield from rules.values()
+
+    def get(self, scope: str, scope_id: int) -> Optional[ActiveRule]:
+        return self.scopes[scope].get(scope_id)
+
+    def add(self, active: ActiveRule) -> Optional[ActiveRule]:
+        """Index an activation, returning the one it replaces in the same scope, if any"""
+        rules = self.scopes[active.scope]
+        replaced = rules.get(active.scope_id)
+        rules[active.scope_id] = active
+        return replaced
+
+    def remove(self, active: ActiveRule) -> bool:
+        """Remove an activation if it is still indexed"""
+        rules = self.scopes[active.scope]
+        if rules.get(active.scope_id) is active:
+            del rules[active.scope_id]
+            return True
+        return False
+
+    def resolve(self, channel_id: int, category_id: Optional[int], guild_id: Optional[int]) -> Optional[ActiveRule]:
+        """Return the rule that applies to a channel, or None"""
+        active = self.scopes[SCOPE_CHANNEL].get(channel_id)
+        if active is None and category_id is not None:
+            active = self.scopes[SCOPE_CATEGORY].get(category_id)
+        if active is None and guild_id is not None:
+            active = self.scopes[SCOPE_GUILD].get(guild_id)
+        return active
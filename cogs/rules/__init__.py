@@ -9,8 +9,11 @@ from cogs.rules.five_words_rule import FiveWordsRule
 from cogs.rules.shakespeare_rule import ShakespeareRule
 from cogs.rules.corporate_jargon_rule import CorporateJargonRule
 from cogs.rules.overly_formal_rule import OverlyFormalRule
+from cogs.rules.message_context import MessageContext
 from config import OPENAI_API_KEY
+from cogs.clock import get_clock
 import logging
+from datetime import timedelta
 
 class RuleFactory:
     """Factory class for creating rule instances"""
@@ -59,23 +62,66 @@ class RuleFactory:
             return CustomRule(channel, duration, rule_text)
 
 
+def keyword_check(rule_text, ctx):
+    """Check a message against a free-text rule using basic keyword matching
+    
+    This is a very basic check that looks for keywords in the rule. It backs
+    custom rules without AI and AI rules once the daily API budget is spent.
+    
+    Args:
+        rule_text: The rule to check against
+        ctx: The MessageContext of the message to check
+        
+    Returns:
+        None if the message complies with the rule, or a string with the violation explanation
+    """
+    rule_lower = rule_text.lower()
+    content = ctx.content
+    
+    if "emoji" in rule_lower:
+        if not ctx.emoji_spans:
+            return "Your message needs to include an emoji!"
+    elif ("uppercase" in rule_lower or "all caps" in rule_lower) and not content.isupper():
+        return "Your message needs to be in ALL CAPS!"
+    elif "lowercase" in rule_lower and not content.islower():
+        return "Your message needs to be in lowercase!"
+    elif "question" in rule_lower and "?" not in content:
+        return "Your message needs to be a question!"
+    elif "exclamation" in rule_lower and "!" not in content:
+        return "Your message needs more excitement! Add an exclamation mark!"
+        
+    return None
+
+
 class AIRule:
     """Rule that uses OpenAI to check message compliance"""
     
+    uses_ai = True
+    stateful = False
+    ignores_formatting = False  # Free-text rules can be about case, emoji or punctuation
+    
     def __init__(self, channel, duration, rule_text):
-        self.channel = channel
+        self.channel_id = channel.id
         self.duration = duration
         self.rule_text = rule_text
         self.openai_handler = None
         self._init_openai_handler()
-        from datetime import datetime, timedelta
-        self.end_time = datetime.now() + timedelta(minutes=duration)
+        self.end_time = get_clock().now() + timedelta(minutes=duration)
     
     def _init_openai_handler(self):
         """Initialize OpenAI handler if needed"""
         if not self.openai_handler and OPENAI_API_KEY:
-            from cogs.openai_handler import OpenAIHandler
-            self.openai_handler = OpenAIHandler(OPENAI_API_KEY)
+            from cogs.openai_handler import get_handler
+            self.openai_handler = get_handler(OPENAI_API_KEY)
+            # No rule-based check: keywords can't judge arbitrary rules with any confidence
+            self.openai_handler.register_rule("ai", self.rule_text)
+    
+    def cleanup(self, channel_ids=()):
+        """Drop any messages still buffered for the rule's channels, and release the rule from the handler"""
+        if self.openai_handler:
+            for channel_id in channel_ids or [self.channel_id]:
+                self.openai_handler.clear_channel(channel_id)
+            self.openai_handler.unregister_rule(self.rule_text)
     
     @property
     def name(self):
@@ -85,33 +131,42 @@ class AIRule:
     def description(self):
         return self.rule_text
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         self._init_openai_handler()
         
         if not self.openai_handler:
             return None  # Skip checking if OpenAI is not available
+        
+        if self.openai_handler.budget_exhausted():
+            # Daily API budget is spent, fall back to keyword matching
+            return keyword_check(self.rule_text, ctx)
             
-        # Check result directly
-        complies, reason = await self.openai_handler.check_rule_compliance(self.rule_text, message.content)
+        # Batched with other channels enforcing the same rule
+        complies, reason = await self.openai_handler.submit(self.rule_text, ctx.channel_id, ctx.content, ctx.guild_id)
         if not complies:
             return reason
             
         return None
     
     def is_expired(self):
-        from datetime import datetime
-        return datetime.now() > self.end_time
+        return get_clock().now() > self.end_time
 
 
 class CustomRule:
     """Rule that uses basic keyword matching for common patterns"""
     
+    uses_ai = False
+    stateful = False
+    ignores_formatting = False
+    
     def __init__(self, channel, duration, rule_text):
-        self.channel = channel
+        self.channel_id = channel.id
         self.duration = duration
         self.rule_text = rule_text
-        from datetime import datetime, timedelta
-        self.end_time = datetime.now() + timedelta(minutes=duration)
+        self.end_time = get_clock().now() + timedelta(minutes=duration)
+    
+    def cleanup(self, channel_ids=()):
+        pass
     
     @property
     def name(self):
@@ -121,26 +176,9 @@ class CustomRule:
     def description(self):
         return self.rule_text
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         # For custom rules without AI, use a simple keyword check
-        # This is a very basic check that looks for keywords in the rule
-        rule_lower = self.rule_text.lower()
-        
-        if "emoji" in rule_lower:
-            import emoji
-            if not any(c in emoji.EMOJI_DATA for c in message.content):
-                return "Your message needs to include an emoji!"
-        elif ("uppercase" in rule_lower or "all caps" in rule_lower) and not message.content.isupper():
-            return "Your message needs to be in ALL CAPS!"
-        elif "lowercase" in rule_lower and not message.content.islower():
-            return "Your message needs to be in lowercase!"
-        elif "question" in rule_lower and "?" not in message.content:
-            return "Your message needs to be a question!"
-        elif "exclamation" in rule_lower and "!" not in message.content:
-            return "Your message needs more excitement! Add an exclamation mark!"
-            
-        return None
+        return keyword_check(self.rule_text, ctx)
     
     def is_expired(self):
-        from datetime import datetime
-        return datetime.now() > self.end_time
\ No newline at end of file
+        return get_clock().now() > self.end_time
\ No newline at end of file
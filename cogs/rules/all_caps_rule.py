@@ -11,8 +11,8 @@ class AllCapsRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, all messages must be written in ALL CAPS."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         # Check if message is all uppercase
-        if not message.content.isupper():
+        if not ctx.content.isupper():
             return "YOUR MESSAGE MUST BE IN ALL CAPS! LOUDER!!"
         return None
\ No newline at end of file
@@ -1,8 +1,14 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+from cogs.clock import get_clock
 
 class BaseRule:
     """Base class for all rule implementations"""
     
+    uses_ai = False   # True if checks call the OpenAI API
+    stateful = False  # True if checks depend on earlier messages in the channel (must run in order)
+    ignores_formatting = False  # True if verdicts can't depend on case, emoji or punctuation
+    
     def __init__(self, channel, duration):
         """Initialize the rule
         
@@ -10,9 +16,9 @@ class BaseRule:
             channel: The Discord channel where the rule is active
             duration: The duration in minutes for how long the rule will be active
         """
-        self.channel = channel
+        self.channel_id = channel.id  # Only the id, so rules don't keep Discord objects alive
         self.duration = duration
-        self.end_time = datetime.now() + timedelta(minutes=duration)
+        self.end_time = get_clock().now() + timedelta(minutes=duration)
         
     @property
     def name(self):
@@ -24,11 +30,11 @@ class BaseRule:
         """Return the description of the rule with duration"""
         return f"For the next {self.duration} minutes, this is a base rule."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         """Check if a message complies with the rule
         
         Args:
-            message: The Discord message to check
+            ctx: The MessageContext of the message to check
             
         Returns:
             None if the message complies with the rule, or a string with the violation explanation
@@ -36,10 +42,18 @@ class BaseRule:
         # Base implementation always passes
         return None
     
+    def cleanup(self, channel_ids=()):
+        """Release any per-channel state held by the rule once it ends
+        
+        Args:
+            channel_ids: Every channel the rule was enforced in (default: the channel it was created in)
+        """
+        pass
+    
     def is_expired(self):
         """Check if the rule has expired
         
         Returns:
             True if the rule has expired, False otherwise
         """
-        return datetime.now() > self.end_time
\ No newline at end of file
+        return get_clock().now() > self.end_time
\ No newline at end of file
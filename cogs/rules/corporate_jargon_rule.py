@@ -1,9 +1,27 @@
+import re
+
 from cogs.rules.base_rule import BaseRule
 from config import OPENAI_API_KEY
 
 class CorporateJargonRule(BaseRule):
     """Rule requiring messages to include corporate buzzwords or business jargon"""
     
+    uses_ai = True
+    ignores_formatting = True
+    
+    # Words accepted without a model (budget spent, or by the rule-based backend)
+    fallback_terms = ["synergy", "leverage", "actionable", "bandwidth", "circle back", "deep dive",
+                      "paradigm", "value-add", "low-hanging fruit", "touch base", "moving forward",
+                      "drill down", "thought leadership", "best practice", "holistic"]
+    # Whole words, with an optional plural ("best practices"); the rule asks for two different terms
+    fallback_pattern = re.compile(r"\b(" + "|".join(fallback_terms) + r")s?\b")
+    fallback_min_terms = 2
+    
+    # The rule as explained to the model
+    rule_text = """Messages must include at least two different corporate buzzwords or business jargon terms. 
+Examples include: synergy, leverage, actionable, bandwidth, circle back, deep dive, paradigm shift, value-add, 
+low-hanging fruit, touch base, moving forward, drill down, thought leadership, best practices, holistic approach, etc. Don't be too strict and be sarcastic."""
+    
     def __init__(self, channel, duration):
         super().__init__(channel, duration)
         self.openai_handler = None
@@ -12,8 +30,22 @@ class CorporateJargonRule(BaseRule):
     def _init_openai_handler(self):
         """Initialize OpenAI handler if needed"""
         if not self.openai_handler and OPENAI_API_KEY:
-            from cogs.openai_handler import OpenAIHandler
-            self.openai_handler = OpenAIHandler(OPENAI_API_KEY)
+            from cogs.openai_handler import get_handler
+            self.openai_handler = get_handler(OPENAI_API_KEY)
+            self.openai_handler.register_rule("corporate_jargon", self.rule_text, self.local_check)
+    
+    def local_check(self, content):
+        """Lenient keyword check, used without a model"""
+        if len(set(self.fallback_pattern.findall(content.lower()))) < self.fallback_min_terms:
+            return "Let's circle back: this message has zero synergy. Leverage some jargon!"
+        return None
+    
+    def cleanup(self, channel_ids=()):
+        """Drop any messages still buffered for the rule's channels, and release the rule from the handler"""
+        if self.openai_handler:
+            for channel_id in channel_ids or [self.channel_id]:
+                self.openai_handler.clear_channel(channel_id)
+            self.openai_handler.unregister_rule(self.rule_text)
     
     @property
     def name(self):
@@ -23,19 +55,19 @@ class CorporateJargonRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, all messages must include at least two pieces of corporate buzzwords or business jargon."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         """Check if message includes corporate jargon"""
         self._init_openai_handler()
         
         if not self.openai_handler:
             return None  # Skip checking if OpenAI is not available
         
-        rule_text = """Messages must include at least two different corporate buzzwords or business jargon terms. 
-Examples include: synergy, leverage, actionable, bandwidth, circle back, deep dive, paradigm shift, value-add, 
-low-hanging fruit, touch base, moving forward, drill down, thought leadership, best practices, holistic approach, etc. Don't be too strict and be sarcastic."""
+        if self.openai_handler.budget_exhausted():
+            # Daily API budget is spent, fall back to a lenient keyword check
+            return self.local_check(ctx.content)
         
-        # Check result directly
-        complies, reason = await self.openai_handler.check_rule_compliance(rule_text, message.content)
+        # Batched with other channels enforcing the same rule
+        complies, reason = await self.openai_handler.submit(self.rule_text, ctx.channel_id, ctx.content, ctx.guild_id)
         if not complies:
             return reason
         
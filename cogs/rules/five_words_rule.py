@@ -11,10 +11,9 @@ class FiveWordsRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, messages can only contain exactly 5 words."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         # Count words in the message
-        words = message.content.strip().split()
-        word_count = len(words)
+        word_count = len(ctx.words)
         
         # Check if the message contains exactly 5 words
         if word_count != 5:
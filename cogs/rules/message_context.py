@@ -0,0 +1,93 @@
+import re
+from functools import cached_property
+from typing import List, Optional, Tuple
+
+from cogs.fingerprint import normalize
+from cogs.lexicon import emoji_char_test
+
+_URL_PATTERN = re.compile(r'https?://\S+')
+# Custom Discord emojis (format: <:name:id> or <a:name:id> for animated)
+_CUSTOM_EMOJI_PATTERN = re.compile(r'<a?:[a-zA-Z0-9_]+:[0-9]+>')
+# User, role and channel mentions (<@id>, <@!id>, <@&id>, <#id>)
+_MENTION_PATTERN = re.compile(r'<(?:@[!&]?|#)\d+>')
+_TRAILING_PUNCTUATION = re.compile(r'[^\w\']+$')
+_LETTER = re.compile(r'[a-z]')
+# Tests single characters for emojis, set on first use (from the lexicon pack, or emoji.EMOJI_DATA)
+_is_emoji = None
+
+
+class MessageContext:
+    """A message plus features of its content, each computed on first use
+
+    Built once per message (and once per edit) and passed to every rule
+    instead of the discord.Message, so rules and audits that look at the
+    same message share one lowercasing, split, emoji scan and so on.
+    """
+
+    def __init__(self, message):
+        """Initialize the context
+
+        Args:
+            message: The discord.Message, or any object with id, content, channel and (optionally) guild and author
+        """
+        self.message = message
+        self.content: str = message.content
+        self.message_id = message.id
+        self.channel_id: int = message.channel.id
+        guild = getattr(message, "guild", None)
+        self.guild_id: Optional[int] = guild.id if guild else None
+        author = getattr(message, "author", None)
+        self.author_id: Optional[int] = author.id if author else None
+
+    @cached_property
+    def lower(self) -> str:
+        return self.content.lower()
+
+    @cached_property
+    def normalized(self) -> str:
+        """Lowercase content without punctuation, emojis, mentions or repeated letters (see cogs/fingerprint.py)"""
+        return normalize(self.content)
+
+    @cached_property
+    def words(self) -> List[str]:
+        """Whitespace-separated words"""
+        return self.content.split()
+
+    @cached_property
+    def urls(self) -> List[str]:
+        return _URL_PATTERN.findall(self.content)
+
+    @cached_property
+    def last_word(self) -> Optional[str]:
+        """The last word, lowercased and without URLs or trailing punctuation
+
+        None if it is shorter than two characters or has no letters.
+        """
+        words = _URL_PATTERN.sub('', self.content).split() if self.urls else self.words
+        if not words:
+            return None
+        last_word = _TRAILING_PUNCTUATION.sub('', words[-1].lower())
+        if len(last_word) < 2 or not _LETTER.search(last_word):
+            return None
+        return last_word
+
+    @cached_property
+    def emoji_spans(self) -> List[Tuple[int, int]]:
+        """(start, end) offsets of Unicode and custom Discord emojis, in order"""
+        global _is_emoji
+        if _is_emoji is None:
+            _is_emoji = emoji_char_test()
+        spans = [] if self.content.isascii() else [(i, i + 1) for i, char in enumerate(self.content) if _is_emoji(char)]
+        spans.extend(match.span() for match in _CUSTOM_EMOJI_PATTERN.finditer(self.content))
+        spans.sort()
+        return spans
+
+    @cached_property
+    def mentions(self) -> List[str]:
+        """Raw user, role and channel mentions"""
+        return _MENTION_PATTERN.findall(self.content)
+
+    @cached_property
+    def token_estimate(self) -> int:
+        """Rough token count (character count / 4, as in OpenAIHandler)"""
+        return len(self.content) // 4
@@ -1,9 +1,34 @@
+import re
+
 from cogs.rules.base_rule import BaseRule
 from config import OPENAI_API_KEY
 
 class OverlyFormalRule(BaseRule):
     """Rule requiring messages to be excessively formal and polite"""
     
+    uses_ai = True
+    ignores_formatting = True
+    
+    # Words accepted without a model (budget spent, or by the rule-based backend)
+    fallback_terms = ["sir", "madam", "please", "thank", "thanks", "kind", "kindly", "splendid", "delight",
+                      "delighted", "delightful", "good day", "might i", "dare say", "golly", "gosh", "pardon",
+                      "gracious"]
+    # Whole words only, so "sir" doesn't match "desire" or "kind" match "kinda"
+    fallback_pattern = re.compile(r"\b(?:" + "|".join(fallback_terms) + r")\b")
+    
+    # The rule as explained to the model
+    rule_text = """Messages must be somewhat formal and polite, as if speaking to someone of high status.
+Be quite lenient - accept any message that has even a small touch of formality or politeness.
+Accept messages with Victorian/British-style speech patterns, old-fashioned language, or any polite expressions.
+Acceptable examples include:
+- "oh golly oh gosh what a splendid day it is today kind sir"
+- "I dare say this is rather fascinating"
+- "How delightful to see you"
+- "Good day to you"
+- "Might I suggest..."
+- Any message with words like "sir", "madam", "please", "thank you", "kind", "splendid", etc.
+Only reject messages that are clearly rude, use slang, or have absolutely no formal elements at all."""
+    
     def __init__(self, channel, duration):
         super().__init__(channel, duration)
         self.openai_handler = None
@@ -12,8 +37,22 @@ class OverlyFormalRule(BaseRule):
     def _init_openai_handler(self):
         """Initialize OpenAI handler if needed"""
         if not self.openai_handler and OPENAI_API_KEY:
-            from cogs.openai_handler import OpenAIHandler
-            self.openai_handler = OpenAIHandler(OPENAI_API_KEY)
+            from cogs.openai_handler import get_handler
+            self.openai_handler = get_handler(OPENAI_API_KEY)
+            self.openai_handler.register_rule("overly_formal", self.rule_text, self.local_check)
+    
+    def local_check(self, content):
+        """Lenient keyword check, used without a model"""
+        if not self.fallback_pattern.search(content.lower()):
+            return "I beg your pardon, but one must be rather more polite, if you please."
+        return None
+    
+    def cleanup(self, channel_ids=()):
+        """Drop any messages still buffered for the rule's channels, and release the rule from the handler"""
+        if self.openai_handler:
+            for channel_id in channel_ids or [self.channel_id]:
+                self.openai_handler.clear_channel(channel_id)
+            self.openai_handler.unregister_rule(self.rule_text)
     
     @property
     def name(self):
@@ -23,27 +62,19 @@ class OverlyFormalRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, all messages must be excessively formal and polite, as if addressing royalty."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         """Check if message is excessively formal and polite"""
         self._init_openai_handler()
         
         if not self.openai_handler:
             return None  # Skip checking if OpenAI is not available
         
-        rule_text = """Messages must be somewhat formal and polite, as if speaking to someone of high status.
-Be quite lenient - accept any message that has even a small touch of formality or politeness.
-Accept messages with Victorian/British-style speech patterns, old-fashioned language, or any polite expressions.
-Acceptable examples include:
-- "oh golly oh gosh what a splendid day it is today kind sir"
-- "I dare say this is rather fascinating"
-- "How delightful to see you"
-- "Good day to you"
-- "Might I suggest..."
-- Any message with words like "sir", "madam", "please", "thank you", "kind", "splendid", etc.
-Only reject messages that are clearly rude, use slang, or have absolutely no formal elements at all."""
+        if self.openai_handler.budget_exhausted():
+            # Daily API budget is spent, fall back to a lenient keyword check
+            return self.local_check(ctx.content)
         
-        # Check result directly
-        complies, reason = await self.openai_handler.check_rule_compliance(rule_text, message.content)
+        # Batched with other channels enforcing the same rule
+        complies, reason = await self.openai_handler.submit(self.rule_text, ctx.channel_id, ctx.content, ctx.guild_id)
         if not complies:
             return reason
         
@@ -11,7 +11,7 @@ class PirateRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, everyone must speak like a pirate. [Pirate Glossary](<https://www.pirateglossary.com/>)"
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         # Pirate terms to check for - normalized to lowercase without punctuation
         pirate_terms = [
             "ahoy",
@@ -229,10 +229,7 @@ class PirateRule(BaseRule):
             "yellow jack"
         ]
         
-        # Convert message to lowercase for case-insensitive matching
-        message_lower = message.content.lower()
-        
-        # Check if message contains any pirate terms
-        if not any(term in message_lower for term in pirate_terms):
+        # Check if message contains any pirate terms (case-insensitive)
+        if not any(term in ctx.lower for term in pirate_terms):
             return "Arr! That don't sound like pirate speak to me! Add some 'arr' or 'ahoy' to yer message, ye scallywag!"
         return None
\ No newline at end of file
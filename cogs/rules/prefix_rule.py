@@ -11,8 +11,8 @@ class PrefixRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, all messages must start with 'In my humble opinion'."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         # Check if message starts with the required prefix
-        if not message.content.lower().startswith("in my humble opinion"):
+        if not ctx.lower.startswith("in my humble opinion"):
             return "Your message must start with 'In my humble opinion,'! Be humble!"
         return None
\ No newline at end of file
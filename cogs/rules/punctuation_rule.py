@@ -12,8 +12,8 @@ class PunctuationRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, all messages must have perfect punctuation and grammar."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         # Simple check for proper capitalization and ending punctuation
-        if not re.search(r'[.!?]$', message.content) or message.content != message.content.capitalize():
+        if not re.search(r'[.!?]$', ctx.content) or ctx.content != ctx.content.capitalize():
             return "Your message lacks proper punctuation! Capital letter at the start and period at the end, please."
         return None
\ No newline at end of file
@@ -1,29 +1,27 @@
 from cogs.rules.base_rule import BaseRule
-import re
-import random
-import logging
-from collections import defaultdict
-
-# We'll use pronouncing library for better rhyme detection
-try:
-    import pronouncing
-    PRONOUNCING_AVAILABLE = True
-except ImportError:
-    PRONOUNCING_AVAILABLE = False
-    logging.warning("Pronouncing library not available. Using fallback rhyme detection.")
+from cogs.channel_state import ChannelStateStore
+from cogs.phonetics import get_rhymer
+from config import CHANNEL_STATE_MAX_ENTRIES, CHANNEL_STATE_TTL
 
 class RhymeRule(BaseRule):
     """Rule requiring messages to rhyme with the previous message"""
     
-    # Class-level dictionary to store last words per channel
-    # This ensures each channel has its own separate state
-    channel_last_words = defaultdict(lambda: None)
+    stateful = True
+    
+    # Class-level store of last words per channel
+    # This ensures each channel has its own separate state, and idle channels are evicted
+    channel_last_words = ChannelStateStore("rhyme_last_words", CHANNEL_STATE_MAX_ENTRIES, CHANNEL_STATE_TTL)
     
     def __init__(self, channel, duration):
         super().__init__(channel, duration)
         # Initialize this channel's last word to None
         RhymeRule.channel_last_words[channel.id] = None
     
+    def cleanup(self, channel_ids=()):
+        """Forget the rhyme chains of the rule's channels"""
+        for channel_id in channel_ids or [self.channel_id]:
+            RhymeRule.channel_last_words.pop(channel_id)
+    
     @property
     def name(self):
         return "Rhyme Rule"
@@ -32,43 +30,18 @@ class RhymeRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, all messages must rhyme with the previous message."
     
-    def get_last_word(self, text):
-        """Extract the last word from a text, removing punctuation"""
-        # Remove URLs
-        text = re.sub(r'https?://\S+', '', text)
-        
-        # Split and get the last word
-        words = text.strip().split()
-        if not words:
-            return None
-            
-        # Get last word and remove punctuation
-        last_word = re.sub(r'[^\w\']+$', '', words[-1].lower())
-        
-        # Skip very short words or words with no letters
-        if len(last_word) < 2 or not re.search(r'[a-z]', last_word):
-            return None
-            
-        return last_word
-    
     def words_rhyme(self, word1, word2):
-        """Check if two words rhyme"""
+        """Check if two words rhyme (near rhymes and slang included, see cogs/phonetics.py)"""
         # Words must be different to rhyme
         if word1.lower() == word2.lower():
             return False
         
-        # Use the pronouncing library for phonetic rhyming
-        if PRONOUNCING_AVAILABLE:
-            # Check if word2 is in the rhymes list for word1
-            rhymes = pronouncing.rhymes(word1.lower())
-            if word2.lower() in rhymes:
-                return True
-                
-            # If not found in pronouncing, fall back to character-based check
-            return self._character_based_rhyme(word1, word2)
-        else:
-            # Fall back to character-based method
-            return self._character_based_rhyme(word1, word2)
+        # Matching endings always count ("singing"/"dancing", "bruh"/"duh")
+        if self._character_based_rhyme(word1, word2):
+            return True
+        
+        # Otherwise score the sounds of the stressed endings, guessing pronunciations the dictionary lacks
+        return bool(get_rhymer().rhymes(word1, word2))
     
     def _character_based_rhyme(self, word1, word2):
         """Simple character-based rhyme detection"""
@@ -84,36 +57,22 @@ class RhymeRule(BaseRule):
     
     def get_rhyme_examples(self, word):
         """Get example words that rhyme with the given word"""
-        if not PRONOUNCING_AVAILABLE:
-            return None
-        
-        try:
-            rhymes = pronouncing.rhymes(word.lower())
-            # Filter out the word itself and get only simple words
-            rhymes = [r for r in rhymes if r.lower() != word.lower() and len(r) < 8]
-            
-            if not rhymes:
-                return None
-                
-            # Return a few random examples
-            sample_size = min(3, len(rhymes))
-            return random.sample(rhymes, sample_size)
-        except:
-            return None
+        # A few short words from the rhyme sounds nearest to the word's
+        return get_rhymer().suggestions(word, 3) or None
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         """Check if the message rhymes with the previous message in this channel"""
-        channel_id = message.channel.id
+        channel_id = ctx.channel_id
         
-        # Get the last word of the current message
-        current_word = self.get_last_word(message.content)
+        # Get the last word of the current message (without URLs and punctuation)
+        current_word = ctx.last_word
         
         # Skip checking if we can't extract a meaningful word
         if not current_word:
             return None
         
         # Get the last word for this channel
-        last_word = RhymeRule.channel_last_words[channel_id]
+        last_word = RhymeRule.channel_last_words.get(channel_id)
         
         # If this is the first message with this rule in this channel
         if last_word is None:
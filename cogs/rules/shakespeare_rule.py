@@ -1,10 +1,33 @@
+import re
+
 from cogs.rules.base_rule import BaseRule
 from config import OPENAI_API_KEY
-from cogs.openai_handler import OpenAIHandler
 
 class ShakespeareRule(BaseRule):
     """Rule requiring messages to be written in Shakespearean English"""
     
+    uses_ai = True
+    ignores_formatting = True
+    
+    # Words accepted without a model (budget spent, or by the rule-based backend)
+    fallback_terms = ["thee", "thou", "thy", "thine", "ye", "doth", "hath", "forsooth",
+                      "prithee", "verily", "methinks", "alas", "morrow", "pray"]
+    # Whole words only (so "ye" doesn't match "yes"), plus -eth verbs like "speaketh" (not "teeth")
+    fallback_pattern = re.compile(r"\b(?:" + "|".join(fallback_terms) + r")\b|\b\w{3,}eth\b")
+    
+    # The rule as explained to the model
+    rule_text = """Messages should attempt to include some Shakespearean or Elizabethan English elements.
+Be quite lenient - accept any message that makes even a small effort to sound Shakespearean.
+Acceptable elements include:
+- Using words like 'thee', 'thou', 'thy', 'thine', 'ye', 'doth', 'hath'
+- Adding '-eth' or '-est' endings to verbs (e.g., speaketh, dost)
+- Using archaic phrases like 'forsooth', 'prithee', 'verily', 'methinks', 'alas'
+- Old-fashioned expressions like 'Good morrow', 'What say you', 'I pray thee'
+- Adding 'O' before addressing someone, like 'O friend'
+- Using slightly more poetic or flowery language than normal
+
+Only reject messages that make absolutely no attempt to include any Shakespearean elements."""
+    
     def __init__(self, channel, duration):
         super().__init__(channel, duration)
         self.openai_handler = None
@@ -13,8 +36,22 @@ class ShakespeareRule(BaseRule):
     def _init_openai_handler(self):
         """Initialize OpenAI handler if needed"""
         if not self.openai_handler and OPENAI_API_KEY:
-            from cogs.openai_handler import OpenAIHandler
-            self.openai_handler = OpenAIHandler(OPENAI_API_KEY)
+            from cogs.openai_handler import get_handler
+            self.openai_handler = get_handler(OPENAI_API_KEY)
+            self.openai_handler.register_rule("shakespeare", self.rule_text, self.local_check)
+    
+    def local_check(self, content):
+        """Lenient keyword check, used without a model"""
+        if not self.fallback_pattern.search(content.lower()):
+            return "Thy message lacketh any Shakespearean flourish, good gentle!"
+        return None
+    
+    def cleanup(self, channel_ids=()):
+        """Drop any messages still buffered for the rule's channels, and release the rule from the handler"""
+        if self.openai_handler:
+            for channel_id in channel_ids or [self.channel_id]:
+                self.openai_handler.clear_channel(channel_id)
+            self.openai_handler.unregister_rule(self.rule_text)
     
     @property
     def name(self):
@@ -24,39 +61,19 @@ class ShakespeareRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, all messages must be written in Shakespearean English."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         """Check if message is written in Shakespearean English"""
         self._init_openai_handler()
         
         if not self.openai_handler:
             return None  # Skip checking if OpenAI is not available
         
-        # Process the message through the handler
-        async def handle_result(content, complies, reason):
-            return reason  # Just return the reason, the outer method will handle the reply
-        
-        rule_text = """Messages should attempt to include some Shakespearean or Elizabethan English elements.
-Be quite lenient - accept any message that makes even a small effort to sound Shakespearean.
-Acceptable elements include:
-- Using words like 'thee', 'thou', 'thy', 'thine', 'ye', 'doth', 'hath'
-- Adding '-eth' or '-est' endings to verbs (e.g., speaketh, dost)
-- Using archaic phrases like 'forsooth', 'prithee', 'verily', 'methinks', 'alas'
-- Old-fashioned expressions like 'Good morrow', 'What say you', 'I pray thee'
-- Adding 'O' before addressing someone, like 'O friend'
-- Using slightly more poetic or flowery language than normal
-
-Only reject messages that make absolutely no attempt to include any Shakespearean elements."""
-        
-        # Add to buffer and get result
-        await self.openai_handler.add_to_buffer(
-            message.channel.id,
-            rule_text,
-            message.content,
-            handle_result
-        )
+        if self.openai_handler.budget_exhausted():
+            # Daily API budget is spent, fall back to a lenient keyword check
+            return self.local_check(ctx.content)
         
-        # Check result directly for simple messages
-        complies, reason = await self.openai_handler.check_rule_compliance(rule_text, message.content)
+        # Batched with other channels enforcing the same rule
+        complies, reason = await self.openai_handler.submit(self.rule_text, ctx.channel_id, ctx.content, ctx.guild_id)
         if not complies:
             return reason
         
@@ -11,8 +11,8 @@ class YourExcellenceRule(BaseRule):
     def description(self):
         return f"For the next {self.duration} minutes, everyone must address each other as 'Your Excellence'."
     
-    async def check_message(self, message):
+    async def check_message(self, ctx):
         # Check if message contains "Your Excellence"
-        if "your excellence" not in message.content.lower():
+        if "your excellence" not in ctx.lower:
             return "You must address others as 'Your Excellence'! Show some respect!"
         return None
\ No newline at end of file
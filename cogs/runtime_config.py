@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import os
+import weakref
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from config import (
+    BOT_MESSAGE_DELETE_DELAY,
+    DISPATCH_OVERFLOW_POLICY,
+    DISPATCH_SAMPLE_RATE,
+    FAIR_GUILD_MAX_IN_FLIGHT,
+    FAIR_GUILD_MAX_PENDING,
+    FAIR_MAX_IN_FLIGHT,
+    OPENAI_DAILY_BUDGET,
+    OPENAI_REQUESTS_PER_MINUTE,
+    OPENAI_TOKENS_PER_MINUTE,
+    RUNTIME_CONFIG_FILE,
+    RUNTIME_CONFIG_POLL_INTERVAL,
+    SHADOW_DAILY_BUDGET,
+    SHADOW_SAMPLE_RATE,
+    TRACE_SAMPLE_RATE,
+)
+
+
+class Setting:
+    """A typed, bounded setting that can be changed while the bot runs"""
+
+    __slots__ = ("name", "type", "default", "minimum", "maximum", "choices", "description")
+
+    def __init__(self, name: str, type_: type, default: Any, description: str, minimum: Optional[float] = None,
+                 maximum: Optional[float] = None, choices: Optional[Tuple[str, ...]] = None):
+        self.name = name
+        self.type = type_
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.choices = choices
+        self.description = description
+
+    @property
+    def env_var(self) -> str:
+        return self.name.upper()
+
+    def parse(self, raw: Any) -> Any:
+        """Convert and validate a value from the file, the environment or a command
+
+        Raises:
+            ValueError: If the value has the wrong type or is out of range
+        """
+        if self.type is bool and isinstance(raw, str):
+            if raw.lower() not in ("true", "false", "1", "0", "yes", "no", "on", "off"):
+                raise ValueError(f"{self.name} must be true or false")
+            value = raw.lower() in ("true", "1", "yes", "on")
+        else:
+            try:
+                value = self.type(raw)
+            except (TypeError, ValueError):
+                raise ValueError(f"{self.name} must be a {self.type.__name__}") from None
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"{self.name} must be at least {self.minimum}")
+        if self.maximum is not None and value > self.maximum:
+            raise ValueError(f"{self.name} must be at most {self.maximum}")
+        if self.choices and value not in self.choices:
+            raise ValueError(f"{self.name} must be one of {', '.join(self.choices)}")
+        return value
+
+
+# Everything that can be tuned without a restart
+SETTINGS: Dict[str, Setting] = {setting.name: setting for setting in [
+    # OpenAIHandler
+    Setting("openai_model", str, "gpt-3.5-turbo", "Model used by the OpenAI backend"),
+    Setting("max_buffer_size", int, 5, "Messages buffered per channel before a batch is sent", 1, 50),
+    Setting("buffer_timeout", float, 2.0, "Seconds to wait before a channel's buffer is sent", 0.0, 60.0),
+    Setting("rate_limit_delay", float, 1.0, "Seconds between API calls for the same channel", 0.0, 60.0),
+    Setting("max_tokens", int, 4000, "Max tokens allowed in a single API call", 500, 128000),
+    Setting("token_safety_margin", int, 400, "Tokens reserved for the response", 0, 16000),
+    Setting("max_batch_size", int, 10, "Messages merged into one cross-channel request", 1, 50),
+    Setting("batch_wait", float, 1.0, "Max seconds the oldest message waits for a batch to fill", 0.0, 30.0),
+    Setting("long_message_chunk_tokens", int, 500, "Max tokens per chunk of a long message", 50, 16000),
+    Setting("long_message_max_chunks", int, 8, "Most chunks of one long message that are checked", 1, 100),
+    # API scheduler
+    Setting("openai_requests_per_minute", int, OPENAI_REQUESTS_PER_MINUTE, "Account-wide request limit", 1),
+    Setting("openai_tokens_per_minute", int, OPENAI_TOKENS_PER_MINUTE, "Account-wide token limit", 1),
+    Setting("openai_daily_budget", float, OPENAI_DAILY_BUDGET, "USD per day, 0 disables the cap", 0.0),
+    # Shadow evaluation
+    Setting("shadow_sample_rate", float, SHADOW_SAMPLE_RATE, "Fraction of judged messages sent to shadow backends",
+            0.0, 1.0),
+    Setting("shadow_daily_budget", float, SHADOW_DAILY_BUDGET, "USD per day for metered shadow backends", 0.0),
+    # Fair scheduler
+    Setting("fair_max_in_flight", int, FAIR_MAX_IN_FLIGHT, "API checks in progress at once, across guilds", 1, 1000),
+    Setting("fair_guild_max_in_flight", int, FAIR_GUILD_MAX_IN_FLIGHT, "API checks in progress at once per guild", 1, 1000),
+    Setting("fair_guild_max_pending", int, FAIR_GUILD_MAX_PENDING, "API checks a guild may queue before more are shed",
+            1, 10000),
+    # AIMod cog
+    Setting("bot_message_delete_delay", float, BOT_MESSAGE_DELETE_DELAY,
+            "Seconds before violation notices are deleted", 0.0, 600.0),
+    Setting("dispatch_overflow_policy", str, DISPATCH_OVERFLOW_POLICY, "What happens to messages past a full queue",
+            choices=("fail_open", "local_only", "sampled")),
+    Setting("dispatch_sample_rate", float, DISPATCH_SAMPLE_RATE,
+            "Fraction of overflow messages checked with the sampled policy", 0.0, 1.0),
+    Setting("trace_sample_rate", float, TRACE_SAMPLE_RATE, "Fraction of checked messages traced", 0.0, 1.0),
+]}
+
+# Settings only valid together (see check_combination)
+TOKEN_LIMIT_SETTINGS = ("max_tokens", "token_safety_margin")
+
+
+def check_combination(values: Mapping[str, Any]) -> None:
+    """Validate settings that are only valid together
+
+    Raises:
+        ValueError: If the values can't be used together
+    """
+    max_tokens, margin = values["max_tokens"], values["token_safety_margin"]
+    if margin * 2 > max_tokens:
+        # Otherwise the prompt and messages get (almost) no room and every message is checked in chunks
+        raise ValueError(f"token_safety_margin ({margin}) must be at most half of max_tokens ({max_tokens})")
+
+
+class RuntimeConfig:
+    """Settings layered from defaults, a JSON file and the environment, reloaded on change
+
+    Values come from the setting defaults, then the file, then environment
+    variables named after the setting in upper case (which pin a value so it
+    can't be changed at runtime). Each load builds a complete new snapshot and
+    swaps it in with one assignment, then calls every subscriber with it
+    synchronously, so no component ever sees half of an update. Subscribers
+    are held weakly and get the current snapshot when they subscribe.
+    """
+
+    def __init__(self, path: Optional[str] = RUNTIME_CONFIG_FILE, poll_interval: float = RUNTIME_CONFIG_POLL_INTERVAL):
+        """Initialize the config and load it once
+
+        Args:
+            path: JSON file of {setting: value} overrides (missing is fine)
+            poll_interval: Seconds between checks of the file for changes
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.values: Mapping[str, Any] = MappingProxyType({})
+        self.sources: Dict[str, str] = {}  # {setting: "default" | "file" | "env"}
+        self.subscribers: List[weakref.ref] = []
+        self.mtime = None
+        self.watcher = None
+        self.reload()
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+    def _read_file(self) -> Dict[str, Any]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{self.path} must contain a JSON object")
+        return data
+
+    def reload(self) -> bool:
+        """Load the file and environment and publish the new values if anything changed
+
+        An invalid file is logged and ignored, keeping the current values.
+
+        Returns:
+            True if the values changed
+        """
+        try:
+            file_values = self._read_file()
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring runtime config {self.path}: {e}")
+            return False
+
+        values, sources = {}, {}
+        for name, setting in SETTINGS.items():
+            values[name], sources[name] = setting.default, "default"
+            layers = [("file", file_values.get(name)), ("env", os.environ.get(setting.env_var))]
+            for source, raw in layers:
+                if raw is None:
+                    continue
+                try:
+                    values[name], sources[name] = setting.parse(raw), source
+                except ValueError as e:
+                    logging.error(f"Ignoring {source} value for {name}: {e}")
+        for name in file_values.keys() - SETTINGS.keys():
+            logging.warning(f"Unknown runtime setting in {self.path}: {name}")
+        try:
+            check_combination(values)
+        except ValueError as e:
+            if self.values:
+                logging.error(f"Ignoring runtime config {self.path}: {e}")
+                return False
+            logging.error(f"Using the default token limits: {e}")
+            for name in TOKEN_LIMIT_SETTINGS:
+                values[name], sources[name] = SETTINGS[name].default, "default"
+
+        self.sources = sources
+        if values == dict(self.values):
+            return False
+        self.values = MappingProxyType(values)
+        self._publish()
+        return True
+
+    def set(self, name: str, raw: Any) -> Any:
+        """Change a setting now and persist it to the file
+
+        Raises:
+            KeyError: If there is no such setting
+            ValueError: If the value is invalid, conflicts with another setting or the setting is
+                pinned by the environment
+        """
+        setting = SETTINGS[name]
+        if setting.env_var in os.environ:
+            raise ValueError(f"{name} is pinned by the {setting.env_var} environment variable")
+        value = setting.parse(raw)
+        values = dict(self.values, **{name: value})
+        check_combination(values)
+
+        file_values = {}
+        try:
+            file_values = self._read_file()
+        except (OSError, ValueError) as e:
+            logging.warning(f"Rewriting unreadable runtime config {self.path}: {e}")
+        file_values[name] = value
+        if self.path:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(file_values, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.mtime = os.stat(self.path).st_mtime
+
+        self.sources[name] = "file"
+        self.values = MappingProxyType(values)
+        self._publish()
+        return value
+
+    def subscribe(self, callback: Callable[[Mapping[str, Any]], None]) -> None:
+        """Call `callback` with the current values now and after every change"""
+        ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else weakref.ref(callback)
+        self.subscribers.append(ref)
+        callback(self.values)
+
+    def _publish(self) -> None:
+        alive = []
+        for ref in self.subscribers:
+            callback = ref()
+            if callback is None:
+                continue
+            alive.append(ref)
+            try:
+                callback(self.values)
+            except Exception as e:
+                logging.error(f"Error applying runtime config: {e}")
+        self.subscribers = alive
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime if self.path else None
+        except OSError:
+            return None
+
+    async def _watch(self) -> None:
+        self.mtime = self._file_mtime()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            mtime = self._file_mtime()
+            if mtime != self.mtime:
+                self.mtime = mtime
+                if self.reload():
+                    logging.info(f"Reloaded runtime config from {self.path}")
+
+    def start_watching(self) -> None:
+        """Start polling the file for changes (needs a running event loop)"""
+        if self.watcher is None or self.watcher.done():
+            self.watcher = asyncio.create_task(self._watch())
+
+    def stop_watching(self) -> None:
+        if self.watcher is not None:
+            self.watcher.cancel()
+            self.watcher = None
+
+
+_runtime_config: Optional[RuntimeConfig] = None
+
+
+def get_runtime_config() -> RuntimeConfig:
+    """Return the shared runtime config, loading it on first use"""
+    global _runtime_config
+    if _runtime_config is None:
+        _runtime_config = RuntimeConfig()
+    return _runtime_config
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from cogs.api_scheduler import PRIORITY_SHADOW
+from cogs.event_store import EventStore, get_event_store
+from config import SHADOW_BACKENDS, SHADOW_MAX_PENDING
+
+
+class ShadowEvaluator:
+    """Runs candidate backends on messages another backend already judged
+
+    After `OpenAIHandler.judge` settles a set of messages, a sample of them
+    (`shadow_sample_rate`) is sent in the background to the candidate
+    backends configured for the rule type in SHADOW_BACKENDS. Candidates
+    never change a verdict. For each message, both verdicts, both latencies
+    and both costs are written to the event store, so `/mod_stats` can show
+    how often a cheaper path agrees with the one enforcing. Metered
+    candidates wait behind all real traffic in the API scheduler, and their
+    spend counts against `shadow_daily_budget`, not the main budget.
+    """
+
+    def __init__(self, handler, store: Optional[EventStore] = None,
+                 candidates: Dict[str, List[str]] = SHADOW_BACKENDS, max_pending: int = SHADOW_MAX_PENDING):
+        """Initialize the evaluator
+
+        Args:
+            handler: The OpenAIHandler whose verdicts are shadowed
+            store: Where results are recorded (default: the shared event store, opened on first use)
+            candidates: {rule type: [backend name, ...]}, with "default" for other rule types
+            max_pending: Shadow evaluations running at once before new ones are dropped
+        """
+        self.handler = handler
+        self.store = store
+        self.candidates = candidates
+        self.max_pending = max_pending
+        self.tasks = set()
+        self.day = date.today()
+        self.spent = 0.0  # USD spent on metered candidates today
+        # Metrics
+        self.evaluated = 0
+        self.dropped = 0
+        self.over_budget = 0
+
+        from cogs.runtime_config import get_runtime_config
+        get_runtime_config().subscribe(self.apply_settings)
+
+    def apply_settings(self, settings) -> None:
+        """Swap in the sample rate and budget from the runtime config (see cogs/runtime_config.py)"""
+        self.sample_rate = settings["shadow_sample_rate"]
+        self.daily_budget = settings["shadow_daily_budget"]
+
+    def candidates_for(self, rule_key: Optional[str]) -> List[str]:
+        return self.candidates.get(rule_key, self.candidates.get("default", []))
+
+    def budget_left(self) -> bool:
+        today = date.today()
+        if today != self.day:
+            self.day, self.spent = today, 0.0
+        return self.spent < self.daily_budget
+
+    def observe(self, rule_text: str, contents: List[str], verdicts: List[Optional[Tuple[bool, Optional[str]]]],
+                decisions: List[Optional[Tuple[str, float, float]]]) -> None:
+        """Queue a sample of judged messages for the rule's candidate backends
+
+        Args:
+            rule_text: The rule the messages were checked against
+            contents: The message contents
+            verdicts: The enforced verdict per message
+            decisions: (backend name, latency in ms, cost in USD) per message, or None if no backend decided it
+        """
+        rule_key = self.handler.rule_keys.get(rule_text)
+        names = self.candidates_for(rule_key)
+        if not names or self.sample_rate <= 0:
+            return
+        items = [(content, verdict, decision) for content, verdict, decision in zip(contents, verdicts, decisions)
+                 if decision is not None and random.random() < self.sample_rate]
+        if not items:
+            return
+        if len(self.tasks) >= self.max_pending:
+            self.dropped += len(items)
+            return
+        task = asyncio.create_task(self._evaluate(rule_text, rule_key or "default", names, items))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _evaluate(self, rule_text: str, rule_key: str, names: List[str], items) -> None:
+        if self.store is None:
+            self.store = get_event_store()
+        store = self.store
+        for name in names:
+            backend = self.handler.router.backend(name)
+            if backend is None:
+                continue
+            subset = [item for item in items if item[2][0] != name]  # Don't shadow a backend with itself
+            if not subset:
+                continue
+            if backend.metered and not self.budget_left():
+                self.over_budget += len(subset)
+                continue
+
+            request = self.handler.build_request(rule_text, [content for content, _, _ in subset])
+            started = time.monotonic()
+            try:
+                if backend.metered:
+                    estimated_tokens = (self.handler.token_estimator(request.prefix)
+                                        + self.handler.token_estimator(request.prompt) + request.max_tokens)
+                    if not await self.handler.scheduler.acquire(estimated_tokens, PRIORITY_SHADOW):
+                        continue
+                completion = await backend.complete(request)
+            except Exception as e:
+                logging.warning(f"Shadow backend {name} failed: {e}")
+                answers, cost = [None] * len(subset), 0.0
+            else:
+                answers = self.handler.parse_answer(completion.text, len(subset))
+                cost = completion.total_tokens / 1000 * backend.cost_per_1k_tokens
+                if backend.metered:
+                    self.spent += cost
+            latency_ms = (time.monotonic() - started) * 1000
+
+            for (content, verdict, (primary, primary_latency_ms, primary_cost)), answer in zip(subset, answers):
+                store.record_shadow(
+                    rule_key, primary, None if verdict is None else not verdict[0], primary_latency_ms, primary_cost,
+                    name, None if answer is None else not answer[0], latency_ms, cost / len(subset),
+                )
+            self.evaluated += len(subset)
+
+    def close(self) -> None:
+        """Cancel running evaluations and write what was recorded"""
+        for task in self.tasks:
+            task.cancel()
+        if self.store is not None:
+            self.store.flush()
@@ -0,0 +1,131 @@
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from config import OPENAI_API_KEY, STARTUP_PHASE_BUDGET
+
+
+class StartupProfiler:
+    """Collects how long each startup phase took and flags the slow ones"""
+
+    def __init__(self, budget: float = STARTUP_PHASE_BUDGET):
+        """Initialize the profiler
+
+        Args:
+            budget: Seconds a single phase may take before it is flagged in the report
+        """
+        self.budget = budget
+        self.phases: List[Tuple[str, float]] = []  # [(name, seconds), ...] in the order they ran
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as a named phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    @property
+    def total(self) -> float:
+        return sum(seconds for _, seconds in self.phases)
+
+    def over_budget(self) -> List[Tuple[str, float]]:
+        """Return the phases that took longer than the budget"""
+        return [(name, seconds) for name, seconds in self.phases if seconds > self.budget]
+
+    def report(self) -> str:
+        """Return a human-readable table of phase timings"""
+        lines = ["Startup report:"]
+        for name, seconds in self.phases:
+            flag = "  <-- over budget" if seconds > self.budget else ""
+            lines.append(f"  {name:<40} {seconds * 1000:8.1f} ms{flag}")
+        lines.append(f"  {'total':<40} {self.total * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+def _warm_pronouncing():
+    """Load the CMU pronouncing dictionary (nothing to load if the lexicon pack has it)"""
+    from cogs.lexicon import get_lexicon
+    pack = get_lexicon()
+    if pack is not None and pack.table("cmudict") is not None:
+        return
+    import pronouncing
+    pronouncing.init_cmu()
+
+
+def _warm_rhymes():
+    """Group the CMU dictionary by rhyme sound for rhyme suggestions (or map it from the lexicon pack)"""
+    from cogs.phonetics import get_rhymer
+    get_rhymer().build_index()
+
+
+def _warm_emoji():
+    """Build the emoji lookup table (nothing to load if the lexicon pack has it)"""
+    from cogs.lexicon import get_lexicon
+    pack = get_lexicon()
+    if pack is not None and pack.array("emoji_chars") is not None:
+        return
+    import emoji
+    len(emoji.EMOJI_DATA)
+
+
+def _warm_openai():
+    """Import openai and construct the shared client"""
+    if not OPENAI_API_KEY:
+        return
+    from cogs.openai_handler import get_client
+    get_client(OPENAI_API_KEY)
+
+
+# Heavy datasets that would otherwise be loaded by the first message that needs them
+PREWARM_TASKS: Dict[str, Callable[[], None]] = {
+    "pronouncing CMU dictionary": _warm_pronouncing,
+    "rhyme sound index": _warm_rhymes,
+    "emoji.EMOJI_DATA": _warm_emoji,
+    "openai client": _warm_openai,
+}
+
+
+def _run_warm_task(profiler: StartupProfiler, name: str, task: Callable[[], None]) -> None:
+    try:
+        with profiler.phase(f"first call: {name}"):
+            task()
+    except Exception as e:
+        logging.warning(f"Pre-warm of {name} failed: {e}")
+
+
+async def prewarm(profiler: StartupProfiler) -> None:
+    """Load heavy datasets in worker threads without blocking the event loop
+
+    Args:
+        profiler: Profiler to record each dataset's load time in
+    """
+    await asyncio.gather(*[
+        asyncio.to_thread(_run_warm_task, profiler, name, task)
+        for name, task in PREWARM_TASKS.items()
+    ])
+    logging.info(profiler.report())
+    for name, seconds in profiler.over_budget():
+        logging.warning(f"Startup phase '{name}' took {seconds:.2f}s (budget {profiler.budget:.2f}s)")
+
+
+def measure_cold_start(modules: List[str]) -> StartupProfiler:
+    """Import modules and run every pre-warm task synchronously, timing each step
+
+    Used by tools/check_cold_start.py in a fresh interpreter.
+
+    Args:
+        modules: Module names to import, in order
+    """
+    profiler = StartupProfiler()
+    for module in modules:
+        with profiler.phase(f"import {module}"):
+            importlib.import_module(module)
+    for name, task in PREWARM_TASKS.items():
+        _run_warm_task(profiler, name, task)
+    return profiler
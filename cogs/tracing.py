@@ -0,0 +1,228 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from config import TRACE_FILE, TRACE_SAMPLE_RATE
+
+SERVICE_NAME = "april-fools-ai-mod"
+
+# The span new spans are created under; None when the current message isn't sampled
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional["Span"]:
+    """Return the active span, or None if there is no sampled trace in this context"""
+    return _current_span.get()
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    """Encode an attribute as an OTLP/JSON key-value"""
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+class _Trace:
+    """The finished spans of one trace, written out once no span is open"""
+
+    __slots__ = ("trace_id", "spans", "open")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List["Span"] = []
+        self.open = 0
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ("tracer", "trace", "span_id", "parent", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, tracer: "Tracer", trace: _Trace, name: str, parent: Optional["Span"],
+                 attributes: Dict[str, Any], start_ns: Optional[int] = None):
+        self.tracer = tracer
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.name = name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+        trace.open += 1
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, error: Optional[str] = None) -> None:
+        """Finish the span (later calls are ignored)"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.error = error
+        self.trace.spans.append(self)
+        self.trace.open -= 1
+        if self.trace.open == 0:
+            self.tracer.export(self.trace)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Encode the span as an OTLP/JSON span"""
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+
+class _SpanScope:
+    """Makes a span current for a block, ending it on exit if the scope owns it"""
+
+    __slots__ = ("span", "owned", "token")
+
+    def __init__(self, span: Span, owned: bool):
+        self.span = span
+        self.owned = owned
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self.token)
+        if self.owned:
+            self.span.end(f"{exc_type.__name__}: {exc}" if exc_type else None)
+
+
+class _NoopScope:
+    """Stand-in scope when the current message isn't sampled"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NOOP_SCOPE = _NoopScope()
+
+
+class Tracer:
+    """Head-sampled per-message tracing exported to a local OTLP/JSON file
+
+    Whether a message is traced is decided once, when its root span is
+    started; spans for unsampled messages cost one context variable lookup.
+    The current span is kept in a context variable, so tasks created while a
+    span is active inherit it. Work that is handed between tasks through
+    queues (dispatch, batching) captures `current_span()` and re-activates it
+    with `activate`. A trace is appended to the file, as one OTLP/JSON
+    ExportTraceServiceRequest per line, once all of its spans have ended;
+    spans started after that are written as another line with the same
+    trace id.
+    """
+
+    def __init__(self, path: Optional[str] = TRACE_FILE, sample_rate: float = TRACE_SAMPLE_RATE):
+        """Initialize the tracer
+
+        Args:
+            path: File to append finished traces to
+            sample_rate: Fraction of messages traced (0 disables tracing)
+        """
+        self.path = path
+        self.sample_rate = sample_rate if path else 0.0
+        self.exported = 0
+
+    def apply_settings(self, settings) -> None:
+        """Swap in a new sample rate from the runtime config (see cogs/runtime_config.py)"""
+        self.sample_rate = settings["trace_sample_rate"] if self.path else 0.0
+
+    def start_trace(self, name: str, start_ns: Optional[int] = None, **attributes) -> Optional[Span]:
+        """Start a root span if this message is sampled
+
+        Args:
+            name: The span name
+            start_ns: Start time in Unix nanoseconds (default: now)
+            attributes: Span attributes
+
+        Returns:
+            The root span, or None if the message isn't sampled
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return Span(self, _Trace(), name, None, attributes, start_ns)
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Optional[Span]:
+        """Start a span that is ended explicitly, under `parent` or the current span
+
+        Returns:
+            The span, or None if there is no sampled trace
+        """
+        parent = parent or _current_span.get()
+        if parent is None:
+            return None
+        return Span(self, parent.trace, name, parent, attributes)
+
+    def span(self, name: str, **attributes):
+        """Context manager timing the enclosed block as a child of the current span"""
+        parent = _current_span.get()
+        if parent is None:
+            return _NOOP_SCOPE
+        return _SpanScope(Span(self, parent.trace, name, parent, attributes), owned=True)
+
+    def activate(self, span: Optional[Span]):
+        """Context manager making a span captured elsewhere current, without ending it"""
+        if span is None:
+            return _NOOP_SCOPE
+        return _SpanScope(span, owned=False)
+
+    def export(self, trace: _Trace) -> None:
+        """Append a finished trace to the trace file"""
+        spans, trace.spans = trace.spans, []
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "cogs.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(request, separators=(",", ":")) + "\n")
+            self.exported += 1
+        except OSError as e:
+            logging.warning(f"Could not write trace to {self.path}: {e}")
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Return the shared tracer configured from TRACE_FILE and TRACE_SAMPLE_RATE"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+        from cogs.runtime_config import get_runtime_config
+        get_runtime_config().subscribe(_tracer.apply_settings)
+    return _tracer
@@ -9,6 +9,7 @@ DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 
 # OpenAI API configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')  # Optional, e.g. http://localhost:8080/v1 for the stub server
 
 # Discord Guild ID (for command syncing)
 GUILD_ID = os.getenv('GUILD_ID')  # Add to .env file with your guild ID
@@ -17,6 +18,126 @@ GUILD_ID = os.getenv('GUILD_ID')  # Add to .env file with your guild ID
 BOT_NAME = "April Fools AI Mod"
 COMMAND_PREFIX = "!"
 BOT_MESSAGE_DELETE_DELAY = 5  # Seconds to wait before deleting violation messages
+STARTUP_PHASE_BUDGET = 1.0    # Seconds a single startup phase may take before it is flagged
+
+# Runtime-tunable settings (see cogs/runtime_config.py for the list), reloaded when the file changes
+RUNTIME_CONFIG_FILE = os.getenv('RUNTIME_CONFIG_FILE', 'runtime_config.json')
+RUNTIME_CONFIG_POLL_INTERVAL = 5.0  # Seconds between checks of the file for changes
+
+# Per-message tracing (see cogs/tracing.py and tools/trace_view.py)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0))  # Fraction of checked messages traced, 0 disables
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')           # OTLP/JSON lines, one trace per line
+
+# Message dispatch (see cogs/dispatcher.py)
+DISPATCH_MAX_CONCURRENCY = 50     # Rule checks running at once across all channels
+DISPATCH_MAX_CHANNEL_DEPTH = 20   # Messages queued per channel before load shedding kicks in
+DISPATCH_CHANNEL_CONCURRENCY = 4  # Workers per channel for rules without per-channel state
+DISPATCH_OVERFLOW_POLICY = os.getenv('DISPATCH_OVERFLOW_POLICY', 'local_only')  # fail_open, local_only or sampled
+DISPATCH_SAMPLE_RATE = 0.25       # Fraction of overflow messages checked with the sampled policy
+
+# Account-wide OpenAI budget (shared by every handler through the API scheduler)
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', 3500))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv('OPENAI_TOKENS_PER_MINUTE', 90000))
+OPENAI_DAILY_BUDGET = float(os.getenv('OPENAI_DAILY_BUDGET', 0))  # USD per day, 0 disables the cap
+OPENAI_COST_PER_1K_TOKENS = 0.002  # USD, used to estimate spend against the daily budget
+
+# Fair sharing of API checks between guilds (see cogs/fair_scheduler.py)
+FAIR_MAX_IN_FLIGHT = 40         # Checks waiting on verdicts at once, across guilds
+FAIR_GUILD_MAX_IN_FLIGHT = 20   # ...and from any one guild
+FAIR_GUILD_MAX_PENDING = 200    # Checks one guild may have queued before more are shed
+FAIR_QUANTUM = 500              # Estimated tokens a guild of weight 1 may send per round
+
+
+def _parse_guild_weights(raw):
+    """Parse "guild_id:weight,..." into {guild_id: weight}, rejecting weights that aren't positive"""
+    weights = {}
+    for pair in raw.split(','):
+        if not pair:
+            continue
+        guild_id, weight = pair.split(':')
+        if not float(weight) > 0:
+            raise ValueError(f"FAIR_GUILD_WEIGHTS: weight for guild {guild_id} must be positive, got {weight}")
+        weights[int(guild_id)] = float(weight)
+    return weights
+
+
+# Relative shares, e.g. FAIR_GUILD_WEIGHTS="123456789012345678:2,876543210987654321:0.5" (others get 1)
+FAIR_GUILD_WEIGHTS = _parse_guild_weights(os.getenv('FAIR_GUILD_WEIGHTS', ''))
+
+# Inference backends (see cogs/backends.py)
+LOCAL_LLM_BASE_URL = os.getenv('LOCAL_LLM_BASE_URL')  # Optional OpenAI-compatible server, e.g. llama.cpp or vLLM
+LOCAL_LLM_MODEL = os.getenv('LOCAL_LLM_MODEL', 'local')
+
+# Backends each rule type tries, cheapest first. Messages up to short_message_chars long walk
+# the chain and escalate while the verdict's confidence is below min_confidence; longer
+# messages go straight to the last backend. Rule types without an entry use "default".
+_CHEAP_FIRST = {"chain": ["rules", "local", "openai"], "short_message_chars": 280, "min_confidence": 0.8}
+INFERENCE_ROUTES = {
+    "default": {"chain": ["openai"]},
+    "ai": {"chain": ["local", "openai"], "short_message_chars": 280, "min_confidence": 0.8},
+    "shakespeare": _CHEAP_FIRST,
+    "corporate_jargon": _CHEAP_FIRST,
+    "overly_formal": _CHEAP_FIRST,
+}
+
+# Seconds allowed on shutdown (SIGTERM) to finish pending checks and delete notices before giving up
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', 20))
+
+# Violation leaderboard (see cogs/leaderboard.py): users and rules tracked per guild, and how often it is saved
+LEADERBOARD_CAPACITY = 100
+LEADERBOARD_RULE_CAPACITY = 20
+LEADERBOARD_SAVE_INTERVAL = 60  # Seconds
+
+# Local SQLite store for measurements such as shadow evaluations (see cogs/event_store.py)
+EVENT_STORE_FILE = os.getenv('EVENT_STORE_FILE', 'events.db')
+
+# Shadow evaluation (see cogs/shadow.py): candidate backends that judge a sample of messages on the
+# side without affecting verdicts, per rule type ("default" for the rest), e.g. SHADOW_BACKENDS=rules,local
+SHADOW_BACKENDS = {
+    "default": [name for name in os.getenv('SHADOW_BACKENDS', '').split(',') if name],
+}
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', 0.1))  # Fraction of judged messages shadowed
+SHADOW_DAILY_BUDGET = 1.0  # USD per day for metered candidates, separate from OPENAI_DAILY_BUDGET
+SHADOW_MAX_PENDING = 20    # Shadow evaluations running at once before new ones are dropped
+
+# How chunk verdicts of a long message combine into one, per rule type (see OpenAIHandler.check_long_message):
+# "any" - a violation in any chunk is a violation; "all" - only if every chunk violates (the rule can be
+# met anywhere in the message); "majority" - if more than half of the chunks violate
+LONG_MESSAGE_POLICIES = {
+    "default": "any",
+    "corporate_jargon": "all",
+    "shakespeare": "majority",
+    "overly_formal": "majority",
+}
+
+# Longest rule text put in a prompt; longer custom rules are rejected (see cogs/prompts.py)
+RULE_TEXT_MAX_CHARS = 1000
+
+# Near-duplicate verdict reuse (messages within this many SimHash bits share a verdict). Fingerprints
+# ignore case, emoji and punctuation, so only rule types whose verdicts don't depend on them opt in;
+# custom AI rules ("ai") can be about exactly those and are always judged afresh.
+NEAR_DUPLICATE_RULE_TYPES = {"shakespeare", "corporate_jargon", "overly_formal"}
+NEAR_DUPLICATE_MAX_DISTANCE = 3
+NEAR_DUPLICATE_CACHE_SIZE = 1000  # Fingerprints kept per rule
+NEAR_DUPLICATE_TTL = 600          # Seconds a verdict can be reused
+
+# Per-channel state limits (see cogs/channel_state.py)
+CHANNEL_STATE_MAX_ENTRIES = 10000  # Channels tracked per store before LRU eviction
+CHANNEL_STATE_TTL = 2 * 60 * 60    # Seconds idle per-channel rule state is kept (rules last at most 60 minutes)
+
+# Edited message rechecks (see cogs/edit_tracker.py)
+EDIT_RECHECK_INTERVAL = 5.0   # Minimum seconds between rechecks of one message
+EDIT_SMALL_DISTANCE = 3       # Edits within this many SimHash bits keep the verdict of AI rules that ignore formatting
+EDIT_TRACKED_MESSAGES = 10000  # Checked messages remembered before LRU eviction
+
+# Prebuilt lexicons (CMU dictionary, rhyme index, emoji table) mapped read-only and shared by every
+# process; build with tools/build_lexicon_pack.py. Without the file, lexicons load from their libraries.
+LEXICON_PACK_FILE = os.getenv("LEXICON_PACK_FILE", "lexicon.pack")
+
+# Phonetic rhyme scoring for the rhyme rule (see cogs/phonetics.py)
+RHYME_NEAR_THRESHOLD = float(os.getenv("RHYME_NEAR_THRESHOLD", "0.8"))  # Score (0-1) two words need to count as a rhyme
+RHYME_NEIGHBORS = 40            # Nearest rhyme sounds kept per word for suggestions
+RHYME_NEIGHBOR_CACHE = 4096     # Words whose nearest rhyme sounds are remembered
 
 # Funny rules ideas (examples)
 FUNNY_RULES = [
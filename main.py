@@ -4,11 +4,23 @@ from discord.ext import commands
 import asyncio
 import logging
 import os
+import re
+import signal
 from config import DISCORD_TOKEN, GUILD_ID
+from cogs.startup import StartupProfiler, prewarm
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
+# Extensions are the modules in ./cogs that define a module-level setup(); the rest are shared utilities
+SETUP_PATTERN = re.compile(r'^(async\s+)?def\s+setup\(', re.MULTILINE)
+
+
+def is_extension(path):
+    """Check for an extension entry point without importing the module."""
+    with open(path, encoding='utf-8') as f:
+        return SETUP_PATTERN.search(f.read()) is not None
+
 # Define intents
 intents = discord.Intents.default()
 intents.message_content = True
@@ -18,13 +30,23 @@ class AprilFoolsBot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix="!", intents=intents)
         self.active_rules = {}  # Store active rules for each channel
+        self.profiler = StartupProfiler()
+        self.prewarm_task = None
+        self.shutdown_task = None
 
     async def setup_hook(self):
+        # Shut down gracefully on SIGTERM: closing the bot unloads the cogs, which drain their work
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.request_shutdown)
+        except NotImplementedError:
+            pass  # No signal handlers on Windows event loops
+        
         # Load all cogs
-        for filename in os.listdir('./cogs'):
+        for filename in sorted(os.listdir('./cogs')):
             # Skip files that are not cogs (like the openai_handler utility)
-            if filename.endswith('.py') and filename != 'openai_handler.py':
-                await self.load_extension(f'cogs.{filename[:-3]}')
+            if filename.endswith('.py') and is_extension(os.path.join('./cogs', filename)):
+                with self.profiler.phase(f'load extension: {filename[:-3]}'):
+                    await self.load_extension(f'cogs.{filename[:-3]}')
                 logging.info(f'Loaded extension: {filename[:-3]}')
         
         # Sync commands to a specific guild if GUILD_ID is available
@@ -33,16 +55,26 @@ class AprilFoolsBot(commands.Bot):
                 guild_id = int(GUILD_ID)
                 guild = discord.Object(id=guild_id)
                 self.tree.copy_global_to(guild=guild)
-                await self.tree.sync(guild=guild)
+                with self.profiler.phase('sync slash commands'):
+                    await self.tree.sync(guild=guild)
                 logging.info(f"Slash commands synced to guild ID: {guild_id}")
             except (ValueError, TypeError) as e:
                 logging.error(f"Invalid GUILD_ID: {e}. Please set a valid guild ID in .env file.")
         else:
             logging.warning("No GUILD_ID set. Skipping command sync to avoid rate limits.")
 
+    def request_shutdown(self):
+        if self.shutdown_task is None:
+            logging.info("SIGTERM received, draining before shutdown")
+            self.shutdown_task = asyncio.create_task(self.close())
+
     async def on_ready(self):
         logging.info(f'{self.user} has connected to Discord!')
         await self.change_presence(activity=discord.Game(name="April Fools AI Mod"))
+        
+        # Load heavy datasets in the background (on_ready can fire again after reconnects)
+        if self.prewarm_task is None:
+            self.prewarm_task = asyncio.create_task(prewarm(self.profiler))
 
 # Create bot instance
 bot = AprilFoolsBot()
@@ -0,0 +1,291 @@
+"""Offline bulk audit: replay exported channel history through rules
+
+Streams messages from a JSONL file (one object with a "content" field per
+line) or a DiscordChatExporter JSON export through any registered rule,
+without a Discord connection, and reports per-rule pass rates, projected
+API calls/tokens/cost for AI rules and throughput. Input is read
+incrementally, so memory stays flat no matter how large the file is.
+
+Usage:
+    python tools/audit.py --input april.jsonl --rules pirate,emoji,shakespeare
+    python tools/audit.py --input export.json --rules all --llm api   # real checks via OPENAI_BASE_URL
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import OPENAI_API_KEY, OPENAI_COST_PER_1K_TOKENS, RULE_TYPES  # noqa: E402
+from cogs.rules import MessageContext, RuleFactory  # noqa: E402
+
+CHUNK_SIZE = 1000  # Messages read and evaluated together
+READ_SIZE = 1 << 16  # Bytes read at a time from Discord exports
+
+
+class AuditChannel:
+    """Stand-in for discord.TextChannel"""
+
+    __slots__ = ("id", "name")
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.name = str(channel_id)
+
+    async def send(self, *args, **kwargs):
+        return None
+
+
+class AuditMessage:
+    """Stand-in for discord.Message with the fields rules read"""
+
+    __slots__ = ("id", "content", "channel")
+
+    def __init__(self, message_id, content, channel):
+        self.id = message_id
+        self.content = content
+        self.channel = channel
+
+
+def _iter_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line), None
+
+
+def _iter_discord_export(path):
+    """Yield message objects from a DiscordChatExporter file without loading it all"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = ""
+        channel_id = None
+
+        # Read until the start of the "messages" array, picking up the channel id on the way
+        while True:
+            start = buffer.find('"messages"')
+            if start != -1 and '[' in buffer[start:]:
+                if channel_id is None:
+                    header = buffer[:start]
+                    channel_start = header.find('"channel"')
+                    if channel_start != -1:
+                        id_start = header.find('"id"', channel_start)
+                        if id_start != -1:
+                            value = header[id_start + 4:].lstrip(' :').split('"')
+                            channel_id = value[1] if len(value) > 1 else None
+                buffer = buffer[buffer.index('[', start) + 1:]
+                break
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+
+        while True:
+            buffer = buffer.lstrip(' \t\r\n,')
+            if buffer.startswith(']'):
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    return
+                buffer += chunk
+                continue
+            buffer = buffer[end:]
+            yield obj, channel_id
+
+
+def iter_messages(path):
+    """Yield AuditMessages from a JSONL file or Discord export, one at a time"""
+    reader = _iter_jsonl if path.endswith('.jsonl') else _iter_discord_export
+    channels = {}
+    for index, (obj, export_channel_id) in enumerate(reader(path)):
+        content = obj.get("content")
+        if content is None:
+            continue
+        channel_id = obj.get("channel_id") or obj.get("channelId") or export_channel_id or 0
+        channel = channels.get(channel_id)
+        if channel is None:
+            channel = channels[channel_id] = AuditChannel(channel_id)
+        yield AuditMessage(obj.get("id", index), content, channel)
+
+
+def iter_chunks(messages, size):
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class RuleAudit:
+    """Counters for one rule"""
+
+    def __init__(self, rule_type, rule):
+        self.rule_type = rule_type
+        self.rule = rule
+        self.checked = 0
+        self.passed = 0
+        self.api_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.seconds = 0.0
+
+    @property
+    def uses_ai(self):
+        return getattr(self.rule, "uses_ai", False)
+
+
+def pack_batches(handler, rule_text, contents):
+    """Split contents into the largest batches the handler allows
+
+    Returns a list of (contents, estimated_prompt_tokens) batches.
+    """
+    # Prompt cost without messages, plus roughly each message's line
+    base_tokens = handler.prompt_overhead(rule_text)
+    budget = handler.max_tokens - handler.token_safety_margin
+    batches = []
+    current, current_tokens = [], base_tokens
+    for content in contents:
+        tokens = handler.token_estimator(content) + 4  # 'MESSAGE i: ""' and the newline
+        if current and (len(current) >= handler.max_batch_size or current_tokens + tokens > budget):
+            batches.append((current, current_tokens))
+            current, current_tokens = [], base_tokens
+        current.append(content)
+        current_tokens += tokens
+    if current:
+        batches.append((current, current_tokens))
+    return batches
+
+
+async def audit_local_chunk(audit, chunk):
+    rule = audit.rule
+    passed = 0
+    for ctx in chunk:
+        if await rule.check_message(ctx) is None:
+            passed += 1
+    audit.checked += len(chunk)
+    audit.passed += passed
+
+
+async def audit_ai_chunk(audit, chunk, handler, mode):
+    """Project (and in api mode, run) the batched requests for an AI rule"""
+    rule_text = audit.rule.rule_text
+    for contents, prompt_tokens in pack_batches(handler, rule_text, [m.content for m in chunk]):
+        audit.api_calls += 1
+        audit.prompt_tokens += prompt_tokens
+        audit.completion_tokens += 12 * len(contents)  # "MESSAGE i: YES" or a short reason
+        audit.checked += len(contents)
+
+        if mode == 'api':
+            verdicts = []
+
+            async def callback(content, complies, reason):
+                verdicts.append(complies)
+
+            await handler.process_batch(rule_text, [(content, callback) for content in contents])
+            audit.passed += sum(verdicts)
+
+
+async def run(args):
+    rule_types = RULE_TYPES if args.rules == 'all' else [r.strip() for r in args.rules.split(',') if r.strip()]
+    if not args.rule_text and any(rule_type not in RULE_TYPES for rule_type in rule_types):
+        sys.exit("Custom and AI rules need --rule-text")
+    audits = []
+    channel = AuditChannel(0)
+    for rule_type in rule_types:
+        rule = RuleFactory.create_rule(rule_type, channel, 60, args.rule_text)
+        audits.append(RuleAudit(rule_type, rule))
+
+    handler = None
+    if any(audit.uses_ai for audit in audits):
+        from cogs.openai_handler import OpenAIHandler
+        if args.llm == 'api' and not OPENAI_API_KEY:
+            sys.exit("--llm api needs OPENAI_API_KEY (set OPENAI_BASE_URL to use a local server)")
+        handler = OpenAIHandler(OPENAI_API_KEY or "audit")
+        handler.max_batch_size = args.batch_size or handler.max_batch_size
+
+    started = time.perf_counter()
+    total = 0
+    for chunk in iter_chunks(iter_messages(args.input), CHUNK_SIZE):
+        if args.limit:
+            chunk = chunk[:args.limit - total]
+        # One context per message, so every rule shares its lowercasing, split, emoji scan, ...
+        chunk = [MessageContext(message) for message in chunk]
+        total += len(chunk)
+        for audit in audits:
+            chunk_started = time.perf_counter()
+            if audit.uses_ai:
+                await audit_ai_chunk(audit, chunk, handler, args.llm)
+            else:
+                await audit_local_chunk(audit, chunk)
+            audit.seconds += time.perf_counter() - chunk_started
+        if args.limit and total >= args.limit:
+            break
+    elapsed = time.perf_counter() - started
+
+    report = {"messages": total, "seconds": elapsed, "messages_per_second": total / elapsed if elapsed else 0.0,
+              "rules": []}
+    for audit in audits:
+        tokens = audit.prompt_tokens + audit.completion_tokens
+        entry = {
+            "rule": audit.rule_type,
+            "checked": audit.checked,
+            "messages_per_second": audit.checked / audit.seconds if audit.seconds else 0.0,
+        }
+        if not audit.uses_ai or args.llm == 'api':
+            entry["passed"] = audit.passed
+            entry["pass_rate"] = audit.passed / audit.checked if audit.checked else 0.0
+        if audit.uses_ai:
+            entry.update({
+                "api_calls": audit.api_calls,
+                "prompt_tokens": audit.prompt_tokens,
+                "completion_tokens": audit.completion_tokens,
+                "projected_cost": tokens / 1000 * OPENAI_COST_PER_1K_TOKENS,
+            })
+        report["rules"].append(entry)
+
+    if handler:
+        await handler.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Audited {total} messages in {elapsed:.2f}s ({report['messages_per_second']:.0f} msg/s)")
+    for entry in report["rules"]:
+        line = f"  {entry['rule']:<18} {entry['checked']:>10} checked"
+        if "pass_rate" in entry:
+            line += f"  {entry['pass_rate']:7.1%} pass"
+        else:
+            line += "  (pass rate needs --llm api)"
+        if "api_calls" in entry:
+            line += (f"  {entry['api_calls']} calls, {entry['prompt_tokens'] + entry['completion_tokens']} tokens, "
+                     f"~${entry['projected_cost']:.2f}")
+        line += f"  [{entry['messages_per_second']:.0f} msg/s]"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay exported messages through rules offline")
+    parser.add_argument('--input', required=True, help="JSONL file or DiscordChatExporter JSON export")
+    parser.add_argument('--rules', default='all', help="Comma-separated rule types (see config.RULE_TYPES), or 'all'")
+    parser.add_argument('--rule-text', default=None, help="Rule text for 'custom' and 'ai' rules")
+    parser.add_argument('--llm', choices=['estimate', 'api'], default='estimate',
+                        help="estimate: project calls and tokens only; api: send batches to OPENAI_BASE_URL")
+    parser.add_argument('--batch-size', type=int, default=None, help="Messages per request (default: handler maximum)")
+    parser.add_argument('--limit', type=int, default=None, help="Stop after this many messages")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,301 @@
+"""Golden-corpus microbenchmarks and accuracy baselines for the built-in rules
+
+Each rule has a labeled corpus in tools/golden/<rule>.jsonl: one object per
+line with the message "content", the expected "violation" verdict, an
+optional "note" on why it is labeled that way and an optional "channel"
+(default 0) for corpora that need separate channels. Labels are the verdict the
+rule is meant to give, not the one it gives today, so known quirks (e.g.
+the pirate rule matching "me" inside "meeting") show up as lost accuracy.
+Messages are checked in file order against a fresh rule, which matters for
+stateful rules like rhyme. AI rules are measured through their local
+keyword fallback, the only part that runs without a model.
+
+For every rule the runner reports nanoseconds per message (best of
+--repeat timed passes of --number corpus runs, including building the
+MessageContext), peak bytes allocated during one pass, and accuracy with
+false positive/negative counts. Each timed pass is paired with a fixed
+reference workload, and speed is compared as the median time of a message
+in runs of that workload ("cost"), so a busy or throttled machine doesn't
+read as a regression. Results are
+compared against tools/golden/baselines.json: a rule regresses if its cost
+grew more than --time-tolerance allows, it allocated more than
+--memory-tolerance allows, or it lost more accuracy than
+--accuracy-tolerance. Costs still differ between CPUs and Python versions,
+so record baselines where they are compared.
+
+Usage:
+    python tools/bench_rules.py                       # compare against the baselines, exit 1 on regression
+    python tools/bench_rules.py --rules emoji,rhyme -v
+    python tools/bench_rules.py --update-baseline     # record new baselines
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import RULE_TYPES  # noqa: E402
+from cogs.rules import MessageContext, RuleFactory  # noqa: E402
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+BASELINE_FILE = os.path.join(GOLDEN_DIR, "baselines.json")
+# Peaks of a few kilobytes jitter by about one between runs (interpreter free lists), so growth under this is ignored
+MEMORY_SLACK_BYTES = 2048
+
+
+class BenchChannel:
+    """Stand-in for discord.TextChannel"""
+
+    __slots__ = ("id", "name")
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.name = str(channel_id)
+
+    async def send(self, *args, **kwargs):
+        return None
+
+
+class BenchMessage:
+    """Stand-in for discord.Message with the fields rules read"""
+
+    __slots__ = ("id", "content", "channel")
+
+    def __init__(self, message_id, content, channel):
+        self.id = message_id
+        self.content = content
+        self.channel = channel
+
+
+def load_corpus(rule_type):
+    """Return the (content, violation, note, channel) entries of a rule's corpus, or None if it has none"""
+    path = os.path.join(GOLDEN_DIR, f"{rule_type}.jsonl")
+    if not os.path.exists(path):
+        return None
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                obj = json.loads(line)
+                entries.append((obj["content"], bool(obj["violation"]), obj.get("note"), obj.get("channel", 0)))
+    return entries
+
+
+def reference_pass(number):
+    """Nanoseconds for `number` runs of a fixed pure-Python workload, the yardstick for rule timings"""
+    words = "The quick brown fox jumps over the lazy dog, in my humble opinion".split()
+    started = time.perf_counter_ns()
+    for _ in range(number):
+        for word in words:
+            lowered = word.lower()
+            if lowered.startswith("th") or lowered in ("fox", "dog"):
+                lowered.split("o")
+    return time.perf_counter_ns() - started
+
+
+def run_sync(coro):
+    """Run a coroutine that never suspends (every local rule check) without an event loop"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("Rule check suspended; only local checks can be benchmarked")
+
+
+class RuleBench:
+    """Runs one rule over its corpus"""
+
+    def __init__(self, rule_type, corpus):
+        self.rule_type = rule_type
+        self.channels = {channel_id: BenchChannel(channel_id) for channel_id in sorted({entry[3] for entry in corpus})}
+        self.rule = RuleFactory.create_rule(rule_type, self.channels.get(0) or BenchChannel(0), 60)
+        self.messages = [BenchMessage(index, content, self.channels[channel_id])
+                         for index, (content, _, _, channel_id) in enumerate(corpus)]
+        self.labels = [violation for _, violation, _, _ in corpus]
+        self.notes = [note for _, _, note, _ in corpus]
+        if getattr(self.rule, "uses_ai", False):
+            local_check = self.rule.local_check
+            self.check = lambda ctx: local_check(ctx.content)
+        else:
+            check_message = self.rule.check_message
+            self.check = lambda ctx: run_sync(check_message(ctx))
+
+    def reset(self):
+        """Forget what the rule remembered from the previous pass (rhyme chains and the like)"""
+        self.rule.cleanup(list(self.channels))
+
+    def run_pass(self):
+        """Check every message once, in order, and return the verdicts (True for a violation)"""
+        self.reset()
+        check = self.check
+        return [check(MessageContext(message)) is not None for message in self.messages]
+
+    def time_pass(self, number):
+        """Nanoseconds to run the corpus `number` times"""
+        check = self.check
+        messages = self.messages
+        elapsed = 0
+        for _ in range(number):
+            self.reset()
+            started = time.perf_counter_ns()
+            for message in messages:
+                check(MessageContext(message))
+            elapsed += time.perf_counter_ns() - started
+        return elapsed
+
+    def peak_bytes(self, passes=3):
+        """Peak bytes allocated while running the corpus once (the lowest of a few passes)"""
+        check = self.check
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(passes):
+                self.reset()
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                for message in self.messages:
+                    check(MessageContext(message))
+                _, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - baseline)
+        finally:
+            tracemalloc.stop()
+        return min(peaks)
+
+    def measure(self, repeat, number):
+        """Check accuracy, then time and trace allocations with the garbage collector off (as timeit does)"""
+        verdicts = self.run_pass()
+        false_positives = [i for i, (got, want) in enumerate(zip(verdicts, self.labels)) if got and not want]
+        false_negatives = [i for i, (got, want) in enumerate(zip(verdicts, self.labels)) if want and not got]
+        self.time_pass(1)  # Warm up lazily loaded data (emoji tables, the pronouncing dictionary, ...)
+        total = len(self.messages)
+        timings, costs = [], []
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                # Paired with the reference, so a slowdown that lasts both passes cancels out
+                reference = reference_pass(number * 20) / (number * 20)
+                timings.append(self.time_pass(number))
+                costs.append(timings[-1] / (number * max(total, 1)) / reference)
+            peak_bytes = self.peak_bytes()
+        finally:
+            gc.enable()
+        best = min(timings)
+        cost = statistics.median(costs)
+        return {
+            "rule": self.rule_type,
+            "messages": total,
+            "ns_per_message": round(best / (number * total)) if total else 0,
+            "cost": round(cost, 4),
+            "peak_bytes": peak_bytes,
+            "accuracy": round(1 - (len(false_positives) + len(false_negatives)) / total, 4) if total else 1.0,
+            "false_positives": len(false_positives),
+            "false_negatives": len(false_negatives),
+            "mismatches": [{"content": self.messages[i].content, "expected": self.labels[i], "note": self.notes[i]}
+                           for i in sorted(false_positives + false_negatives)],
+        }
+
+
+def compare(result, baseline, args):
+    """Return the reasons `result` regressed against `baseline` (empty if it didn't)"""
+    problems = []
+    if result["cost"] > baseline["cost"] * (1 + args.time_tolerance):
+        problems.append(f"cost {result['cost']:.3f} vs baseline {baseline['cost']:.3f} "
+                        f"({result['ns_per_message']} ns/msg vs {baseline['ns_per_message']})")
+    if result["peak_bytes"] > baseline["peak_bytes"] * (1 + args.memory_tolerance) + MEMORY_SLACK_BYTES:
+        problems.append(f"{result['peak_bytes']} peak bytes vs baseline {baseline['peak_bytes']}")
+    if result["accuracy"] < baseline["accuracy"] - args.accuracy_tolerance:
+        problems.append(f"accuracy {result['accuracy']:.1%} vs baseline {baseline['accuracy']:.1%}")
+    return problems
+
+
+def load_baselines():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(baselines):
+    with open(BASELINE_FILE, "w", encoding='utf-8') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def run(args):
+    rule_types = RULE_TYPES if args.rules == 'all' else [r.strip() for r in args.rules.split(',') if r.strip()]
+    results = []
+    for rule_type in rule_types:
+        corpus = load_corpus(rule_type)
+        if corpus is None:
+            print(f"No corpus for {rule_type}, skipping", file=sys.stderr)
+            continue
+        results.append(RuleBench(rule_type, corpus).measure(args.repeat, args.number))
+
+    baselines = load_baselines()
+    if args.update_baseline:
+        for result in results:
+            baselines[result["rule"]] = {key: result[key] for key in ("ns_per_message", "cost", "peak_bytes", "accuracy")}
+        save_baselines(baselines)
+
+    regressions = {}
+    for result in results:
+        baseline = baselines.get(result["rule"])
+        result["baseline"] = baseline
+        if baseline and not args.update_baseline:
+            problems = compare(result, baseline, args)
+            if problems:
+                regressions[result["rule"]] = problems
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": regressions}, indent=2, ensure_ascii=False))
+    else:
+        for result in results:
+            line = (f"  {result['rule']:<18} {result['messages']:>4} msgs  {result['ns_per_message']:>8} ns/msg"
+                    f"  {result['peak_bytes']:>8} B peak  {result['accuracy']:7.1%} accurate"
+                    f" ({result['false_positives']} FP, {result['false_negatives']} FN)")
+            baseline = result["baseline"]
+            if baseline and not args.update_baseline:
+                line += f"  [{result['cost'] / baseline['cost']:.2f}x baseline cost]"
+            if result["rule"] in regressions:
+                line += "  REGRESSED: " + "; ".join(regressions[result["rule"]])
+            print(line)
+            if args.verbose:
+                for mismatch in result["mismatches"]:
+                    expected = "violation" if mismatch["expected"] else "pass"
+                    note = f"  ({mismatch['note']})" if mismatch["note"] else ""
+                    print(f"      expected {expected:<9} {mismatch['content']!r}{note}")
+        if args.update_baseline:
+            print(f"Baselines written to {os.path.relpath(BASELINE_FILE)}")
+        elif regressions:
+            print(f"{len(regressions)} rule(s) regressed")
+
+    return 1 if regressions else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark built-in rules on their golden corpora")
+    parser.add_argument('--rules', default='all', help="Comma-separated rule types (see config.RULE_TYPES), or 'all'")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed passes; the fastest one is reported")
+    parser.add_argument('--number', type=int, default=200, help="Corpus runs per timed pass")
+    parser.add_argument('--time-tolerance', type=float, default=0.3,
+                        help="Allowed growth in cost over the baseline, as a fraction (default: 0.3)")
+    parser.add_argument('--memory-tolerance', type=float, default=0.25,
+                        help="Allowed growth in peak bytes over the baseline, as a fraction (default: 0.25)")
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.0,
+                        help="Allowed accuracy drop below the baseline (default: 0, any drop fails)")
+    parser.add_argument('--update-baseline', action='store_true', help="Write the results as the new baselines")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    parser.add_argument('-v', '--verbose', action='store_true', help="List the messages each rule got wrong")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -0,0 +1,81 @@
+"""Build the lexicon pack: static lexicons compiled into one memory-mapped file
+
+Every bot, shard or worker process would otherwise parse the CMU
+pronouncing dictionary, group it into the rhyme index and load the emoji
+table into dicts of its own. The pack holds them as sorted string tables
+with a hash index and as raw arrays, which cogs/lexicon.py maps read-only:
+opening it costs a directory read, lookups decode only what they touch,
+and the operating system shares its pages between processes.
+
+The pack records the library versions and the rhyme encoding it was built
+from. Rebuild it after upgrading `pronouncing` or `emoji`, or after
+changing the phoneme encoding in cogs/phonetics.py (the rhyme index is
+ignored until then). The small rule word lists (pirate glossary, jargon and
+formal terms) stay in the rule modules: they are matched by scanning each
+message for every term, so they have to be Python strings anyway.
+
+Usage:
+    python tools/build_lexicon_pack.py                  # writes LEXICON_PACK_FILE
+    python tools/build_lexicon_pack.py --output /srv/bot/lexicon.pack
+"""
+import argparse
+import importlib.metadata
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LEXICON_PACK_FILE  # noqa: E402
+from cogs.lexicon import FORMAT_VERSION, LexiconPack, write_pack  # noqa: E402
+from cogs.phonetics import group_by_tail, index_signature  # noqa: E402
+
+
+def build(output):
+    import emoji
+    import pronouncing
+
+    started = time.perf_counter()
+    pronouncing.init_cmu()
+    cmudict = {word: "\n".join(pronunciations) for word, pronunciations in pronouncing.lookup.items()}
+
+    vowels, codas, words = group_by_tail(pronouncing.lookup.items())
+    rhyme_words = {str(index): " ".join(group) for index, group in enumerate(words) if group}
+
+    # One bit per code point, set for characters that are emojis on their own
+    code_points = [ord(key) for key in emoji.EMOJI_DATA if len(key) == 1]
+    emoji_chars = np.zeros((max(code_points) >> 3) + 1, dtype=np.uint8)
+    for code in code_points:
+        emoji_chars[code >> 3] |= 1 << (code & 7)
+
+    meta = {
+        "format": str(FORMAT_VERSION),
+        "built": datetime.now().isoformat(timespec="seconds"),
+        "pronouncing": importlib.metadata.version("pronouncing"),
+        "emoji": importlib.metadata.version("emoji"),
+        **index_signature(),
+    }
+    write_pack(output,
+               tables={"meta": meta, "cmudict": cmudict, "rhyme_words": rhyme_words},
+               arrays={"rhyme_vowels": vowels, "rhyme_codas": codas, "emoji_chars": emoji_chars})
+    elapsed = time.perf_counter() - started
+
+    pack = LexiconPack(output)
+    print(f"Wrote {output} ({os.path.getsize(output) / 1e6:.1f} MB) in {elapsed:.1f}s")
+    for name, (kind, buffer) in pack.sections.items():
+        table = pack.table(name)
+        entries = f"{len(table)} entries" if table is not None else f"array {pack.array(name).shape}"
+        print(f"  {name:<14} {len(buffer) / 1e6:8.2f} MB  {entries}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compile static lexicons into a memory-mapped pack")
+    parser.add_argument('--output', default=LEXICON_PACK_FILE, help="Pack file to write (default: LEXICON_PACK_FILE)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    build(parse_args().output)
@@ -0,0 +1,65 @@
+"""Cold-start regression check
+
+Imports the bot's modules and runs every pre-warm task in a fresh
+interpreter, prints the startup report and exits with status 1 if the total
+exceeds the threshold or any phase is over its budget.
+
+Usage:
+    python tools/check_cold_start.py --max-seconds 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Everything main.py imports before the bot connects, plus the rule modules cogs load
+MODULES = [
+    "config",
+    "discord",
+    "cogs.openai_handler",
+    "cogs.rules",
+    "cogs.ai_mod",
+]
+
+
+def child(strict):
+    sys.path.insert(0, ROOT)
+    from cogs.startup import measure_cold_start
+    profiler = measure_cold_start(MODULES)
+    print(profiler.report())
+    over = profiler.over_budget()
+    for name, seconds in over:
+        print(f"Phase '{name}' took {seconds:.2f}s (budget {profiler.budget:.2f}s)")
+    return 1 if strict and over else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if cold start is slower than a threshold")
+    parser.add_argument('--max-seconds', type=float, default=5.0, help="Maximum total cold-start time")
+    parser.add_argument('--strict', action='store_true', help="Also fail if any single phase is over budget")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.exit(child(args.strict))
+
+    # Run in a fresh interpreter so nothing is already imported or cached
+    command = [sys.executable, os.path.abspath(__file__), '--child'] + (['--strict'] if args.strict else [])
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT)
+    elapsed = time.perf_counter() - started
+
+    print(f"Cold start: {elapsed:.2f}s (threshold {args.max_seconds:.2f}s)")
+    if result.returncode != 0:
+        sys.exit(result.returncode)
+    if elapsed > args.max_seconds:
+        print("FAIL: cold start is over the threshold")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Load driver for OpenAIHandler against the local stub server
+
+Pushes concurrent channel traffic through OpenAIHandler and reports
+throughput, tail latency and how many violations were let through because
+a request failed (fail-open). Start tools/stub_openai_server.py first and
+pass the same --violation-rate to both.
+
+Usage:
+    python tools/load_driver.py --base-url http://127.0.0.1:8080/v1 --channels 50 --messages 20 --rate 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.api_scheduler import APIScheduler  # noqa: E402
+from cogs.openai_handler import OpenAIHandler  # noqa: E402
+from tools.stub_openai_server import expected_verdict  # noqa: E402
+
+RULE_TEXT = "Messages must be written in Shakespearean English."
+WORDS = ["thee", "thou", "hello", "pizza", "forsooth", "meeting", "verily", "cat", "tomorrow", "alas",
+         "deploy", "prithee", "weekend", "good", "morrow", "server", "what", "say", "you", "lunch"]
+
+
+def percentile(values, fraction):
+    """Return the value at `fraction` (0-1) of the sorted values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoadStats:
+    """Verdict latencies and outcomes collected during a run"""
+
+    def __init__(self, violation_rate):
+        self.violation_rate = violation_rate
+        self.latencies = []
+        self.verdicts = 0
+        self.expected_violations = 0
+        self.caught_violations = 0
+        self.fail_open = 0
+        self.false_violations = 0
+
+    def record(self, content, started, complies):
+        self.latencies.append(time.monotonic() - started)
+        self.verdicts += 1
+        should_comply = expected_verdict(content, self.violation_rate)
+        if not should_comply:
+            self.expected_violations += 1
+            if complies:
+                self.fail_open += 1
+            else:
+                self.caught_violations += 1
+        elif not complies:
+            self.false_violations += 1
+
+
+async def drive_channel(handler, channel_id, args, stats, rng):
+    """Send one channel's messages at the configured rate"""
+    pending = []
+    for i in range(args.messages):
+        content = f"{' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))} #{channel_id}-{i}"
+        started = time.monotonic()
+
+        if args.mode == 'buffer':
+            done = asyncio.get_running_loop().create_future()
+
+            async def callback(content, complies, reason, started=started, done=done):
+                stats.record(content, started, complies)
+                if not done.done():
+                    done.set_result(None)
+
+            await handler.add_to_buffer(channel_id, RULE_TEXT, content, callback)
+            pending.append(done)
+        elif args.mode == 'batch':
+            async def check(content=content, started=started):
+                complies, _ = await handler.submit(RULE_TEXT, channel_id, content, channel_id % args.guilds)
+                stats.record(content, started, complies)
+
+            pending.append(asyncio.create_task(check()))
+        else:
+            async def check(content=content, started=started):
+                complies, _ = await handler.check_rule_compliance(RULE_TEXT, content)
+                stats.record(content, started, complies)
+
+            pending.append(asyncio.create_task(check()))
+
+        await asyncio.sleep(rng.expovariate(args.rate) if args.rate > 0 else 0)
+
+    await asyncio.gather(*pending)
+
+
+async def run(args):
+    scheduler = APIScheduler(args.rpm, args.tpm)
+    handler = OpenAIHandler(args.api_key, args.model, scheduler=scheduler, base_url=args.base_url)
+    stats = LoadStats(args.violation_rate)
+    rng = random.Random(args.seed)
+
+    started = time.monotonic()
+    await asyncio.gather(*[
+        drive_channel(handler, channel_id, args, stats, random.Random(rng.random()))
+        for channel_id in range(1, args.channels + 1)
+    ])
+    elapsed = time.monotonic() - started
+    await handler.close()
+
+    usage = scheduler.usage()
+    print(f"Channels:          {args.channels} x {args.messages} messages ({args.mode} mode)")
+    print(f"Verdicts:          {stats.verdicts} in {elapsed:.2f}s ({stats.verdicts / elapsed:.1f}/s)")
+    print(f"API requests:      {usage['requests_today']} ({usage['tokens_today']} tokens)")
+    print(f"Latency p50/p95/p99/max: "
+          f"{percentile(stats.latencies, 0.50) * 1000:.0f} / {percentile(stats.latencies, 0.95) * 1000:.0f} / "
+          f"{percentile(stats.latencies, 0.99) * 1000:.0f} / {max(stats.latencies, default=0) * 1000:.0f} ms")
+    if stats.expected_violations:
+        print(f"Fail-open rate:    {stats.fail_open / stats.expected_violations:.1%} "
+              f"({stats.fail_open} of {stats.expected_violations} violations let through)")
+    print(f"False violations:  {stats.false_violations}")
+    if args.mode == 'batch':
+        fair = handler.fair_scheduler.stats(top=args.guilds)
+        for guild_id, guild in sorted(fair['guilds'].items()):
+            print(f"Guild {guild_id}:           {guild['share']:.1%} of tokens, wait avg/max "
+                  f"{guild['wait_avg_ms']:.0f} / {guild['wait_max_ms']:.0f} ms, {guild['shed']} shed")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Drive concurrent channel traffic through OpenAIHandler")
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080/v1')
+    parser.add_argument('--api-key', default='stub')
+    parser.add_argument('--model', default='gpt-3.5-turbo')
+    parser.add_argument('--channels', type=int, default=20, help="Concurrent channels")
+    parser.add_argument('--messages', type=int, default=20, help="Messages per channel")
+    parser.add_argument('--rate', type=float, default=1.0, help="Messages per second per channel (0 for as fast as possible)")
+    parser.add_argument('--mode', choices=['direct', 'buffer', 'batch'], default='direct',
+                        help="check_rule_compliance per message, per-channel add_to_buffer, or cross-channel submit")
+    parser.add_argument('--rpm', type=int, default=3500, help="Scheduler requests-per-minute limit")
+    parser.add_argument('--tpm', type=int, default=90000, help="Scheduler tokens-per-minute limit")
+    parser.add_argument('--violation-rate', type=float, default=0.3, help="Must match the stub server")
+    parser.add_argument('--guilds', type=int, default=1, help="Guilds the channels are spread over (batch mode)")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,354 @@
+"""Virtual-time simulation of rule lifecycles at scale
+
+Runs many channels through rule activation, message traffic, expiry and
+bot restarts on a VirtualClock (see cogs/clock.py), so hours of traffic
+take seconds or minutes. The real AIMod cog, dispatcher, OpenAIHandler,
+rules and timers run unchanged. Only Discord and the model are simulated.
+The model is an in-process backend that answers after a virtual latency.
+Reports expiry lag, verdict latency, batching, scheduler overhead and
+memory.
+
+Usage:
+    python tools/simulate.py --channels 20000 --minutes 120 --rate 0.5
+    python tools/simulate.py --channels 5000 --minutes 60 --restart-every 20 --rules ai,shakespeare --memory
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Simulated state stays in memory, and AI rules get a handler without a real key
+os.environ.setdefault("EVENT_STORE_FILE", ":memory:")
+os.environ.setdefault("OPENAI_API_KEY", "simulate")
+
+from cogs.clock import VirtualClock, set_clock  # noqa: E402
+
+clock = VirtualClock(datetime(2025, 4, 1))
+set_clock(clock)  # Before anything below reads the time
+
+from config import OPENAI_API_KEY, RULE_TYPES  # noqa: E402
+from cogs import openai_handler  # noqa: E402
+from cogs.ai_mod import AIMod  # noqa: E402
+from cogs.backends import BackendRouter, Completion, InferenceBackend, RuleBasedBackend  # noqa: E402
+from cogs.channel_state import all_stats  # noqa: E402
+from cogs.rule_index import SCOPE_CHANNEL  # noqa: E402
+from cogs.rules import RuleFactory  # noqa: E402
+
+VIOLATION_MARKER = "nope"
+WORDS = ["thee", "thou", "hello", "pizza", "forsooth", "meeting", "verily", "cat", "tomorrow", "alas", "arr",
+         "matey", "deploy", "prithee", "weekend", "good", "morrow", "server", "what", "say", "lunch", "🎉"]
+
+
+def percentile(values, fraction):
+    """Return the value at `fraction` (0-1) of the sorted values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SimulatedBackend(InferenceBackend):
+    """Stands in for the OpenAI API: answers after a virtual latency, flagging messages with the violation marker"""
+
+    name = "openai"
+
+    def __init__(self, latency: float, rng: random.Random):
+        self.latency = latency
+        self.rng = rng
+        self.requests = 0
+        self.messages = 0
+
+    async def complete(self, request, want_confidence=False):
+        self.requests += 1
+        self.messages += len(request.contents)
+        await clock.sleep(self.rng.uniform(0.5, 1.5) * self.latency)
+        answers = ["NO: simulated violation" if VIOLATION_MARKER in content else "YES" for content in request.contents]
+        text = answers[0] if len(answers) == 1 else "\n".join(f"MESSAGE {i + 1}: {a}" for i, a in enumerate(answers))
+        tokens = (len(request.prefix) + len(request.prompt)) // 4 + 4 * len(answers)
+        return Completion(text, tokens, [1.0] * len(answers), self.name)
+
+
+class SimStats:
+    def __init__(self):
+        self.activations = 0
+        self.expiries = 0
+        self.expiry_lags = []      # Virtual seconds between a rule's end time and it ending
+        self.restarts = 0
+        self.restored = 0          # Rules brought back after a restart
+        self.drained = {}          # Totals of AIMod.drain reports across restarts
+        self.sent = 0
+        self.checked = 0
+        self.latencies = []        # Virtual seconds from a message arriving to its verdict
+        self.notices_sent = 0
+        self.notices_deleted = 0
+        self.max_tasks = 0
+        self.max_sleepers = 0
+
+
+class SimUser:
+    __slots__ = ("id", "bot", "mention")
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+        self.mention = f"<@{user_id}>"
+
+
+class SimGuild:
+    __slots__ = ("id",)
+
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class SimMessage:
+    """Stand-in for discord.Message, and for the bot's own notices"""
+
+    __slots__ = ("id", "content", "channel", "guild", "author", "created_at", "sent_at", "stats", "notice")
+
+    def __init__(self, message_id, content, channel, author, stats, notice=False):
+        self.id = message_id
+        self.content = content
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.created_at = clock.now()
+        self.sent_at = clock.monotonic()
+        self.stats = stats
+        self.notice = notice
+
+    async def delete(self):
+        if self.notice:
+            self.stats.notices_deleted += 1
+
+
+class SimChannel:
+    """Stand-in for discord.TextChannel"""
+
+    __slots__ = ("id", "name", "guild", "category_id", "stats")
+
+    def __init__(self, channel_id, guild, stats):
+        self.id = channel_id
+        self.name = str(channel_id)
+        self.guild = guild
+        self.category_id = None
+        self.stats = stats
+
+    def get_partial_message(self, message_id):
+        return SimMessage(message_id, "", self, None, self.stats, notice=True)
+
+    async def send(self, content, **kwargs):
+        if "RULE VIOLATION" in content:
+            self.stats.notices_sent += 1
+            return SimMessage(0, content, self, None, self.stats, notice=True)
+        return None
+
+
+class SimResponse:
+    async def send_message(self, *args, **kwargs):
+        return None
+
+
+class SimInteraction:
+    """Stand-in for discord.Interaction, for activating rules"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild_id = channel.guild.id
+        self.response = SimResponse()
+
+
+class SimBot:
+    def __init__(self):
+        self.channels = {}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def wait_until_ready(self):
+        return None
+
+
+class SimulatedAIMod(AIMod):
+    """The real cog, instrumented for verdict latency and expiry lag"""
+
+    stats: SimStats = None
+
+    async def check_and_handle(self, ctx, rule, local_only=False):
+        await super().check_and_handle(ctx, rule, local_only)
+        self.stats.checked += 1
+        self.stats.latencies.append(clock.monotonic() - ctx.message.sent_at)
+
+    async def end_rule(self, active):
+        if active in list(self.active_rules):
+            self.stats.expiries += 1
+            self.stats.expiry_lags.append(max(0.0, (clock.now() - active.rule.end_time).total_seconds()))
+        await super().end_rule(active)
+
+
+class Simulation:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.stats = SimStats()
+        self.bot = SimBot()
+        self.backend = SimulatedBackend(args.latency, random.Random(self.rng.random()))
+        self.handler = None
+        self.cog = None
+        self.message_ids = iter(range(1, 1 << 62))
+
+    async def start_bot(self):
+        """Create the handler and cog the way a fresh process would"""
+        self.handler = openai_handler.OpenAIHandler(
+            OPENAI_API_KEY, router=BackendRouter({"openai": self.backend, "rules": RuleBasedBackend()})
+        )
+        openai_handler._handlers[OPENAI_API_KEY] = self.handler  # Picked up by AI rules through get_handler
+        SimulatedAIMod.stats = self.stats
+        self.cog = SimulatedAIMod(self.bot)
+        await self.cog.cog_load()
+
+    async def stop_bot(self):
+        """Shut the bot down as SIGTERM would, with the clock running while it drains"""
+        drain = asyncio.create_task(self.cog.drain(self.args.drain_timeout))
+        while not drain.done():
+            await clock.advance(0.1)
+        for what, count in drain.result().items():
+            self.stats.drained[what] = self.stats.drained.get(what, 0) + count
+        await self.cog.cog_unload()  # Already drained; nothing left to do
+
+    async def drive_channel(self, channel, rule_types):
+        """Alternate between idle periods and active rules, sending messages throughout"""
+        args = self.args
+        rng = random.Random(self.rng.random())
+        users = [SimUser(channel.id * 100 + i) for i in range(args.users)]
+        interaction = SimInteraction(channel)
+        next_activation = rng.uniform(0, args.idle * 60)
+        while clock.monotonic() < args.minutes * 60:
+            if clock.monotonic() >= next_activation:
+                duration = rng.randint(1, args.max_duration)
+                rule_type = rng.choice(rule_types)
+                rule = RuleFactory.create_rule(rule_type, channel, duration, args.rule_text)
+                await self.cog.activate_rule(interaction, rule, rule.description, duration, SCOPE_CHANNEL, rule_type)
+                self.stats.activations += 1
+                next_activation = clock.monotonic() + duration * 60 + rng.expovariate(1 / (args.idle * 60))
+
+            words = [rng.choice(WORDS) for _ in range(rng.randint(2, 12))]
+            if rng.random() < args.violation_rate:
+                words.append(VIOLATION_MARKER)
+            message = SimMessage(next(self.message_ids), " ".join(words), channel, rng.choice(users), self.stats)
+            self.stats.sent += 1
+            await self.cog.on_message(message)
+            await clock.sleep(rng.expovariate(args.rate / 60))
+
+    async def run(self):
+        args = self.args
+        rule_types = [r.strip() for r in args.rules.split(',') if r.strip()]
+        for rule_type in rule_types:
+            if rule_type not in RULE_TYPES + ["custom", "ai"]:
+                sys.exit(f"Unknown rule type: {rule_type}")
+
+        for channel_id in range(1, args.channels + 1):
+            channel = SimChannel(channel_id, SimGuild(channel_id % args.guilds + 1), self.stats)
+            self.bot.channels[channel_id] = channel
+
+        await self.start_bot()
+        drivers = [asyncio.create_task(self.drive_channel(channel, rule_types)) for channel in self.bot.channels.values()]
+
+        end = args.minutes * 60
+        next_restart = args.restart_every * 60 if args.restart_every else None
+        while clock.monotonic() < end:
+            step = min(args.step, end - clock.monotonic())
+            if next_restart is not None and clock.monotonic() + step >= next_restart:
+                step = next_restart - clock.monotonic()
+            await clock.advance(step)
+            self.stats.max_tasks = max(self.stats.max_tasks, len(asyncio.all_tasks()))
+            if next_restart is not None and clock.monotonic() >= next_restart:
+                await self.stop_bot()
+                self.stats.restarts += 1
+                await self.start_bot()
+                await clock.settle()  # Let the saved rules be restored
+                self.stats.restored += len(self.cog.active_rules)
+                next_restart += args.restart_every * 60
+
+        # Let rules still active run out and pending notices be deleted
+        await clock.advance(args.max_duration * 60 + args.drain)
+        for driver in drivers:
+            driver.cancel()
+        await clock.settle()
+        self.stats.max_sleepers = clock.max_sleepers
+
+
+def report(sim, wall_seconds, memory_peak):
+    stats, args = sim.stats, sim.args
+    virtual_seconds = clock.monotonic()
+    events = stats.sent + stats.activations + clock.wakeups
+    print(f"Simulated:         {args.channels} channels in {args.guilds} guilds for {args.minutes} min "
+          f"(+{args.max_duration + args.drain / 60:.0f} min drain), {stats.restarts} restarts")
+    print(f"Wall time:         {wall_seconds:.1f}s ({virtual_seconds / wall_seconds:.0f}x real time)")
+    print(f"Rules:             {stats.activations} activated, {stats.expiries} expired, "
+          f"{stats.restored} restored after restarts")
+    if stats.drained:
+        print("Restart drains:    " + ", ".join(f"{count} {what}" for what, count in stats.drained.items()))
+    print(f"Expiry lag:        p50 {percentile(stats.expiry_lags, 0.5):.2f}s, p99 {percentile(stats.expiry_lags, 0.99):.2f}s, "
+          f"max {max(stats.expiry_lags, default=0):.2f}s")
+    dispatch = sim.cog.dispatcher.stats()
+    print(f"Messages:          {stats.sent} sent, {stats.checked} checked, {dispatch['dropped']} dropped by the dispatcher")
+    print(f"Verdict latency:   p50 {percentile(stats.latencies, 0.5):.2f}s, p95 {percentile(stats.latencies, 0.95):.2f}s, "
+          f"p99 {percentile(stats.latencies, 0.99):.2f}s, max {max(stats.latencies, default=0):.2f}s")
+    if sim.backend.requests:
+        print(f"Model requests:    {sim.backend.requests} for {sim.backend.messages} messages "
+              f"({sim.backend.messages / sim.backend.requests:.1f} per request)")
+    print(f"Notices:           {stats.notices_sent} sent, {stats.notices_deleted} deleted")
+    print(f"Scheduler:         {clock.wakeups} timer wakeups, max {stats.max_sleepers} pending timers, "
+          f"max {stats.max_tasks} tasks, {wall_seconds / events * 1e6 if events else 0:.0f} us wall per event")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    line = f"Memory:            max RSS {rss:.0f} MiB"
+    if memory_peak is not None:
+        line += f", traced peak {memory_peak / 1024 / 1024:.0f} MiB"
+    print(line)
+    print("Channel state:     " + ", ".join(f"{s['name']} {s['entries']}" for s in all_stats()))
+
+
+async def main(args):
+    if args.memory:
+        tracemalloc.start()
+    sim = Simulation(args)
+    started = time.perf_counter()
+    await sim.run()
+    wall_seconds = time.perf_counter() - started
+    memory_peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+    report(sim, wall_seconds, memory_peak)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate rule lifecycles and traffic in virtual time")
+    parser.add_argument('--channels', type=int, default=10000)
+    parser.add_argument('--guilds', type=int, default=100, help="Guilds the channels are spread over")
+    parser.add_argument('--minutes', type=float, default=60, help="Virtual minutes of traffic")
+    parser.add_argument('--rate', type=float, default=0.5, help="Messages per minute per channel")
+    parser.add_argument('--users', type=int, default=20, help="Users per channel")
+    parser.add_argument('--rules', default='emoji,pirate,shakespeare,ai', help="Rule types to activate")
+    parser.add_argument('--rule-text', default="Messages must be about food.", help="Rule text for 'custom' and 'ai'")
+    parser.add_argument('--idle', type=float, default=10, help="Average minutes between a rule ending and the next")
+    parser.add_argument('--max-duration', type=int, default=30, help="Longest rule in minutes")
+    parser.add_argument('--violation-rate', type=float, default=0.2, help="Fraction of messages the model flags")
+    parser.add_argument('--latency', type=float, default=0.8, help="Average model latency in seconds")
+    parser.add_argument('--restart-every', type=float, default=0, help="Restart the bot every N virtual minutes")
+    parser.add_argument('--drain-timeout', type=float, default=20, help="Virtual seconds each restart may drain for")
+    parser.add_argument('--drain', type=float, default=120, help="Virtual seconds after the last rule ends")
+    parser.add_argument('--step', type=float, default=1.0, help="Virtual seconds advanced between samples")
+    parser.add_argument('--memory', action='store_true', help="Trace Python allocations (slower)")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,226 @@
+"""Local OpenAI-compatible stub server for load testing OpenAIHandler
+
+Speaks the chat-completions protocol and answers the bot's single-message
+("YES" / "NO: reason") and batch ("MESSAGE i: ...") formats. Verdicts are
+deterministic per message content, so a load driver can tell a real verdict
+from a fail-open. Latency and faults are configurable from the command line.
+
+Usage:
+    python tools/stub_openai_server.py --port 8080 --latency lognormal --latency-ms 400 --rate-429 0.05
+    OPENAI_BASE_URL=http://localhost:8080/v1 python main.py
+"""
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SINGLE_PATTERN = re.compile(r'USER MESSAGE: "(.*?)"[ \t]*$', re.DOTALL | re.MULTILINE)
+BATCH_PATTERN = re.compile(r'^\s*MESSAGE (\d+): "(.*)"\s*$', re.MULTILINE)
+DEFAULT_BACKLOG = 128  # Listen backlog; the socketserver default of 5 drops SYNs under load and adds ~1 s retries
+
+
+def expected_verdict(content, violation_rate):
+    """Return the stub's verdict for a message: True if it complies
+
+    The verdict depends only on the message content, so callers can predict it.
+    """
+    digest = hashlib.md5(content.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') / 2 ** 32 >= violation_rate
+
+
+class FaultProfile:
+    """Latency distribution and fault rates for the stub server"""
+
+    def __init__(self, latency='constant', latency_ms=200.0, jitter_ms=100.0, rate_429=0.0,
+                 rate_500=0.0, truncate_rate=0.0, malformed_rate=0.0, violation_rate=0.3, seed=None):
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.truncate_rate = truncate_rate
+        self.malformed_rate = malformed_rate
+        self.violation_rate = violation_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()  # random.Random is shared by the request threads
+
+    def sample_latency(self):
+        """Return a response delay in seconds"""
+        with self.lock:
+            if self.latency == 'uniform':
+                ms = self.random.uniform(max(0.0, self.latency_ms - self.jitter_ms), self.latency_ms + self.jitter_ms)
+            elif self.latency == 'exponential':
+                ms = self.random.expovariate(1 / self.latency_ms) if self.latency_ms else 0.0
+            elif self.latency == 'lognormal':
+                # latency_ms is the median, jitter_ms / latency_ms the spread
+                sigma = self.jitter_ms / self.latency_ms if self.latency_ms else 0.0
+                ms = self.latency_ms * self.random.lognormvariate(0, sigma)
+            else:
+                ms = self.latency_ms
+        return ms / 1000
+
+    def roll(self, rate):
+        """Return True with probability `rate`"""
+        with self.lock:
+            return self.random.random() < rate
+
+
+def build_answer(prompt, profile):
+    """Answer a prompt in the format the bot expects"""
+    batch = BATCH_PATTERN.findall(prompt)
+    if batch:
+        lines = []
+        for index, content in batch:
+            if profile.roll(profile.malformed_rate):
+                lines.append(f"Message {index} - maybe?")
+            elif expected_verdict(content, profile.violation_rate):
+                lines.append(f"MESSAGE {index}: YES")
+            else:
+                lines.append(f"MESSAGE {index}: NO: That message is a stub violation, matey.")
+        answer = "\n".join(lines)
+    else:
+        match = SINGLE_PATTERN.search(prompt)
+        content = match.group(1) if match else prompt
+        if profile.roll(profile.malformed_rate):
+            answer = "Well, it depends on how you look at it."
+        elif expected_verdict(content, profile.violation_rate):
+            answer = "YES"
+        else:
+            answer = "NO: That message is a stub violation, matey."
+
+    if profile.roll(profile.truncate_rate):
+        with profile.lock:
+            cut = profile.random.randint(0, max(0, len(answer) - 1))
+        return answer[:cut], "length"
+    return answer, "stop"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """HTTP handler for /v1/chat/completions"""
+
+    profile = FaultProfile()
+    stats = {"requests": 0, "429": 0, "500": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with self.stats_lock:
+                self._send_json(200, dict(self.stats))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        profile = self.profile
+
+        with self.stats_lock:
+            self.stats["requests"] += 1
+
+        time.sleep(profile.sample_latency())
+
+        if profile.roll(profile.rate_429):
+            with self.stats_lock:
+                self.stats["429"] += 1
+            self._send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests",
+                                            "code": "rate_limit_exceeded"}}, {"Retry-After": "1"})
+            return
+        if profile.roll(profile.rate_500):
+            with self.stats_lock:
+                self.stats["500"] += 1
+            self._send_json(500, {"error": {"message": "Internal server error (stub)", "type": "server_error"}})
+            return
+
+        messages = request.get("messages", [])
+        prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        answer, finish_reason = build_answer(prompt, profile)
+
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(answer) // 4
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": finish_reason,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+def make_server(host, port, profile, backlog=DEFAULT_BACKLOG):
+    """Create a stub server bound to host:port using the given fault profile and listen backlog"""
+    handler = type('ConfiguredStubHandler', (StubHandler,), {
+        'profile': profile,
+        'stats': {"requests": 0, "429": 0, "500": 0},
+    })
+    # request_queue_size is read when the server starts listening, so it has to be set on the class
+    server_class = type('StubHTTPServer', (ThreadingHTTPServer,), {'request_queue_size': backlog})
+    return server_class((host, port), handler)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', choices=['constant', 'uniform', 'exponential', 'lognormal'], default='constant',
+                        help="Latency distribution")
+    parser.add_argument('--latency-ms', type=float, default=200.0, help="Mean (or median for lognormal) latency")
+    parser.add_argument('--jitter-ms', type=float, default=100.0, help="Spread for uniform and lognormal latency")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument('--rate-500', type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help="Fraction of answers cut short")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="Fraction of verdict lines in the wrong format")
+    parser.add_argument('--violation-rate', type=float, default=0.3, help="Fraction of messages judged as violations")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG, help="Listen backlog for pending connections")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    profile = FaultProfile(args.latency, args.latency_ms, args.jitter_ms, args.rate_429, args.rate_500,
+                           args.truncate_rate, args.malformed_rate, args.violation_rate, args.seed)
+    server = make_server(args.host, args.port, profile, args.backlog)
+    logging.info(f"Stub OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Print the slowest traces from the bot's trace file
+
+Reads the OTLP/JSON lines written by cogs/tracing.py (set TRACE_SAMPLE_RATE
+to turn tracing on) and prints the slowest traces as span trees, with each
+span's offset from the start of the trace and its duration.
+
+Usage:
+    python tools/trace_view.py --top 5
+    python tools/trace_view.py traces.jsonl --min-ms 2000 --rule "Shakespeare Mode"
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TRACE_FILE  # noqa: E402
+
+
+def _value(value):
+    """Decode an OTLP/JSON attribute value"""
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def load_traces(path):
+    """Return {trace_id: [span, ...]} with spans as plain dicts"""
+    traces = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for span in scope_spans.get("spans", []):
+                        traces.setdefault(span["traceId"], []).append({
+                            "id": span["spanId"],
+                            "parent": span.get("parentSpanId"),
+                            "name": span["name"],
+                            "start": int(span["startTimeUnixNano"]),
+                            "end": int(span["endTimeUnixNano"]),
+                            "attributes": {a["key"]: _value(a["value"]) for a in span.get("attributes", [])},
+                            "error": span.get("status", {}).get("message"),
+                        })
+    return traces
+
+
+def duration_ms(spans):
+    return (max(span["end"] for span in spans) - min(span["start"] for span in spans)) / 1e6
+
+
+def print_trace(trace_id, spans):
+    start = min(span["start"] for span in spans)
+    children = {}
+    for span in spans:
+        children.setdefault(span["parent"], []).append(span)
+    root = next((span for span in spans if not span["parent"]), spans[0])
+    attributes = ", ".join(f"{key}={value}" for key, value in root["attributes"].items())
+    print(f"{duration_ms(spans):8.1f} ms  trace {trace_id}  {attributes}")
+
+    def walk(span, depth):
+        offset = (span["start"] - start) / 1e6
+        length = (span["end"] - span["start"]) / 1e6
+        error = f"  ERROR: {span['error']}" if span["error"] else ""
+        print(f"    +{offset:8.1f} ms {length:8.1f} ms  {'  ' * depth}{span['name']}{error}")
+        for child in sorted(children.get(span["id"], []), key=lambda s: s["start"]):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the slowest traces as span trees")
+    parser.add_argument('path', nargs='?', default=TRACE_FILE, help="Trace file (default: TRACE_FILE)")
+    parser.add_argument('--top', type=int, default=10, help="How many traces to print")
+    parser.add_argument('--min-ms', type=float, default=0.0, help="Only traces at least this long")
+    parser.add_argument('--rule', default=None, help="Only traces for this rule name")
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.path)
+    selected = []
+    for trace_id, spans in traces.items():
+        if args.rule and not any(span["attributes"].get("rule.name") == args.rule for span in spans):
+            continue
+        if duration_ms(spans) >= args.min_ms:
+            selected.append((trace_id, spans))
+    selected.sort(key=lambda item: duration_ms(item[1]), reverse=True)
+
+    print(f"{len(selected)} of {len(traces)} traces selected\n")
+    for trace_id, spans in selected[:args.top]:
+        print_trace(trace_id, spans)
+
+
+if __name__ == "__main__":
+    main()